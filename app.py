@@ -1,18 +1,16 @@
 import gradio as gr
 import base64
 import time
-import os
 import logging
-from dotenv import load_dotenv
-from src.crew import NourishBotRecipeCrew, NourishBotAnalysisCrew
-from src.tools import ExtractIngredientsTool, FilterIngredientsTool, DietaryFilterTool, NutrientAnalysisTool
-
-# Load environment variables
-load_dotenv()
-
-# Verify Google API key is set
-if not os.getenv("GOOGLE_API_KEY"):
-    raise ValueError("GOOGLE_API_KEY not found in .env file. Please add your Google API key.")
+from src.settings import init
+from src.tools import (
+    ExtractIngredientsTool, StreamingIngredientFilter, NutrientAnalysisTool, nutrient_db_enabled
+)
+from src.model_registry import get_model_registry
+from src.image_handle import ImageHandle
+from src.workflows import run_full_workflow
+from src.tracing import trace_request, span, start_metrics_server
+from src.job_queue import get_job_queue, QueueFullError
 
 
 def format_recipe_output(final_output):
@@ -117,66 +115,167 @@ def format_analysis_output(final_output):
     return output
 
 
-def analyze_food(image, dietary_restrictions, workflow_type, progress=gr.Progress(track_tqdm=True)):
+def format_ingredients_output(ingredients):
+    """
+    Formats the filtered ingredient list into Markdown.
+    
+    :param ingredients: List of detected (and filtered) ingredients.
+    :return: Formatted output as a Markdown string.
+    """
+    output = "## 🍽 Recipe Ingredients\n\n"
+    if ingredients:
+        output += "**Detected Ingredients:**\n\n"
+        for i, item in enumerate(ingredients, 1):
+            output += f"{i}. {item}\n"
+        output += "\n**Note:** For full recipes with instructions and detailed calorie estimates, you can extend this with a recipe generation service.\n"
+    else:
+        output += "No ingredients could be detected. Please try with a clearer image of food items.\n"
+    return output
+
+
+def format_full_output(full_result):
+    """
+    Formats the combined workflow result: ingredients, nutritional analysis
+    and per-branch timings.
+    
+    :param full_result: FullWorkflowResult from run_full_workflow.
+    :return: Formatted output as a Markdown string.
+    """
+    if "extraction" in full_result.errors:
+        output = f"## 🍽 Recipe Ingredients\n\n❌ {full_result.errors['extraction'][:300]}\n"
+    else:
+        output = format_ingredients_output(full_result.ingredients)
+
+    output += "\n---\n\n"
+    if full_result.analysis_data is not None:
+        output += format_analysis_output(full_result.analysis_data.model_dump())
+    elif "analysis" in full_result.errors:
+        output += f"## 🥗 Nutritional Analysis\n\n❌ {full_result.errors['analysis'][:300]}\n"
+    else:
+        output += "## 🥗 Nutritional Analysis\n\n" + full_result.analysis + "\n"
+
+    output += "\n---\n\n**Timings:**\n\n"
+    output += "| **Stage** | **Seconds** |\n"
+    output += "|-----------|-------------|\n"
+    for stage, seconds in full_result.timings.items():
+        output += f"| {stage.replace('_', ' ').capitalize()} | {seconds:.2f} |\n"
+    return output
+
+
+def format_queue_position(position):
+    """
+    :param position: 1-based position among the waiting requests.
+    :return: Markdown shown while the request waits for a worker.
+    """
+    if position == 1:
+        return "⏳ **Queued:** your request is next in line..."
+    return f"⏳ **Queued:** {position - 1} requests ahead of yours..."
+
+
+async def analyze_food(image, dietary_restrictions, workflow_type, request: gr.Request = None,
+                       progress=gr.Progress(track_tqdm=True)):
     """
-    Wrapper function for the Gradio interface with error handling.
+    Gradio handler: validates the inputs and runs the analysis through the
+    shared job queue, showing the queue position until a worker picks it up.
+    Closing the page cancels the request, queued or running.
     
     :param image: Uploaded image (PIL format)
     :param dietary_restrictions: Dietary restriction as a string (e.g., "vegan")
-    :param workflow_type: Workflow type ("recipe" or "analysis")
-    :return: Result from the NourishBot workflow.
+    :param workflow_type: Workflow type ("recipe", "analysis" or "full")
+    :param request: Injected by Gradio; its session is the key for per-user fairness.
+    :return: Async generator of Markdown snapshots; the last one is the final result.
     """
+    if image is None:
+        yield "❌ **Error:** Please upload an image."
+        return
+    
+    if not workflow_type:
+        yield "❌ **Error:** Please select a workflow type (recipe, analysis or full)."
+        return
     
+    # Calls without a Gradio session (scripts, load tests) are each their own user
+    user = getattr(request, "session_hash", None) or f"anonymous-{id(image)}"
     try:
-        # Validate inputs
-        if image is None:
-            return "❌ **Error:** Please upload an image."
-        
-        if not workflow_type:
-            return "❌ **Error:** Please select a workflow type (recipe or analysis)."
-        
-        # Save the uploaded image temporarily
-        image.save("uploaded_image.jpg")
-        image_path = "uploaded_image.jpg"
-
-        inputs = {
-            'uploaded_image': image_path,
-            'dietary_restrictions': dietary_restrictions if dietary_restrictions else "",
-            'workflow_type': workflow_type
-        }
+        job = get_job_queue().submit(user, lambda: run_analysis(image, dietary_restrictions, workflow_type, progress))
+    except QueueFullError as e:
+        yield f"❌ **Busy:** {str(e)}"
+        return
+    
+    async for update in get_job_queue().stream(job):
+        yield update.output if update.output is not None else format_queue_position(update.position)
+
+
+async def run_analysis(image, dietary_restrictions, workflow_type, progress):
+    """
+    Runs one analysis with error handling. Yields the result progressively so
+    text appears as soon as Gemini starts answering.
+    
+    :param image: Uploaded image (PIL format)
+    :param dietary_restrictions: Dietary restriction as a string (e.g., "vegan")
+    :param workflow_type: Workflow type ("recipe", "analysis" or "full")
+    :param progress: Gradio progress tracker
+    :return: Async generator of Markdown snapshots; the last one is the final result.
+    """
+    
+    try:
+        # Keep the upload in memory for this request only; the decoded image
+        # is shared across the tools and never written to a shared path
+        image_handle = ImageHandle.from_input(image)
+        start = time.perf_counter()
+        first_update = None
         
         # Use direct tools instead of CrewAI pipeline to avoid LiteLLM issues
         progress(0.3, desc="Processing your request...")
         
         try:
-            if workflow_type == "recipe":
-                progress(0.6, desc="Extracting ingredients...")
-                raw_ingredients = ExtractIngredientsTool.extract_ingredient_direct(image_path)
-                filtered = FilterIngredientsTool.filter_ingredients_direct(raw_ingredients)
-                
-                if dietary_restrictions:
-                    progress(0.7, desc="Filtering by dietary restrictions...")
-                    filtered = DietaryFilterTool.filter_based_on_restrictions_direct(filtered, dietary_restrictions)
+            with trace_request("request", {"workflow": workflow_type}):
+                if workflow_type == "recipe":
+                    progress(0.6, desc="Extracting ingredients...")
+                    raw_ingredients = ""
+                    # Lines are parsed and checked against the diet rules while the model is still writing
+                    ingredient_filter = StreamingIngredientFilter(dietary_restrictions)
+                    async for chunk in ExtractIngredientsTool.extract_ingredient_stream_async(image_handle):
+                        raw_ingredients += chunk
+                        await ingredient_filter.feed_async(chunk)
+                        first_update = first_update or time.perf_counter() - start
+                        yield "## 🍽 Recipe Ingredients\n\n*Detecting ingredients...*\n\n" + raw_ingredients
                 
-                # Format simple ingredient list
-                result = "## 🍽 Recipe Ingredients\n\n"
-                if filtered:
-                    result += "**Detected Ingredients:**\n\n"
-                    for i, item in enumerate(filtered, 1):
-                        result += f"{i}. {item}\n"
-                    result += "\n**Note:** For full recipes with instructions and detailed calorie estimates, you can extend this with a recipe generation service.\n"
-                else:
-                    result += "No ingredients could be detected. Please try with a clearer image of food items.\n"
+                    if dietary_restrictions:
+                        progress(0.7, desc="Filtering by dietary restrictions...")
+                    filtered = await ingredient_filter.finish_async()
                 
-                progress(1.0, desc="Complete!")
-                return result
+                    with span("format"):
+                        result = format_ingredients_output(filtered)
             
-            elif workflow_type == "analysis":
-                progress(0.6, desc="Analyzing nutritional content...")
-                analysis_text = NutrientAnalysisTool.analyze_image_direct(image_path)
-                result = "## 🥗 Nutritional Analysis\n\n" + analysis_text
+                elif workflow_type == "analysis":
+                    progress(0.6, desc="Analyzing nutritional content...")
+                    if nutrient_db_enabled():
+                        # Structured portions in, locally computed totals out; nothing to stream
+                        analysis = await NutrientAnalysisTool.analyze_nutrients_async(image_handle)
+                        with span("format"):
+                            result = format_analysis_output(analysis.model_dump())
+                    else:
+                        result = "## 🥗 Nutritional Analysis\n\n"
+                        async for chunk in NutrientAnalysisTool.analyze_image_stream_async(image_handle):
+                            result += chunk
+                            first_update = first_update or time.perf_counter() - start
+                            yield result
+
+                elif workflow_type == "full":
+                    progress(0.6, desc="Extracting ingredients and analyzing nutrition in parallel...")
+                    full_result = await run_full_workflow(image_handle, dietary_restrictions)
+                    with span("format"):
+                        result = format_full_output(full_result)
+
+                else:
+                    yield f"❌ **Error:** Unknown workflow type '{workflow_type}'."
+                    return
+
                 progress(1.0, desc="Complete!")
-                return result
+                total = time.perf_counter() - start
+                first_update = first_update or total
+                logging.info(f"✓ {workflow_type} request: first output after {first_update:.2f}s, total {total:.2f}s")
+                yield result
                 
         except Exception as e:
             logging.exception("Direct tools pipeline failed: %s", str(e))
@@ -187,19 +286,19 @@ def analyze_food(image, dietary_restrictions, workflow_type, progress=gr.Progres
             error_msg += "- Check that you have enabled the Generative Language API\n"
             error_msg += "- Verify the image is a valid food image\n"
             error_msg += "- Try uploading a different image\n"
-            return error_msg
+            yield error_msg
     
     except FileNotFoundError as e:
-        return f"❌ **File Error:** {str(e)}"
+        yield f"❌ **File Error:** {str(e)}"
     except KeyError as e:
-        return f"❌ **Configuration Error:** Missing key {str(e)}. Please check your config files."
+        yield f"❌ **Configuration Error:** Missing key {str(e)}. Please check your config files."
     except Exception as e:
         error_msg = f"❌ **Error:** {str(e)}\n\n"
         error_msg += "**Troubleshooting:**\n"
         error_msg += "- Ensure your Google API key is correctly set in the .env file\n"
         error_msg += "- Check that the image is a valid food image\n"
         error_msg += "- Try a different image or workflow type\n"
-        return error_msg
+        yield error_msg
 
     
 # Define custom CSS for styling
@@ -250,11 +349,13 @@ function createGradioAnimation() {
 }
 """
 
+
 # Use a theme and custom CSS with Blocks
 with gr.Blocks(theme=gr.themes.Citrus(), css=css, js=js) as demo:
     gr.Markdown("# How it works", elem_classes="title")
     gr.Markdown("Upload an image of your fridge content, enter your dietary restriction (if you have any!) and select a workflow type 'recipe' then click 'Analyze' to get recipe ideas.", elem_classes="text")
     gr.Markdown("Upload an image of a complete dish, leave dietary restriction blank and select a workflow type 'analysis' then click 'Analyze' to get nutritional insights.", elem_classes="text")
+    gr.Markdown("Select 'full' to get detected ingredients and nutritional insights for the same image in one go.", elem_classes="text")
     gr.Markdown("You can also select one of the examples provided to autofill the input sections and click 'Analyze' right away!", elem_classes="text")
 
     with gr.Row():
@@ -262,7 +363,7 @@ with gr.Blocks(theme=gr.themes.Citrus(), css=css, js=js) as demo:
             gr.Markdown("## Inputs", elem_classes="title")
             image_input = gr.Image(type="pil", label="Upload Image")
             dietary_input = gr.Textbox(label="Dietary Restrictions (optional)", placeholder="e.g., vegan, keto, gluten-free")
-            workflow_radio = gr.Radio(["recipe", "analysis"], label="Workflow Type", value="recipe")
+            workflow_radio = gr.Radio(["recipe", "analysis", "full"], label="Workflow Type", value="recipe")
             submit_btn = gr.Button("Analyze", variant="primary")
         
         with gr.Column(scale=2, min_width=600):
@@ -288,9 +389,22 @@ with gr.Blocks(theme=gr.themes.Citrus(), css=css, js=js) as demo:
     submit_btn.click(
         fn=analyze_food,
         inputs=[image_input, dietary_input, workflow_radio],
-        outputs=result_display
+        outputs=result_display,
+        # Handlers only wait on the job queue, which does the limiting (JOB_WORKERS, JOB_MAX_QUEUE_DEPTH)
+        concurrency_limit=None
     )
 
+demo.queue(default_concurrency_limit=None)
+
 # Launch the Gradio interface
 if __name__ == "__main__":
+    # Load .env, configure logging and verify the Google API key is set
+    settings = init()
+    if not settings.google_api_key:
+        raise ValueError("GOOGLE_API_KEY not found in .env file. Please add your Google API key.")
+
+    # Resolve the Gemini model before the first request arrives
+    get_model_registry().warm_up()
+    # Prometheus-style /metrics endpoint, if METRICS_PORT is set
+    start_metrics_server()
     demo.launch(server_name="127.0.0.1", server_port=7860, share=True)
\ No newline at end of file
@@ -0,0 +1,4 @@
+"""
+Offline benchmarks. Run with ``python -m benchmarks.run``; every Gemini call is
+answered by ``fake_gemini.FakeGeminiModel`` from ``recordings.json``.
+"""
@@ -0,0 +1,306 @@
+import io
+import re
+import json
+import math
+import time
+import random
+import asyncio
+import threading
+from contextvars import ContextVar
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
+from src.phash import phash, hamming_distance
+from src import prompts, tools
+
+RECORDINGS_PATH = __file__.rsplit("/", 1)[0] + "/recordings.json"
+
+# Prompt kinds the fake can answer, matched against the prompts the tools send
+PROMPT_KINDS = (
+    ("extraction", tools.EXTRACTION_PROMPT),
+    ("nutrition", tools.NUTRITION_PROMPT),
+    ("combined", tools.COMBINED_PROMPT),
+    ("portions", tools.PORTION_PROMPT),
+    ("combined_portions", tools.COMBINED_PORTION_PROMPT),
+    ("dietary", prompts.DIETARY_FILTER.prefix),
+)
+
+_RESTRICTION_RE = re.compile(r"Dietary restriction: (.*)")
+_INGREDIENTS_RE = re.compile(r"one per line:\n(.*)", re.S)
+
+
+class LatencyModel:
+    """
+    Samples response latencies from a named distribution.
+
+    Specs are ``fixed:S``, ``uniform:LOW:HIGH``, ``normal:MEAN:STD`` or
+    ``lognormal:MEDIAN:SIGMA`` (all in seconds). ``scale`` multiplies every sample,
+    so recorded production latencies can be replayed faster or slower.
+    """
+
+    def __init__(self, spec: str, scale: float = 1.0, rng: Optional[random.Random] = None):
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.params = [float(arg) for arg in args.split(":") if arg.strip()]
+        expected = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if self.kind not in expected or len(self.params) != expected[self.kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+        self.spec = spec
+        self.scale = scale
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "fixed":
+                value = self.params[0]
+            elif self.kind == "uniform":
+                value = self._rng.uniform(*self.params)
+            elif self.kind == "normal":
+                value = self._rng.gauss(*self.params)
+            else:
+                median, sigma = self.params
+                value = self._rng.lognormvariate(math.log(median), sigma)
+        return max(0.0, value) * self.scale
+
+
+class Recordings:
+    """
+    Recorded Gemini answers per example image, loaded from ``recordings.json``.
+
+    Incoming images are matched to a recording by perceptual hash, so the
+    replayed answer follows the image even after resizing and re-encoding.
+    """
+
+    def __init__(self, data: dict, example_dir: Optional[str] = None):
+        self.data = data
+        self.images: Dict[str, dict] = data["images"]
+        self.dietary: Dict[str, Dict[str, bool]] = data.get("dietary", {})
+        self._hashes: List[Tuple[int, str]] = []
+        if example_dir:
+            for name in self.images:
+                for extension in ("jpg", "jpeg", "png", "webp"):
+                    try:
+                        with Image.open(f"{example_dir}/{name}.{extension}") as img:
+                            self._hashes.append((phash(img), name))
+                        break
+                    except FileNotFoundError:
+                        continue
+
+    @classmethod
+    def load(cls, path: str = RECORDINGS_PATH, example_dir: Optional[str] = None) -> "Recordings":
+        with open(path, "r") as f:
+            return cls(json.load(f), example_dir)
+
+    def match(self, image_bytes: Optional[bytes]) -> str:
+        """Name of the recording closest to the given encoded image."""
+        names = sorted(self.images)
+        if image_bytes is None:
+            return names[0]
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            image_hash = phash(img)
+        if self._hashes:
+            return min(self._hashes, key=lambda entry: hamming_distance(entry[0], image_hash))[1]
+        # Unknown images still get a stable answer
+        return names[image_hash % len(names)]
+
+    def verdicts(self, prompt: str) -> Dict[str, bool]:
+        """Answer a dietary filter prompt from the recorded per-restriction verdicts."""
+        restriction = _RESTRICTION_RE.search(prompt)
+        ingredients = _INGREDIENTS_RE.search(prompt)
+        recorded = self.dietary.get(restriction.group(1).strip().lower(), {}) if restriction else {}
+        names = [line.strip() for line in ingredients.group(1).splitlines() if line.strip()] if ingredients else []
+        return {name: recorded.get(name.lower(), True) for name in names}
+
+
+def classify_prompt(contents) -> Tuple[str, str, Optional[bytes]]:
+    """
+    Split generate_content contents into (prompt kind, prompt text, image bytes).
+
+    :param contents: Prompt string or list of prompt parts as sent by the tools.
+    :return: The kind is one of PROMPT_KINDS' names, or ``other``.
+    """
+    parts = contents if isinstance(contents, list) else [contents]
+    prompt = next((part for part in parts if isinstance(part, str)), "")
+    image = next((part["data"] for part in parts if isinstance(part, dict) and "data" in part), None)
+    for kind, template in PROMPT_KINDS:
+        if prompt.startswith(template):
+            return kind, prompt, image
+    return "other", prompt, image
+
+
+class _Usage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class FakeResponse:
+    """The parts of a ``GenerateContentResponse`` the tools and client read."""
+
+    def __init__(self, text: str, usage: Optional[_Usage] = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+def _chunks(text: str, count: int) -> List[str]:
+    size = max(1, math.ceil(len(text) / count))
+    return [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+
+class FakeGeminiModel:
+    """
+    Offline stand-in for ``genai.GenerativeModel``.
+
+    Replays recorded answers with latencies drawn from per-kind distributions,
+    supports blocking, async and streaming calls, reports usage metadata and
+    counts every call so benchmarks can report API calls per request.
+    """
+
+    def __init__(self, recordings: Recordings, latencies: Dict[str, LatencyModel],
+                 first_chunk_fraction: float = 0.2, stream_chunks: int = 8):
+        self.recordings = recordings
+        self.latencies = latencies
+        self.first_chunk_fraction = first_chunk_fraction
+        self.stream_chunks = stream_chunks
+        self.calls = Counter()
+        self.tokens = Counter()
+        self._lock = threading.Lock()
+
+    def _answer(self, contents) -> Tuple[str, float, _Usage]:
+        kind, prompt, image = classify_prompt(contents)
+        if kind == "dietary":
+            text = json.dumps(self.recordings.verdicts(prompt))
+        elif kind == "other":
+            text = ""
+        else:
+            recording = self.recordings.images[self.recordings.match(image)]
+            if kind == "combined_portions":
+                answer = {"ingredients": recording["combined"]["ingredients"], "portions": recording["portions"]}
+            else:
+                answer = recording[kind]
+            text = answer if isinstance(answer, str) else json.dumps(answer)
+
+        usage = _Usage(len(prompt) // 4 + (258 if image else 0), len(text) // 4)
+        with self._lock:
+            self.calls[kind] += 1
+            self.tokens["input"] += usage.prompt_token_count
+            self.tokens["output"] += usage.candidates_token_count
+        latency = self.latencies[kind].sample() if kind in self.latencies else 0.0
+        return text, latency, usage
+
+    def _stream_plan(self, text: str, latency: float, usage: _Usage):
+        """(delay, chunk) pairs: the first chunk after ``first_chunk_fraction`` of the latency."""
+        chunks = _chunks(text, self.stream_chunks)
+        first = latency * self.first_chunk_fraction
+        rest = (latency - first) / max(1, len(chunks) - 1)
+        plan = []
+        for index, chunk in enumerate(chunks):
+            last = index == len(chunks) - 1
+            plan.append((first if index == 0 else rest, FakeResponse(chunk, usage if last else None)))
+        return plan
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        text, latency, usage = self._answer(contents)
+        if not stream:
+            time.sleep(latency)
+            return FakeResponse(text, usage)
+
+        def chunks():
+            for delay, chunk in self._stream_plan(text, latency, usage):
+                time.sleep(delay)
+                yield chunk
+        return chunks()
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        text, latency, usage = self._answer(contents)
+        if not stream:
+            await asyncio.sleep(latency)
+            return FakeResponse(text, usage)
+
+        plan = self._stream_plan(text, latency, usage)
+
+        class AsyncStream:
+            async def __aiter__(self):
+                for delay, chunk in plan:
+                    await asyncio.sleep(delay)
+                    yield chunk
+        return AsyncStream()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Call and token counters, for diffing before and after a workflow."""
+        with self._lock:
+            return {**{f"calls.{kind}": count for kind, count in self.calls.items()},
+                    **{f"tokens.{direction}": count for direction, count in self.tokens.items()}}
+
+
+# Inputs of the crew run on the current thread; CrewAI runs a crew's tasks on the calling thread
+crew_case: ContextVar[Optional[dict]] = ContextVar("crew_case", default=None)
+
+
+def scripted_crew_llm_class():
+    """
+    Build the scripted CrewAI LLM class. Imported lazily so the tool and app
+    benchmarks don't pay for importing CrewAI.
+    """
+    from crewai.llm import LLM
+
+    class ScriptedCrewLLM(LLM):
+        """
+        Replays the ReAct turns an agent would take: call each of its tools
+        once, in order, then give a final answer. Tool calls go through the
+        real tools (and so through the fake Gemini model); final answers for
+        JSON tasks come from the recordings.
+        """
+
+        def __init__(self, fake: FakeGeminiModel, temperature: float = 0.7):
+            super().__init__(model="fake/scripted-crew-llm", temperature=temperature)
+            self.fake = fake
+            self.case = crew_case.get() or {}
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+        def supports_stop_words(self) -> bool:
+            return True
+
+        def get_context_window_size(self) -> int:
+            return 32768
+
+        def _next_turn(self, conversation: str) -> str:
+            tools_available = re.findall(r"Tool Name: (.+)", conversation)
+            used = set(re.findall(r"Action: (.+)", conversation))
+            observations = re.findall(r"Observation: (.*?)(?=\n(?:Thought|Action):|\Z)", conversation, re.S)
+            recording = self.fake.recordings.images[self.case.get("name") or sorted(self.fake.recordings.images)[0]]
+            image_path = self.case.get("image_path", "")
+            for tool_name in tools_available:
+                tool_name = tool_name.strip()
+                if tool_name in used:
+                    continue
+                if tool_name == "Filter ingredients":
+                    arguments = {"raw_ingredients": observations[-1].strip() if observations else ""}
+                elif tool_name == "Filter based on dietary restrictions":
+                    arguments = {"ingredients": recording["combined"]["ingredients"],
+                                 "dietary_restrictions": self.case.get("dietary_restrictions", "")}
+                else:
+                    arguments = {"image_input": image_path}
+                return f"Thought: I should use {tool_name}.\nAction: {tool_name}\nAction Input: {json.dumps(arguments)}"
+
+            if "Analyze nutritional values" in "".join(tools_available):
+                answer = json.dumps(recording["combined"]["analysis"])
+            elif not tools_available:
+                answer = json.dumps(recording["recipes"])
+            else:
+                answer = observations[-1].strip() if observations else recording["extraction"]
+            return f"Thought: I now know the final answer\nFinal Answer: {answer}"
+
+        def call(self, messages: List[Dict[str, str]], callbacks: List = []) -> str:
+            conversation = "\n".join(message["content"] for message in messages)
+            latency = self.fake.latencies["crew_llm"].sample() if "crew_llm" in self.fake.latencies else 0.0
+            with self.fake._lock:
+                self.fake.calls["crew_llm"] += 1
+            time.sleep(latency)
+            return self._next_turn(conversation)
+
+    return ScriptedCrewLLM
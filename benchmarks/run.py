@@ -0,0 +1,337 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tracemalloc
+from dataclasses import dataclass, field, asdict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+EXAMPLES_DIR = os.path.join(os.path.dirname(BENCHMARK_DIR), "examples")
+
+WORKFLOWS = [
+    "tools.extract", "tools.dietary", "tools.nutrition",
+    "app.recipe", "app.analysis", "app.full",
+    "crew.recipe", "crew.analysis", "crew.full",
+]
+
+
+@dataclass
+class Case:
+    """One benchmark input: an example image and the restrictions to apply."""
+    name: str
+    image_path: str
+    dietary_restrictions: str
+    image: object = None
+
+
+@dataclass
+class WorkflowReport:
+    """Measurements for one workflow over every case and iteration."""
+    workflow: str
+    requests: int = 0
+    errors: int = 0
+    first_error: Optional[str] = None
+    wall_seconds: float = 0.0
+    throughput: float = 0.0
+    latency_p50: Optional[float] = None
+    latency_p95: Optional[float] = None
+    latency_p99: Optional[float] = None
+    first_output_p50: Optional[float] = None
+    calls_per_request: Dict[str, float] = field(default_factory=dict)
+    tokens_per_request: Dict[str, float] = field(default_factory=dict)
+    peak_traced_mb: Optional[float] = None
+    peak_rss_mb: float = 0.0
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def load_cases(example_dir: str, dietary_restrictions: str) -> List[Case]:
+    """Every image in the examples directory, decoded once up front like a Gradio upload."""
+    from PIL import Image
+
+    cases = []
+    for filename in sorted(os.listdir(example_dir)):
+        name, extension = os.path.splitext(filename)
+        if extension.lower() not in (".jpg", ".jpeg", ".png", ".webp"):
+            continue
+        path = os.path.join(example_dir, filename)
+        with Image.open(path) as img:
+            img.load()
+            cases.append(Case(name, path, dietary_restrictions, img.copy()))
+    if not cases:
+        raise ValueError(f"No example images found in {example_dir}")
+    return cases
+
+
+def build_workflows(fake, recordings) -> Dict[str, Callable[[Case], Awaitable[Tuple[object, Optional[float]]]]]:
+    """
+    Async runners per workflow. Each returns ``(result, seconds to first output)``;
+    only streaming workflows report a first-output time.
+    """
+    from src.tools import ExtractIngredientsTool, DietaryFilterTool, NutrientAnalysisTool
+    from src.image_handle import ImageHandle
+    from benchmarks.fake_gemini import crew_case, scripted_crew_llm_class
+    from app import analyze_food
+
+    async def extract(case: Case):
+        return await ExtractIngredientsTool.extract_ingredient_async(ImageHandle(path=case.image_path)), None
+
+    async def dietary(case: Case):
+        ingredients = recordings.images[case.name]["combined"]["ingredients"]
+        return await DietaryFilterTool.filter_based_on_restrictions_async(ingredients, case.dietary_restrictions), None
+
+    async def nutrition(case: Case):
+        return await NutrientAnalysisTool.analyze_image_async(ImageHandle(path=case.image_path)), None
+
+    def app_workflow(workflow_type: str):
+        async def run(case: Case):
+            start = time.perf_counter()
+            first_output = None
+            result = None
+            async for result in analyze_food(case.image, case.dietary_restrictions, workflow_type,
+                                             progress=lambda *args, **kwargs: None):
+                first_output = first_output or time.perf_counter() - start
+            if result is None or result.startswith("❌"):
+                raise Exception((result or "no output")[:200])
+            return result, first_output
+        return run
+
+    def crew_workflow(crew_name: str):
+        def kickoff(case: Case):
+            import src.crew as crew_module
+
+            ScriptedCrewLLM = scripted_crew_llm_class()
+            crew_module.get_gemini_llm = lambda temperature=0.7: ScriptedCrewLLM(fake, temperature)
+            crew_case.set({"name": case.name, "image_path": case.image_path,
+                           "dietary_restrictions": case.dietary_restrictions})
+            crew_cls = getattr(crew_module, crew_name)
+            crew = crew_cls(case.image_path, case.dietary_restrictions)
+            return crew.kickoff(inputs={"uploaded_image": case.image_path,
+                                        "dietary_restrictions": case.dietary_restrictions})
+
+        async def run(case: Case):
+            # Crews are blocking; each run gets its own thread and context
+            return await asyncio.to_thread(kickoff, case), None
+        return run
+
+    return {
+        "tools.extract": extract,
+        "tools.dietary": dietary,
+        "tools.nutrition": nutrition,
+        "app.recipe": app_workflow("recipe"),
+        "app.analysis": app_workflow("analysis"),
+        "app.full": app_workflow("full"),
+        "crew.recipe": crew_workflow("NourishBotRecipeCrew"),
+        "crew.analysis": crew_workflow("NourishBotAnalysisCrew"),
+        "crew.full": crew_workflow("NourishBotFullCrew"),
+    }
+
+
+async def run_workflow(name: str, runner, cases: List[Case], iterations: int, concurrency: int,
+                       warmup: int, fake, trace_memory: bool) -> WorkflowReport:
+    """
+    Run every case ``iterations`` times with at most ``concurrency`` in flight.
+
+    :return: Latency percentiles, throughput, errors, fake API calls and memory for the workflow.
+    """
+    report = WorkflowReport(workflow=name)
+    for case in cases[:warmup]:
+        try:
+            await runner(case)
+        except Exception:
+            pass
+
+    latencies: List[float] = []
+    first_outputs: List[float] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(case: Case):
+        async with slots:
+            start = time.perf_counter()
+            try:
+                _, first_output = await runner(case)
+            except Exception as e:
+                report.errors += 1
+                report.first_error = report.first_error or f"{type(e).__name__}: {str(e)[:200]}"
+                return
+            latencies.append(time.perf_counter() - start)
+            if first_output is not None:
+                first_outputs.append(first_output)
+
+    before = fake.snapshot()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    await asyncio.gather(*(one(case) for _ in range(iterations) for case in cases))
+    report.wall_seconds = time.perf_counter() - start
+    after = fake.snapshot()
+
+    report.requests = iterations * len(cases)
+    completed = report.requests - report.errors
+    report.throughput = completed / report.wall_seconds if report.wall_seconds else 0.0
+    report.latency_p50 = _percentile(latencies, 0.50)
+    report.latency_p95 = _percentile(latencies, 0.95)
+    report.latency_p99 = _percentile(latencies, 0.99)
+    report.first_output_p50 = _percentile(first_outputs, 0.50)
+    for key, value in after.items():
+        delta = value - before.get(key, 0)
+        if delta:
+            kind, _, label = key.partition(".")
+            target = report.calls_per_request if kind == "calls" else report.tokens_per_request
+            target[label] = round(delta / report.requests, 2)
+    if trace_memory:
+        report.peak_traced_mb = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    report.peak_rss_mb = round(_peak_rss_mb(), 1)
+    return report
+
+
+def _ms(seconds: Optional[float]) -> str:
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+
+def print_reports(reports: List[WorkflowReport]):
+    header = f"{'workflow':<16}{'reqs':>6}{'errs':>6}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}" \
+             f"{'first ms':>10}{'calls/req':>11}{'tok/req':>9}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for report in reports:
+        calls = sum(report.calls_per_request.values())
+        tokens = sum(report.tokens_per_request.values())
+        memory = report.peak_traced_mb if report.peak_traced_mb is not None else report.peak_rss_mb
+        print(f"{report.workflow:<16}{report.requests:>6}{report.errors:>6}{report.throughput:>8.1f}"
+              f"{_ms(report.latency_p50):>9}{_ms(report.latency_p95):>9}{_ms(report.latency_p99):>9}"
+              f"{_ms(report.first_output_p50):>10}{calls:>11.2f}{tokens:>9.0f}{memory:>9.1f}")
+    for report in reports:
+        if report.first_error:
+            print(f"⚠️  {report.workflow}: {report.errors} errors, first: {report.first_error}")
+
+
+def compare_to_baseline(reports: List[WorkflowReport], baseline_path: str, tolerance: float) -> List[str]:
+    """
+    Compare against a previous ``--json`` report.
+
+    :return: One message per regression: p95 latency or throughput worse than
+             ``tolerance`` (a fraction), more API calls per request, or new errors.
+    """
+    with open(baseline_path, "r") as f:
+        baseline = {entry["workflow"]: entry for entry in json.load(f)["workflows"]}
+
+    regressions = []
+    for report in reports:
+        base = baseline.get(report.workflow)
+        if base is None:
+            continue
+        if base["latency_p95"] and report.latency_p95 and report.latency_p95 > base["latency_p95"] * (1 + tolerance):
+            regressions.append(f"{report.workflow}: p95 {_ms(report.latency_p95)}ms vs {_ms(base['latency_p95'])}ms")
+        if base["throughput"] and report.throughput < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{report.workflow}: {report.throughput:.1f} req/s vs {base['throughput']:.1f} req/s")
+        calls, base_calls = sum(report.calls_per_request.values()), sum(base["calls_per_request"].values())
+        if calls > base_calls + 1e-9:
+            regressions.append(f"{report.workflow}: {calls:.2f} Gemini calls/request vs {base_calls:.2f}")
+        if report.errors > base["errors"]:
+            regressions.append(f"{report.workflow}: {report.errors} errors vs {base['errors']}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline NourishBot benchmarks against a recorded Gemini stand-in")
+    parser.add_argument("-w", "--workflows", nargs="+", default=WORKFLOWS, choices=WORKFLOWS, metavar="WORKFLOW",
+                        help=f"Workflows to run (default: all of {', '.join(WORKFLOWS)})")
+    parser.add_argument("-n", "--iterations", type=int, default=5, help="Runs of every example image per workflow")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Requests in flight per workflow")
+    parser.add_argument("--warmup", type=int, default=1, help="Unmeasured runs per workflow before timing")
+    parser.add_argument("--diet", default="vegan", help="Dietary restrictions applied in every workflow")
+    parser.add_argument("--examples", default=EXAMPLES_DIR, help="Directory of example images")
+    parser.add_argument("--recordings", default=os.path.join(BENCHMARK_DIR, "recordings.json"),
+                        help="Recorded Gemini responses and latency distributions")
+    parser.add_argument("--latency", action="append", default=[], metavar="KIND=SPEC",
+                        help="Override a latency distribution, e.g. nutrition=lognormal:3.2:0.3 or crew_llm=fixed:0.5")
+    parser.add_argument("--scale", type=float, default=0.05,
+                        help="Multiply recorded latencies (1 replays production timings; default 0.05)")
+    parser.add_argument("--seed", type=int, default=1234, help="Seed for latency sampling")
+    parser.add_argument("--memory", action="store_true", help="Track Python allocations with tracemalloc (slower)")
+    parser.add_argument("--cache", action="store_true", help="Keep the result and verdict caches enabled")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="Fail if results regress against this --json report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95/throughput regression (fraction)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Keep application INFO logs")
+    args = parser.parse_args(argv)
+
+    # Must be set before the shared clients and caches are built on first use
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("OTEL_SDK_DISABLED", "true")
+    os.environ.setdefault("CREWAI_DISABLE_TELEMETRY", "true")
+    if not args.cache:
+        os.environ["ENABLE_CACHE"] = "false"
+        os.environ["ENABLE_VERDICT_CACHE"] = "false"
+
+    from src.settings import init
+    from src.model_registry import get_model_registry
+    from benchmarks.fake_gemini import FakeGeminiModel, LatencyModel, Recordings
+
+    init()
+    recordings = Recordings.load(args.recordings, args.examples)
+    rng = random.Random(args.seed)
+    specs = dict(recordings.data.get("latency", {}))
+    for override in args.latency:
+        kind, _, spec = override.partition("=")
+        specs[kind.strip()] = spec.strip()
+    latencies = {kind: LatencyModel(spec, scale=args.scale, rng=rng) for kind, spec in specs.items()}
+    fake = FakeGeminiModel(recordings, latencies, first_chunk_fraction=recordings.data.get("first_chunk_fraction", 0.2))
+    get_model_registry().pin(fake, recordings.data.get("model", "fake-gemini"))
+
+    cases = load_cases(args.examples, args.diet)
+    runners = build_workflows(fake, recordings)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+    if args.memory:
+        tracemalloc.start()
+
+    print("=" * 70)
+    print(f"📊 BENCHMARK: {len(cases)} images x {args.iterations} iterations, concurrency {args.concurrency}, "
+          f"latency scale {args.scale}")
+    print("=" * 70)
+
+    reports = []
+    for name in args.workflows:
+        report = asyncio.run(run_workflow(name, runners[name], cases, args.iterations, args.concurrency,
+                                          args.warmup, fake, args.memory))
+        reports.append(report)
+    print_reports(reports)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"config": {key: value for key, value in vars(args).items() if key != "json_path"},
+                       "latency": specs,
+                       "workflows": [asdict(report) for report in reports]}, f, indent=2)
+        print(f"\n✓ Report written to {args.json_path}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(reports, args.baseline, args.tolerance)
+        if regressions:
+            print("\n❌ Regressions against baseline:")
+            for message in regressions:
+                print(f"  - {message}")
+            return 1
+        print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import io
+import sys
+import asyncio
+import time
+import random
+import argparse
+from PIL import Image
+
+# The load test never talks to Gemini, so any placeholder key will do
+os.environ.setdefault("GOOGLE_API_KEY", "load-test")
+os.environ["ENABLE_CACHE"] = "false"
+
+from app import analyze_food
+from src.model_registry import get_model_registry
+
+# Colour levels far enough apart to survive JPEG re-encoding
+LEVELS = [0, 64, 128, 192, 255]
+
+
+def color_for(index):
+    return (LEVELS[index % 5], LEVELS[(index // 5) % 5], LEVELS[(index // 25) % 5])
+
+
+def color_tag(color):
+    return "color-{}-{}-{}".format(*color)
+
+
+class ColorEchoModel:
+    """Stand-in model that names the average colour of the image it receives."""
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        await asyncio.sleep(random.uniform(0.01, 0.05))
+        img = Image.open(io.BytesIO(contents[1]["data"])).convert("RGB").resize((1, 1))
+        nearest = tuple(min(LEVELS, key=lambda level: abs(level - channel)) for channel in img.getpixel((0, 0)))
+
+        class Response:
+            text = color_tag(nearest)
+
+            # Streaming responses yield their chunks; this one has a single chunk
+            async def __aiter__(self):
+                yield self
+
+        return Response()
+
+
+async def run_request(index, users):
+    color = color_for(index)
+    image = Image.new("RGB", (640, 480), color)
+    async with users:
+        async for result in analyze_food(image, "", "recipe", progress=lambda *args, **kwargs: None):
+            pass
+    return index, color, result
+
+
+async def run_all(num_requests, num_users):
+    users = asyncio.Semaphore(num_users)
+    return await asyncio.gather(*(run_request(index, users) for index in range(num_requests)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test for analyze_food")
+    parser.add_argument("--users", type=int, default=32, help="Concurrent users")
+    parser.add_argument("--requests", type=int, default=125, help="Total requests (max 125 distinct images)")
+    args = parser.parse_args()
+
+    get_model_registry().pin(ColorEchoModel(), "color-echo")
+
+    print("=" * 70)
+    print(f"🧪 LOAD TEST: {args.requests} requests across {args.users} concurrent users")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all(min(args.requests, 125), args.users))
+    elapsed = time.perf_counter() - start
+
+    contaminated = [(index, color) for index, color, result in results if color_tag(color) not in result]
+    print(f"\nCompleted {len(results)} requests in {elapsed:.2f}s ({len(results) / elapsed:.1f} req/s)")
+    if contaminated:
+        print(f"❌ FAILED: {len(contaminated)} requests received another request's result")
+        for index, color in contaminated[:10]:
+            print(f"   • request {index} expected {color_tag(color)}")
+        sys.exit(1)
+    print("✅ PASSED: every request received the result for its own image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import os
+import csv
+import glob
+import json
+import time
+import random
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+from PIL import UnidentifiedImageError
+from src.image_handle import ImageHandle
+from src.rate_limiter import request_priority, is_rate_limit_error, BATCH_PRIORITY
+from src.settings import init
+from src.tools import (
+    ExtractIngredientsTool,
+    FilterIngredientsTool,
+    DietaryFilterTool,
+    NutrientAnalysisTool,
+    CombinedAnalysisTool
+)
+
+logger = logging.getLogger(__name__)
+
+WORKFLOWS = ("recipe", "analysis", "full")
+MANIFEST_EXTENSIONS = (".txt", ".jsonl", ".csv")
+# Columns/keys read from CSV and JSONL manifests, in order of preference
+_MANIFEST_KEYS = ("source", "path", "url", "image")
+
+
+@dataclass
+class BatchItemResult:
+    """One JSONL line of batch output."""
+    source: str
+    workflow: str
+    status: str
+    ingredients: Optional[List[str]] = None
+    analysis: Optional[str] = None
+    analysis_data: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    attempts: int = 0
+    elapsed_seconds: float = 0.0
+    finished_at: str = ""
+
+
+@dataclass
+class BatchSummary:
+    """Counts for a finished (or interrupted) batch run."""
+    output_path: str
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    failures: List[str] = field(default_factory=list)
+
+
+class Throttle:
+    """Spaces out job starts so the batch never exceeds a requests-per-minute budget."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_for = max(0.0, self._next_at - now)
+            self._next_at = max(now, self._next_at) + self.interval
+        if wait_for:
+            time.sleep(wait_for)
+
+
+def _read_manifest(path: str) -> List[str]:
+    sources = []
+    with open(path, 'r', newline='') as f:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            key = next((k for k in _MANIFEST_KEYS if k in (reader.fieldnames or [])), None)
+            if key is None:
+                raise ValueError(f"Manifest {path} needs one of the columns: {', '.join(_MANIFEST_KEYS)}")
+            sources = [row[key].strip() for row in reader if row.get(key, "").strip()]
+        elif path.endswith(".jsonl"):
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                source = entry if isinstance(entry, str) else next((entry[k] for k in _MANIFEST_KEYS if k in entry), None)
+                if source:
+                    sources.append(source)
+        else:
+            sources = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+    # Relative paths in a manifest are relative to the manifest itself
+    base = os.path.dirname(os.path.abspath(path))
+    return [s if s.startswith(("http://", "https://")) or os.path.isabs(s) else os.path.join(base, s) for s in sources]
+
+
+def _image_extensions() -> Set[str]:
+    return {
+        "." + ext.strip().lower()
+        for ext in os.getenv("SUPPORTED_IMAGE_FORMATS", "jpg,jpeg,png,webp").split(",") if ext.strip()
+    }
+
+
+def collect_sources(inputs: Iterable[str]) -> List[str]:
+    """
+    Expand directories, glob patterns and manifests into a de-duplicated list of image sources.
+
+    :param inputs: Directories, glob patterns, manifest files (.txt, .jsonl, .csv), image paths or URLs.
+    :return: Image paths and URLs in a stable order.
+    """
+    extensions = _image_extensions()
+    sources = []
+    for item in inputs:
+        if item.startswith(("http://", "https://")):
+            sources.append(item)
+        elif os.path.isdir(item):
+            found = []
+            for root, _, files in os.walk(item):
+                found.extend(
+                    os.path.join(root, name) for name in files
+                    if os.path.splitext(name)[1].lower() in extensions
+                )
+            sources.extend(sorted(found))
+        elif any(ch in item for ch in "*?["):
+            sources.extend(sorted(path for path in glob.glob(item, recursive=True) if os.path.isfile(path)))
+        elif item.lower().endswith(MANIFEST_EXTENSIONS):
+            sources.extend(_read_manifest(item))
+        else:
+            sources.append(item)
+
+    seen = set()
+    unique_sources = []
+    for source in sources:
+        if source not in seen:
+            seen.add(source)
+            unique_sources.append(source)
+    return unique_sources
+
+
+def load_checkpoint(output_path: str) -> Set[str]:
+    """
+    Read an existing JSONL output and return the sources that already succeeded.
+
+    A torn last line (from a crash mid-write) is ignored.
+
+    :param output_path: Path of the JSONL results file.
+    :return: Sources with ``status == "ok"``.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record["source"])
+    return done
+
+
+def process_image(source: str, workflow: str = "recipe", dietary_restrictions: Optional[str] = None) -> BatchItemResult:
+    """
+    Run one workflow on one image with the ``_direct`` tool functions.
+
+    :param source: Image path or URL.
+    :param workflow: ``recipe``, ``analysis`` or ``full``.
+    :param dietary_restrictions: Dietary restrictions applied to extracted ingredients.
+    :return: A successful result; errors propagate to the caller.
+    """
+    image = ImageHandle.from_input(source)
+    # Decode up front so bad files fail with a ValueError before any model call
+    image.image
+    result = BatchItemResult(source=source, workflow=workflow, status="ok")
+
+    if workflow == "recipe":
+        raw_ingredients = ExtractIngredientsTool.extract_ingredient_direct(image)
+        ingredients = FilterIngredientsTool.filter_ingredients_direct(raw_ingredients)
+        if dietary_restrictions:
+            ingredients = DietaryFilterTool.filter_based_on_restrictions_direct(ingredients, dietary_restrictions)
+        result.ingredients = ingredients
+    elif workflow == "analysis":
+        result.analysis = NutrientAnalysisTool.analyze_image_direct(image)
+    elif workflow == "full":
+        combined = CombinedAnalysisTool.analyze_combined_direct(image)
+        ingredients = FilterIngredientsTool.filter_ingredients_direct("\n".join(combined.ingredients))
+        if dietary_restrictions:
+            ingredients = DietaryFilterTool.filter_based_on_restrictions_direct(ingredients, dietary_restrictions)
+        result.ingredients = ingredients
+        result.analysis_data = combined.analysis.model_dump()
+    else:
+        raise ValueError(f"Unknown workflow: {workflow}")
+    return result
+
+
+def _rate_limited(error: BaseException) -> bool:
+    """True if a 429 is behind ``error``; the tools re-raise Gemini errors wrapped in plain exceptions."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, Exception) and is_rate_limit_error(error):
+            return True
+        seen.add(id(error))
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def _process_with_retries(source: str, workflow: str, dietary_restrictions: Optional[str],
+                          throttle: Throttle, max_retries: int, backoff_seconds: float) -> BatchItemResult:
+    start = time.perf_counter()
+    attempt = 0
+    while True:
+        attempt += 1
+        throttle.acquire()
+        try:
+            # Batch calls queue behind interactive requests in the Gemini rate limiter
+            with request_priority(BATCH_PRIORITY):
+                result = process_image(source, workflow, dietary_restrictions)
+        except (ValueError, UnidentifiedImageError) as e:
+            # Bad input (size, format, unreadable file): retrying won't help
+            result = BatchItemResult(source=source, workflow=workflow, status="error", error=str(e))
+        except Exception as e:
+            # The Gemini client already waited out and retried 429s, then tried the fallback models;
+            # retrying here would only stack more load on an exhausted quota. The next run picks it up.
+            if attempt <= max_retries and not _rate_limited(e):
+                delay = backoff_seconds * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+                logger.warning(f"Attempt {attempt} failed for {source}, retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                continue
+            result = BatchItemResult(source=source, workflow=workflow, status="error", error=str(e))
+        result.attempts = attempt
+        result.elapsed_seconds = round(time.perf_counter() - start, 3)
+        result.finished_at = datetime.now(timezone.utc).isoformat()
+        return result
+
+
+def run_batch(inputs: Iterable[str], output_path: str, workflow: str = "recipe",
+              dietary_restrictions: Optional[str] = None, concurrency: int = 4,
+              requests_per_minute: Optional[float] = None, max_retries: int = 3,
+              backoff_seconds: float = 2.0, resume: bool = True,
+              on_result: Optional[Callable[[BatchItemResult], None]] = None) -> BatchSummary:
+    """
+    Analyze many images and stream one JSON line per image to ``output_path``.
+
+    The output file doubles as the checkpoint: with ``resume`` enabled, sources
+    that already have an ``ok`` line are skipped and new lines are appended, so
+    an interrupted run picks up where it stopped. Failed images are retried on
+    the next run. Errors are retried within the run too, except rate limits,
+    which the Gemini client has already retried.
+
+    :param inputs: Directories, glob patterns, manifests, image paths or URLs.
+    :param output_path: JSONL file to append results to.
+    :param workflow: ``recipe``, ``analysis`` or ``full``.
+    :param dietary_restrictions: Dietary restrictions applied to extracted ingredients.
+    :param concurrency: Images processed at the same time.
+    :param requests_per_minute: Cap on images started per minute. None for no cap.
+    :param max_retries: Retries per image after the first attempt (not used for rate-limit errors).
+    :param backoff_seconds: Base delay for exponential backoff between retries.
+    :param resume: Skip sources already recorded as ``ok`` in ``output_path``.
+    :param on_result: Optional callback invoked with each result as it is written.
+    :return: Counts of processed, skipped and failed images.
+    """
+    if workflow not in WORKFLOWS:
+        raise ValueError(f"Unknown workflow: {workflow}. Choose from: {', '.join(WORKFLOWS)}")
+
+    start = time.perf_counter()
+    sources = collect_sources(list(inputs))
+    done = load_checkpoint(output_path) if resume else set()
+    pending = [source for source in sources if source not in done]
+    summary = BatchSummary(output_path=output_path, total=len(sources), skipped=len(sources) - len(pending))
+    logger.info(f"✓ Batch of {len(sources)} images: {summary.skipped} already done, {len(pending)} to process")
+
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    throttle = Throttle(requests_per_minute)
+
+    with open(output_path, 'a' if resume else 'w') as out:
+        # Terminate a torn line left by a crash so the next record starts cleanly
+        if resume and out.tell() > 0:
+            with open(output_path, 'rb') as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    out.write("\n")
+
+        # Submit a bounded window of work so huge batches don't queue every future up front
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+            queue = iter(pending)
+            in_flight = set()
+            try:
+                while True:
+                    while len(in_flight) < concurrency * 2:
+                        source = next(queue, None)
+                        if source is None:
+                            break
+                        in_flight.add(executor.submit(
+                            _process_with_retries, source, workflow, dietary_restrictions,
+                            throttle, max_retries, backoff_seconds
+                        ))
+                    if not in_flight:
+                        break
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        result = future.result()
+                        out.write(json.dumps(asdict(result)) + "\n")
+                        out.flush()
+                        if result.status == "ok":
+                            summary.succeeded += 1
+                        else:
+                            summary.failed += 1
+                            summary.failures.append(result.source)
+                        if on_result is not None:
+                            on_result(result)
+            except KeyboardInterrupt:
+                logger.warning("Batch interrupted; finished results are saved and will be skipped on resume")
+                for future in in_flight:
+                    future.cancel()
+                raise
+
+    summary.elapsed_seconds = round(time.perf_counter() - start, 3)
+    logger.info(f"✓ Batch finished in {summary.elapsed_seconds:.1f}s: {summary.succeeded} ok, "
+                f"{summary.failed} failed, {summary.skipped} skipped")
+    return summary
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Analyze a batch of food images and write results to JSONL")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns, manifests (.txt/.jsonl/.csv), paths or URLs")
+    parser.add_argument("-o", "--output", required=True, help="JSONL results file (also the resume checkpoint)")
+    parser.add_argument("-w", "--workflow", choices=WORKFLOWS, default="recipe")
+    parser.add_argument("-r", "--restrictions", default=None, help="Dietary restrictions, e.g. 'vegan, gluten-free'")
+    parser.add_argument("-c", "--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", 4)))
+    parser.add_argument("--rpm", type=float, default=float(os.getenv("BATCH_REQUESTS_PER_MINUTE", 0)) or None,
+                        help="Maximum images started per minute")
+    parser.add_argument("--retries", type=int, default=int(os.getenv("BATCH_MAX_RETRIES", 3)))
+    parser.add_argument("--backoff", type=float, default=2.0, help="Base retry delay in seconds")
+    parser.add_argument("--no-resume", action="store_true", help="Overwrite the output instead of resuming")
+    args = parser.parse_args(argv)
+    init().require_api_key()
+
+    def report(result: BatchItemResult):
+        mark = "✓" if result.status == "ok" else "✗"
+        print(f"{mark} {result.source} ({result.elapsed_seconds:.1f}s, {result.attempts} attempt(s))"
+              + (f": {result.error}" if result.error else ""))
+
+    summary = run_batch(
+        args.inputs, args.output, workflow=args.workflow, dietary_restrictions=args.restrictions,
+        concurrency=args.concurrency, requests_per_minute=args.rpm, max_retries=args.retries,
+        backoff_seconds=args.backoff, resume=not args.no_resume, on_result=report
+    )
+    print(f"\nDone: {summary.succeeded} ok, {summary.failed} failed, {summary.skipped} skipped "
+          f"of {summary.total} in {summary.elapsed_seconds:.1f}s → {summary.output_path}")
+    return 0 if summary.failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
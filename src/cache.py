@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+
+def env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def image_digest(img) -> str:
+    """
+    Hash the decoded pixels of a PIL image, so the same picture hashes the
+    same regardless of file name, container format or metadata.
+
+    :param img: A PIL image.
+    :return: Hex digest of the mode, size and raw pixel data.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    h.update(f"{img.mode}:{img.size[0]}x{img.size[1]}:".encode())
+    h.update(img.tobytes())
+    return h.hexdigest()
+
+
+def make_cache_key(image_hash: str, prompt: str, model_name: Optional[str]) -> str:
+    """
+    Build a content-addressed cache key from an image digest, prompt and model.
+
+    :param image_hash: Digest returned by ``image_digest``.
+    :param prompt: Prompt text sent with the image.
+    :param model_name: Name of the model answering the prompt.
+    :return: Hex digest usable as a cache key.
+    """
+    h = hashlib.blake2b(digest_size=20)
+    for part in (image_hash, model_name or "", prompt):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class MemoryCache:
+    """In-memory LRU tier with size and TTL eviction."""
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at and expires_at < time.time():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else 0
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCache:
+    """SQLite-backed tier that survives restarts. Values are stored as JSON."""
+
+    def __init__(self, path: str, ttl_seconds: float = 3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._db = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # Opened on first use (under the lock) so importing the module never touches disk
+        if self._db is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.commit()
+            self._db = conn
+        return self._db
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at and expires_at < time.time():
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any):
+        expires_at = time.time() + self.ttl_seconds if self.ttl_seconds > 0 else 0
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+class ResultCache:
+    """
+    Two-tier result cache: a memory LRU in front of an optional SQLite store.
+
+    Disk hits are promoted into memory. Hit and miss counters are kept per
+    tier and exposed through ``stats()``.
+    """
+
+    def __init__(self, enabled: bool = True, ttl_seconds: float = 3600,
+                 max_entries: int = 256, db_path: Optional[str] = None):
+        self.enabled = enabled
+        self.memory = MemoryCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.disk = DiskCache(db_path, ttl_seconds=ttl_seconds) if (enabled and db_path) else None
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        """Build a cache from ENABLE_CACHE, CACHE_TTL_SECONDS, CACHE_MAX_ENTRIES and CACHE_DB_PATH."""
+        return cls(
+            enabled=env_flag("ENABLE_CACHE"),
+            ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", 3600)),
+            max_entries=int(os.getenv("CACHE_MAX_ENTRIES", 256)),
+            db_path=os.getenv("CACHE_DB_PATH") or None,
+        )
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Look up a key in memory, then on disk.
+
+        :param key: Key built with ``make_cache_key``.
+        :return: The cached value, or None on a miss or when caching is disabled.
+        """
+        if not self.enabled:
+            return None
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("disk_hits")
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: Any):
+        """Store a value in every enabled tier."""
+        if not self.enabled or value is None:
+            return
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except Exception as e:
+                logger.warning(f"Could not write cache entry to disk: {str(e)}")
+        self._count("stores")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters, hit ratio and current memory size."""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters["memory_hits"] + counters["disk_hits"] + counters["misses"]
+        hits = counters["memory_hits"] + counters["disk_hits"]
+        counters["hit_ratio"] = round(hits / lookups, 4) if lookups else 0.0
+        counters["memory_entries"] = len(self.memory)
+        counters["evictions"] = self.memory.evictions
+        counters["enabled"] = self.enabled
+        return counters
+
+
+def make_verdict_key(ingredient_key: str, restriction_key: str) -> str:
+    """
+    Build the cache key for one ingredient's compliance with one restriction.
+
+    :param ingredient_key: Normalized ingredient, e.g. "honey".
+    :param restriction_key: Normalized restriction, e.g. "vegan".
+    :return: Key for ``verdict_cache``.
+    """
+    return f"verdict:{restriction_key}:{ingredient_key}"
+
+
+@lazy_singleton
+def get_result_cache() -> ResultCache:
+    """The shared cache for vision results, built from the environment on first use."""
+    return ResultCache.from_env()
+
+
+@lazy_singleton
+def get_verdict_cache() -> ResultCache:
+    """The shared cache for dietary verdicts, built from the environment on first use."""
+    # Dietary verdicts don't depend on the image, so they are cached (and persisted) by default
+    return ResultCache(
+        enabled=env_flag("ENABLE_VERDICT_CACHE", "true"),
+        ttl_seconds=float(os.getenv("VERDICT_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+        max_entries=int(os.getenv("VERDICT_CACHE_MAX_ENTRIES", 4096)),
+        db_path=os.getenv("VERDICT_CACHE_DB_PATH", ".cache/verdicts.db") or None,
+    )
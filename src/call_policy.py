@@ -0,0 +1,423 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from google.api_core import exceptions as google_exceptions
+from src.cache import env_flag
+from src.rate_limiter import is_rate_limit_error
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# Transient failures worth retrying on the same model
+RETRYABLE_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.GatewayTimeout,
+    google_exceptions.BadGateway,
+    TimeoutError,
+    ConnectionError,
+)
+# Failures specific to one model, where the next model in the list may still work
+FALLBACK_ERRORS = (
+    google_exceptions.NotFound,
+    google_exceptions.PermissionDenied,
+    google_exceptions.FailedPrecondition,
+)
+
+# One attempt: (model_name, model, timeout_seconds) -> response
+Attempt = Callable[[str, Any, Optional[float]], Any]
+AsyncAttempt = Callable[[str, Any, Optional[float]], Awaitable[Any]]
+
+
+def _percentile(samples: List[float], quantile: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+
+class LatencyTracker:
+    """Rolling window of successful attempt latencies per model."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_name: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(model_name, deque(maxlen=self.window)).append(seconds)
+
+    def samples(self, model_name: str) -> List[float]:
+        with self._lock:
+            return list(self._samples.get(model_name, ()))
+
+    def quantile(self, model_name: str, quantile: float, min_samples: int = 1) -> Optional[float]:
+        samples = self.samples(model_name)
+        if len(samples) < min_samples:
+            return None
+        return _percentile(samples, quantile)
+
+
+class CallPolicy:
+    """
+    Deadlines, retries, hedging and model fallback for one logical Gemini call.
+
+    Each attempt gets ``timeout_seconds``, and the whole call, retries and
+    fallbacks included, gets ``deadline_seconds``: attempts are cut short to
+    the time left, and no retry or fallback starts once it has run out.
+    Retryable errors (timeouts, 5xx) are retried on the same model with
+    jittered exponential backoff. Once a
+    model has enough latency samples, hedging starts a duplicate attempt when
+    the first one outlives the model's ``hedge_quantile`` latency and takes
+    whichever answers first. If a model keeps failing with a retryable or
+    model-specific error, the call moves down the registry's candidate list.
+    """
+
+    def __init__(self, timeout_seconds: Optional[float] = 60.0, deadline_seconds: Optional[float] = 120.0,
+                 max_retries: int = 2,
+                 backoff_seconds: float = 0.5, max_backoff_seconds: float = 8.0,
+                 hedge_enabled: bool = False, hedge_quantile: float = 0.95, hedge_min_samples: int = 20,
+                 fallback_enabled: bool = True, max_fallbacks: int = 2, hedge_workers: int = 8):
+        """
+        :param timeout_seconds: Deadline per attempt. None or 0 for no deadline.
+        :param deadline_seconds: Deadline for the whole call across retries and fallbacks. None or 0 for none.
+        :param max_retries: Retries per model after the first attempt.
+        :param backoff_seconds: Base delay for exponential backoff.
+        :param max_backoff_seconds: Cap on a single backoff delay.
+        :param hedge_enabled: Send a duplicate request when the first is slower than usual.
+        :param hedge_quantile: Latency quantile after which the hedge is sent.
+        :param hedge_min_samples: Latency samples needed before hedging starts.
+        :param fallback_enabled: Try the next candidate model when one keeps failing.
+        :param max_fallbacks: Maximum fallback models per call.
+        :param hedge_workers: Threads available for hedged blocking calls.
+        """
+        self.timeout_seconds = timeout_seconds or None
+        self.deadline_seconds = deadline_seconds or None
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.fallback_enabled = fallback_enabled
+        self.max_fallbacks = max_fallbacks if fallback_enabled else 0
+        self.hedge_workers = hedge_workers
+        self.latencies = LatencyTracker()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            "calls": 0, "attempts": 0, "failures": 0,
+            "timeouts": 0, "retries": 0, "rescued_by_retry": 0,
+            "hedges": 0, "hedge_wins": 0,
+            "fallbacks": 0, "rescued_by_fallback": 0, "deadline_exceeded": 0,
+        }
+        # End-to-end latency of calls each mechanism rescued, to show what it bought
+        self._rescued_latency: Dict[str, Deque[float]] = {
+            name: deque(maxlen=500) for name in ("retry", "hedge", "fallback")
+        }
+        self._call_latency: Deque[float] = deque(maxlen=1000)
+
+    @classmethod
+    def from_env(cls) -> "CallPolicy":
+        """Build a policy from the GEMINI_TIMEOUT_SECONDS, GEMINI_CALL_DEADLINE_SECONDS, GEMINI_MAX_RETRIES,
+        GEMINI_HEDGE_* and GEMINI_FALLBACK_* settings."""
+        return cls(
+            timeout_seconds=float(os.getenv("GEMINI_TIMEOUT_SECONDS", 60)),
+            deadline_seconds=float(os.getenv("GEMINI_CALL_DEADLINE_SECONDS", 120)),
+            max_retries=int(os.getenv("GEMINI_MAX_RETRIES", 2)),
+            backoff_seconds=float(os.getenv("GEMINI_RETRY_BACKOFF_SECONDS", 0.5)),
+            hedge_enabled=env_flag("GEMINI_HEDGE_ENABLED"),
+            hedge_quantile=float(os.getenv("GEMINI_HEDGE_QUANTILE", 0.95)),
+            hedge_min_samples=int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", 20)),
+            fallback_enabled=env_flag("GEMINI_FALLBACK_ENABLED", "true"),
+            max_fallbacks=int(os.getenv("GEMINI_MAX_FALLBACKS", 2)),
+        )
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _backoff(self, retry: int) -> float:
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * (2 ** retry))
+        return random.uniform(0, delay)
+
+    def _deadline(self, start: float) -> Optional[float]:
+        return start + self.deadline_seconds if self.deadline_seconds else None
+
+    def _attempt_timeout(self, deadline: Optional[float]) -> Optional[float]:
+        # The per-attempt timeout, cut short to what is left of the call's deadline
+        if deadline is None:
+            return self.timeout_seconds
+        remaining = max(0.0, deadline - time.monotonic())
+        return remaining if self.timeout_seconds is None else min(self.timeout_seconds, remaining)
+
+    @staticmethod
+    def _expired(deadline: Optional[float], after: float = 0.0) -> bool:
+        """True if the call's deadline passes within ``after`` seconds."""
+        return deadline is not None and time.monotonic() + after >= deadline
+
+    def hedge_delay(self, model_name: str) -> Optional[float]:
+        """Seconds to wait before hedging, or None while hedging is off or the model lacks samples."""
+        if not self.hedge_enabled:
+            return None
+        return self.latencies.quantile(model_name, self.hedge_quantile, self.hedge_min_samples)
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        return isinstance(error, RETRYABLE_ERRORS) or isinstance(error, asyncio.TimeoutError)
+
+    @staticmethod
+    def should_fall_back(error: Exception) -> bool:
+        return isinstance(error, FALLBACK_ERRORS) or is_rate_limit_error(error) or CallPolicy.is_retryable(error)
+
+    def _finish(self, start: float, rescued_by: Optional[str]):
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._call_latency.append(elapsed)
+            if rescued_by:
+                self._rescued_latency[rescued_by].append(elapsed)
+
+    def _retry_delay(self, error: Exception, retry: int) -> Optional[float]:
+        """Record a failed attempt and return the backoff before retrying it on the same model, or None to stop."""
+        if self.is_retryable(error):
+            if isinstance(error, (TimeoutError, asyncio.TimeoutError, google_exceptions.DeadlineExceeded)):
+                self._count("timeouts")
+            if retry < self.max_retries:
+                return self._backoff(retry)
+        return None
+
+    def _retrying(self, error: Exception, model_name: str, retry: int):
+        logger.warning(f"Gemini attempt {retry + 1} on {model_name} failed, retrying: {str(error) or type(error).__name__}")
+        self._count("retries")
+
+    def _give_up(self, start: float, model_name: str, expired: bool):
+        if expired:
+            logger.warning(f"Gemini call on {model_name} reached its {self.deadline_seconds:g}s deadline, giving up")
+            self._count("deadline_exceeded")
+        self._count("failures")
+        self._finish(start, None)
+
+    # --- blocking calls ---
+
+    def _executor_for_hedging(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.hedge_workers, thread_name_prefix="gemini-hedge")
+            return self._executor
+
+    def _hedged(self, attempt: Attempt, model_name: str, model, timeout: Optional[float],
+                hedge: bool = True) -> Tuple[Any, bool]:
+        delay = self.hedge_delay(model_name) if hedge else None
+        if delay is None:
+            return attempt(model_name, model, timeout), False
+
+        executor = self._executor_for_hedging()
+        # Worker threads inherit the caller's context (e.g. request priority)
+        primary = executor.submit(contextvars.copy_context().run, attempt, model_name, model, timeout)
+        try:
+            return primary.result(timeout=delay), False
+        except FutureTimeoutError:
+            pass
+        self._count("hedges")
+        hedge = executor.submit(contextvars.copy_context().run, attempt, model_name, model, timeout)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for loser in pending:
+                        loser.cancel()
+                    return future.result(), future is hedge
+                error = future.exception()
+        raise error
+
+    def call(self, attempt: Attempt, primary: Tuple[str, Any],
+             fallbacks: Callable[[], List[Tuple[str, Any]]], hedge: bool = True):
+        """
+        Run a blocking call under the policy.
+
+        :param attempt: Makes one request: ``attempt(model_name, model, timeout_seconds)``; a blocking
+                        attempt cannot be interrupted, so it must keep to the timeout itself.
+        :param primary: ``(model_name, model)`` tried first.
+        :param fallbacks: Returns the fallback ``(model_name, model)`` pairs; only called if needed.
+        :param hedge: Allow hedged attempts (off for attempts that hold resources, e.g. open streams).
+        :return: The first successful response.
+        """
+        self._count("calls")
+        start = time.monotonic()
+        deadline = self._deadline(start)
+        models = [primary]
+        index = 0
+        while True:
+            model_name, model = models[index]
+            retry = 0
+            while True:
+                self._count("attempts")
+                attempt_start = time.monotonic()
+                try:
+                    response, hedged = self._hedged(attempt, model_name, model, self._attempt_timeout(deadline), hedge)
+                except Exception as e:
+                    error = e
+                    delay = self._retry_delay(e, retry)
+                    expired = self._expired(deadline, after=delay or 0.0)
+                    if delay is not None and not expired:
+                        self._retrying(e, model_name, retry)
+                        time.sleep(delay)
+                        retry += 1
+                        continue
+                    break
+                self.latencies.record(model_name, time.monotonic() - attempt_start)
+                rescued_by = "fallback" if index else ("retry" if retry else None)
+                if hedged:
+                    self._count("hedge_wins")
+                    rescued_by = rescued_by or "hedge"
+                if rescued_by in ("retry", "fallback"):
+                    self._count(f"rescued_by_{rescued_by}")
+                self._finish(start, rescued_by)
+                return response
+
+            can_fall_back = not expired and self.should_fall_back(error)
+            if index == 0 and self.max_fallbacks and can_fall_back:
+                models.extend(fallbacks()[:self.max_fallbacks])
+            if index + 1 < len(models) and can_fall_back:
+                index += 1
+                self._count("fallbacks")
+                logger.warning(f"Falling back from {model_name} to {models[index][0]}: {str(error) or type(error).__name__}")
+                continue
+            self._give_up(start, model_name, expired)
+            raise error
+
+    # --- async calls ---
+
+    @staticmethod
+    def _bounded(attempt: AsyncAttempt, model_name: str, model, timeout: Optional[float]):
+        # Enforced here as well, so an attempt that overruns its timeout is cancelled rather than waited on
+        coroutine = attempt(model_name, model, timeout)
+        return coroutine if timeout is None else asyncio.wait_for(coroutine, timeout)
+
+    async def _hedged_async(self, attempt: AsyncAttempt, model_name: str, model, timeout: Optional[float],
+                            hedge: bool = True) -> Tuple[Any, bool]:
+        delay = self.hedge_delay(model_name) if hedge else None
+        if delay is None:
+            return await self._bounded(attempt, model_name, model, timeout), False
+
+        primary = asyncio.ensure_future(self._bounded(attempt, model_name, model, timeout))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result(), False
+
+            self._count("hedges")
+            hedge = asyncio.ensure_future(self._bounded(attempt, model_name, model, timeout))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            error = None
+            # Finishes within the attempt timeout; with no timeout configured it waits as long as the attempts do
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result(), task is hedge
+                    error = task.exception()
+            raise error
+        finally:
+            # Also runs when the caller is cancelled while waiting, so no attempt outlives the call
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call_async(self, attempt: AsyncAttempt, primary: Tuple[str, Any],
+                         fallbacks: Callable[[], List[Tuple[str, Any]]], hedge: bool = True):
+        """
+        Async variant of ``call``.
+
+        :param attempt: Coroutine function making one request: ``attempt(model_name, model, timeout_seconds)``;
+                        it is cancelled if it runs past the timeout.
+        :param primary: ``(model_name, model)`` tried first.
+        :param fallbacks: Returns the fallback ``(model_name, model)`` pairs; only called if needed.
+        :param hedge: Allow hedged attempts (off for attempts that hold resources, e.g. open streams).
+        :return: The first successful response.
+        """
+        self._count("calls")
+        start = time.monotonic()
+        deadline = self._deadline(start)
+        models = [primary]
+        index = 0
+        while True:
+            model_name, model = models[index]
+            retry = 0
+            while True:
+                self._count("attempts")
+                attempt_start = time.monotonic()
+                try:
+                    response, hedged = await self._hedged_async(attempt, model_name, model,
+                                                                self._attempt_timeout(deadline), hedge)
+                except Exception as e:
+                    error = e
+                    delay = self._retry_delay(e, retry)
+                    expired = self._expired(deadline, after=delay or 0.0)
+                    if delay is not None and not expired:
+                        self._retrying(e, model_name, retry)
+                        await asyncio.sleep(delay)
+                        retry += 1
+                        continue
+                    break
+                self.latencies.record(model_name, time.monotonic() - attempt_start)
+                rescued_by = "fallback" if index else ("retry" if retry else None)
+                if hedged:
+                    self._count("hedge_wins")
+                    rescued_by = rescued_by or "hedge"
+                if rescued_by in ("retry", "fallback"):
+                    self._count(f"rescued_by_{rescued_by}")
+                self._finish(start, rescued_by)
+                return response
+
+            can_fall_back = not expired and self.should_fall_back(error)
+            if index == 0 and self.max_fallbacks and can_fall_back:
+                models.extend((await asyncio.to_thread(fallbacks))[:self.max_fallbacks])
+            if index + 1 < len(models) and can_fall_back:
+                index += 1
+                self._count("fallbacks")
+                logger.warning(f"Falling back from {model_name} to {models[index][0]}: {str(error) or type(error).__name__}")
+                continue
+            self._give_up(start, model_name, expired)
+            raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Counters plus latency percentiles: overall, and for the calls each
+        mechanism rescued (a rescued call would otherwise have failed, or, for
+        hedges, still been waiting on the slow attempt).
+        """
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            call_latency = list(self._call_latency)
+            rescued = {name: list(samples) for name, samples in self._rescued_latency.items()}
+        stats["latency"] = {f"p{int(q * 100)}": _percentile(call_latency, q) for q in (0.5, 0.95, 0.99)}
+        for name, samples in rescued.items():
+            stats[f"{name}_rescued_latency"] = {
+                "count": len(samples),
+                "p50": _percentile(samples, 0.5),
+                "p95": _percentile(samples, 0.95),
+            }
+        if self.hedge_enabled:
+            stats["hedge_delay"] = {name: self.hedge_delay(name) for name in list(self.latencies._samples)}
+        return stats
+
+
+@lazy_singleton
+def get_call_policy() -> CallPolicy:
+    """The shared call policy, built from the environment on first use."""
+    return CallPolicy.from_env()
@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import logging
+import datetime
+import threading
+from typing import Dict, Optional, Tuple
+from src.cache import env_flag
+from src.prompts import PROMPTS, PromptTemplate, find_template
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# Gemini rejects cached contents below a per-model minimum size; smaller prefixes are sent inline
+DEFAULT_MIN_TOKENS = 32768
+DEFAULT_TTL_SECONDS = 3600
+# Re-create a cache this long before it expires, so calls never hit an expired one
+_REFRESH_MARGIN = 60.0
+
+
+class GeminiCacheBackend:
+    """Stores prefixes with Gemini's context caching API (``CachedContent``)."""
+
+    def create(self, model_name: str, model, template: PromptTemplate, ttl_seconds: float):
+        from google.generativeai import caching
+        from src.settings import configure_genai
+
+        genai = configure_genai()
+        cached = caching.CachedContent.create(
+            model=f"models/{model_name}",
+            display_name=f"nourishbot-{template.name}",
+            contents=[template.prefix],
+            ttl=datetime.timedelta(seconds=ttl_seconds),
+        )
+        return genai.GenerativeModel.from_cached_content(cached)
+
+
+class _LocalCachedModel:
+    """Sends the prefix with every call, but otherwise behaves like a model built from cached content."""
+
+    def __init__(self, model, template: PromptTemplate):
+        self.model = model
+        self.template = template
+
+    def _contents(self, contents):
+        parts = list(contents) if isinstance(contents, (list, tuple)) else [contents]
+        for i, part in enumerate(parts):
+            if isinstance(part, str):
+                parts[i] = self.template.prefix + part
+                return parts
+        return [self.template.prefix] + parts
+
+    def _mark_cached(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            usage.cached_content_token_count = self.template.prefix_tokens
+        return response
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        response = self.model.generate_content(self._contents(contents), stream=stream, **kwargs)
+        if not stream:
+            return self._mark_cached(response)
+        return (self._mark_cached(chunk) for chunk in response)
+
+    async def generate_content_async(self, contents, stream: bool = False, **kwargs):
+        response = await self.model.generate_content_async(self._contents(contents), stream=stream, **kwargs)
+        if not stream:
+            return self._mark_cached(response)
+
+        mark_cached = self._mark_cached
+
+        class CachedStream:
+            async def __aiter__(self):
+                async for chunk in response:
+                    yield mark_cached(chunk)
+        return CachedStream()
+
+
+class LocalCacheBackend:
+    """
+    Offline stand-in for ``GeminiCacheBackend``, for tests and benchmarks: the
+    same split of prompts into cached prefix and per-call rest, with the
+    prefix re-attached locally and reported as ``cached_content_token_count``.
+    """
+
+    def __init__(self):
+        self.created: Dict[Tuple[str, str], int] = {}
+
+    def create(self, model_name: str, model, template: PromptTemplate, ttl_seconds: float):
+        key = (model_name, template.name)
+        self.created[key] = self.created.get(key, 0) + 1
+        return _LocalCachedModel(model, template)
+
+
+class _CacheEntry:
+    __slots__ = ("model", "expires_at", "failed", "lock")
+
+    def __init__(self):
+        self.model = None
+        self.expires_at = 0.0
+        self.failed = False
+        self.lock = threading.Lock()
+
+
+class ContextCache:
+    """
+    Shares the fixed prefixes of the prompt templates between calls.
+
+    When a request's text starts with a template's prefix and that prefix is
+    large enough to cache, the prefix is stored once per model (re-created
+    shortly before its TTL runs out) and later calls send only the rest of
+    the prompt and the image to a model bound to the cached content. Prefixes
+    below ``min_tokens``, and models where creating a cache fails, keep
+    sending the full prompt. Creation never blocks other callers: while one
+    call creates the cache, concurrent calls go out uncached.
+
+    Off unless ENABLE_CONTEXT_CACHE is set. Today's prefixes are a few hundred
+    tokens, far below the API minimum, so with the Gemini backend this only
+    pays off once a template grows a large fixed part (e.g. reference tables).
+    """
+
+    def __init__(self, backend=None, enabled: bool = False, min_tokens: int = DEFAULT_MIN_TOKENS,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS):
+        self.backend = backend or GeminiCacheBackend()
+        self.enabled = enabled
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        if enabled and all(template.prefix_tokens < min_tokens for template in PROMPTS):
+            logger.warning(f"Context caching is enabled but every prompt prefix is below {min_tokens} tokens; "
+                           "prompts will be sent in full")
+        self._entries: Dict[Tuple[str, str], _CacheEntry] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "ContextCache":
+        """Build from ENABLE_CONTEXT_CACHE, CONTEXT_CACHE_BACKEND, CONTEXT_CACHE_MIN_TOKENS and CONTEXT_CACHE_TTL_SECONDS."""
+        backend_name = os.getenv("CONTEXT_CACHE_BACKEND", "gemini").lower()
+        if backend_name not in ("gemini", "local"):
+            raise ValueError(f"Unknown CONTEXT_CACHE_BACKEND: {backend_name}")
+        return cls(
+            backend=LocalCacheBackend() if backend_name == "local" else GeminiCacheBackend(),
+            enabled=env_flag("ENABLE_CONTEXT_CACHE", "false"),
+            min_tokens=int(os.getenv("CONTEXT_CACHE_MIN_TOKENS", DEFAULT_MIN_TOKENS)),
+            ttl_seconds=float(os.getenv("CONTEXT_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        )
+
+    def _entry(self, model_name: str, template: PromptTemplate) -> _CacheEntry:
+        key = (model_name, template.name)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _CacheEntry()
+            return entry
+
+    def _cached_model(self, model_name: str, model, template: PromptTemplate):
+        entry = self._entry(model_name, template)
+        if entry.failed:
+            return None
+        if entry.model is not None and time.monotonic() < entry.expires_at - _REFRESH_MARGIN:
+            return entry.model
+        if not entry.lock.acquire(blocking=False):
+            # Someone else is (re-)creating it; the old cache is fine until it expires
+            return entry.model if entry.model is not None and time.monotonic() < entry.expires_at else None
+        try:
+            entry.model = self.backend.create(model_name, model, template, self.ttl_seconds)
+            entry.expires_at = time.monotonic() + self.ttl_seconds
+            logger.info(f"✓ Cached prompt prefix {template.name} for {model_name} "
+                        f"({template.prefix_tokens} tokens, ttl {self.ttl_seconds:.0f}s)")
+            return entry.model
+        except Exception as e:
+            entry.failed = True
+            logger.warning(f"Context caching unavailable for {template.name} on {model_name}, "
+                           f"sending the full prompt: {str(e)}")
+            return None
+        finally:
+            entry.lock.release()
+
+    def apply(self, model_name: str, model, contents) -> Tuple[object, object]:
+        """
+        Swap a cached prefix out of a request.
+
+        :param model_name: Model the request is about to be sent to.
+        :param model: That model.
+        :param contents: Prompt or list of prompt parts.
+        :return: The model and contents to send: a cached-content model and
+                 the contents without the prefix, or both unchanged.
+        """
+        if not self.enabled:
+            return model, contents
+        parts = list(contents) if isinstance(contents, (list, tuple)) else [contents]
+        index = next((i for i, part in enumerate(parts) if isinstance(part, str)), None)
+        template: Optional[PromptTemplate] = find_template(parts[index]) if index is not None else None
+        if template is None or template.prefix_tokens < self.min_tokens:
+            return model, contents
+
+        cached_model = self._cached_model(model_name, model, template)
+        with self._lock:
+            if cached_model is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if cached_model is None:
+            return model, contents
+        rest = parts[index][len(template.prefix):]
+        parts = parts[:index] + ([rest] if rest else []) + parts[index + 1:]
+        return cached_model, parts
+
+    async def apply_async(self, model_name: str, model, contents) -> Tuple[object, object]:
+        """Async variant of ``apply``; creating a cache is a blocking API call, so it runs in a worker thread."""
+        if not self.enabled:
+            return model, contents
+        return await asyncio.to_thread(self.apply, model_name, model, contents)
+
+    def invalidate(self):
+        """Forget every cache (e.g. after a model switch); they expire on the server by themselves."""
+        with self._lock:
+            self._entries.clear()
+
+
+@lazy_singleton
+def get_context_cache() -> ContextCache:
+    """The shared context cache, built from the environment on first use."""
+    return ContextCache.from_env()
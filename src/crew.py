@@ -1,7 +1,10 @@
 import os
+import time
 import yaml
+import functools
+import threading
+from typing import Callable
 from crewai import Agent, Crew, Process, Task
-from crewai.project import CrewBase, agent, crew, task
 from src.tools import (
     ExtractIngredientsTool, 
     FilterIngredientsTool, 
@@ -9,27 +12,92 @@ from src.tools import (
     NutrientAnalysisTool
 )
 from src.models import RecipeSuggestionOutput, NutrientAnalysisOutput
-from langchain_google_genai import ChatGoogleGenerativeAI
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
+from src.prompts import compact
+from src.settings import get_settings
+from src.task_graph import ParallelCrew
+from src.tracing import record_stage, trace_request
 
 # Get the absolute path to the config directory
 CONFIG_DIR = os.path.join(os.path.dirname(__file__), "config")
 
+_llm_lock = threading.Lock()
+
+
 # Initialize Google Gemini LLM for agents
-def get_gemini_llm(temperature: float = 0.7):
-    """Initialize Google Gemini LLM with proper model name for CrewAI"""
+@functools.lru_cache(maxsize=None)
+def _pooled_llm(model: str, temperature: float):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(
-        model="gemini-pro",
+        model=model,
         temperature=temperature,
-        google_api_key=os.getenv("GOOGLE_API_KEY"),
+        google_api_key=get_settings().require_api_key(),
         convert_system_message_to_human=True  # Required for Gemini
     )
 
 
-@CrewBase
+def get_gemini_llm(temperature: float = 0.7, model: str = "gemini-pro"):
+    """
+    Google Gemini LLM for CrewAI agents. One client is shared per (model, temperature)
+    for the whole process, so building a crew doesn't create new clients.
+    """
+    with _llm_lock:
+        return _pooled_llm(model, temperature)
+
+
+@functools.lru_cache(maxsize=None)
+def load_crew_config(path: str) -> dict:
+    """
+    Parse a crew YAML file once per process, with whitespace compacted. The
+    returned dict is shared between crews and must be treated as read-only.
+
+    :param path: Path to agents.yaml or tasks.yaml.
+    :return: The parsed configuration.
+    """
+    with open(path, 'r') as f:
+        return _compact_config(yaml.safe_load(f))
+
+
+def _compact_config(node):
+    # Roles, goals and backstories are re-sent on every agent LLM call; drop their stray whitespace
+    if isinstance(node, str):
+        return compact(node)
+    if isinstance(node, dict):
+        return {key: _compact_config(value) for key, value in node.items()}
+    if isinstance(node, list):
+        return [_compact_config(value) for value in node]
+    return node
+
+
+def _built_once(func: Callable) -> Callable:
+    # Per-instance memoization: each crew builds an agent or task at most once,
+    # and the built objects are released with the crew. (CrewAI's @agent/@task
+    # memoize in a module-level dict keyed by the crew, which keeps every crew alive.)
+    @functools.wraps(func)
+    def wrapper(self):
+        built = self.__dict__.setdefault("_built", {})
+        if func.__name__ not in built:
+            built[func.__name__] = func(self)
+        return built[func.__name__]
+    return wrapper
+
+
+def agent(func: Callable) -> Callable:
+    """Mark a crew method as an agent factory, built once per crew instance."""
+    return _built_once(func)
+
+
+def task(func: Callable) -> Callable:
+    """Mark a crew method as a task factory, built once per crew instance and named after the method."""
+    @functools.wraps(func)
+    def named(self):
+        result = func(self)
+        if not result.name:
+            result.name = func.__name__
+        return result
+    return _built_once(named)
+
+
 class BaseNourishBotCrew:
     agents_config_path = os.path.join(CONFIG_DIR, 'agents.yaml')
     tasks_config_path = os.path.join(CONFIG_DIR, 'tasks.yaml')
@@ -38,11 +106,28 @@ class BaseNourishBotCrew:
         self.image_data = image_data
         self.dietary_restrictions = dietary_restrictions if dietary_restrictions else ""
 
-        with open(self.agents_config_path, 'r') as f:
-            self.agents_config = yaml.safe_load(f)
-        
-        with open(self.tasks_config_path, 'r') as f:
-            self.tasks_config = yaml.safe_load(f)
+        self.agents_config = load_crew_config(self.agents_config_path)
+        self.tasks_config = load_crew_config(self.tasks_config_path)
+        self._task_started = None
+
+    def _record_task(self, output):
+        """Crew task callback: record how long the task that just finished took."""
+        now = time.perf_counter()
+        if self._task_started is not None:
+            task_name = getattr(output, "name", None) or "task"
+            record_stage("crew.task", now - self._task_started, {"task": task_name})
+        self._task_started = now
+
+    def kickoff(self, inputs: dict = None):
+        """
+        Run the crew with a traced root span and per-task timings.
+
+        :param inputs: Inputs interpolated into the task descriptions.
+        :return: The crew output.
+        """
+        with trace_request("crew.kickoff", {"crew": type(self).__name__}):
+            self._task_started = time.perf_counter()
+            return self.crew().kickoff(inputs=inputs)
 
     @agent
     def ingredient_detection_agent(self) -> Agent:
@@ -135,10 +220,8 @@ class BaseNourishBotCrew:
         )
 
 
-@CrewBase
 class NourishBotRecipeCrew(BaseNourishBotCrew):
 
-    @crew
     def crew(self) -> Crew:
         """Recipe generation workflow"""
         return Crew(
@@ -153,14 +236,13 @@ class NourishBotRecipeCrew(BaseNourishBotCrew):
                 self.recipe_suggestion_task()
             ],
             process=Process.sequential,
+            task_callback=self._record_task,
             verbose=True
         )
 
 
-@CrewBase
 class NourishBotAnalysisCrew(BaseNourishBotCrew):
 
-    @crew
     def crew(self) -> Crew:
         """Nutritional analysis workflow"""
         return Crew(
@@ -171,5 +253,30 @@ class NourishBotAnalysisCrew(BaseNourishBotCrew):
                 self.nutrient_analysis_task(),
             ],
             process=Process.sequential,
+            task_callback=self._record_task,
             verbose=True
-        )
\ No newline at end of file
+        )
+
+class NourishBotFullCrew(BaseNourishBotCrew):
+
+    def crew(self) -> ParallelCrew:
+        """
+        Recipe and nutrition workflows together. Tasks run as a graph of their
+        context declarations: nutrient analysis doesn't wait for the
+        detection -> filtering -> recipe chain, so the crew takes as long as
+        the slower branch instead of the sum of all tasks.
+        """
+        return ParallelCrew(
+            agents=[
+                self.nutrient_analysis_agent(),
+                self.ingredient_detection_agent(),
+                self.dietary_filtering_agent(),
+                self.recipe_suggestion_agent()
+            ],
+            tasks=[
+                self.nutrient_analysis_task(),
+                self.ingredient_detection_task(),
+                self.dietary_filtering_task(),
+                self.recipe_suggestion_task()
+            ]
+        )
@@ -0,0 +1,212 @@
+import os
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+import yaml
+from src.ingredient_index import DESCRIPTOR_WORDS, DISH_WORDS, IngredientIndex, name_tokens
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "config")
+DIET_RULES_PATH = os.path.join(CONFIG_DIR, "diet_rules.yaml")
+
+_RESTRICTION_SPLIT_RE = re.compile(r",|;|/|&|\band\b|\+")
+# Shortest word considered as part of a compound word ("cheesecake" -> "cheese" + "cake")
+_MIN_SUBSTRING_LENGTH = 4
+_MODIFIER_PREFIX = "modifier:"
+
+
+@dataclass(frozen=True)
+class Classification:
+    """Attributes the local rules found in one ingredient."""
+    attributes: FrozenSet[str]  # carried for sure: those of the head noun ("tomatoes" in "beef tomatoes")
+    possible: FrozenSet[str] = frozenset()  # carried by the other names, which may only describe the head
+    complete: bool = True  # False for prepared foods, dishes and unknown head nouns, whose other ingredients vary
+
+
+class DietRulesEngine:
+    """
+    Local dietary compliance checks for well-defined diets.
+
+    The YAML table is compiled once into an ``IngredientIndex`` (ingredient
+    names and modifiers to canonical IDs). Ingredients are normalized by the
+    index (lowercase, quantities and parentheses dropped, plurals folded onto
+    the vocabulary, misspellings corrected) and every known name in them is
+    matched longest-phrase-first; a head noun that is not a known name falls
+    back to compound words made of two known names ("cheesecake").
+
+    Only the head noun's attributes are certain. Other names in the ingredient
+    may describe the head rather than be part of it ("beef tomatoes", "butter
+    lettuce"), and prepared foods ("cake", "naan", "fried chicken") may contain anything, so a
+    diet those would break is reported as unknown and left to the model, as is
+    everything that is not in the table at all.
+    """
+
+    def __init__(self, diets: Dict[str, dict], modifiers: Dict[str, List[str]], ingredients: List[dict]):
+        self._diet_forbids: Dict[str, FrozenSet[str]] = {}
+        self._diet_aliases: Dict[str, str] = {}
+        for name, spec in diets.items():
+            self._diet_forbids[name] = frozenset(spec.get("forbids", []))
+            for alias in [name] + list(spec.get("aliases", [])):
+                self._diet_aliases[" ".join(name_tokens(alias))] = name
+
+        # Canonical ID per ingredient entry is its first name; modifiers get their own namespace
+        self._attributes: Dict[str, FrozenSet[str]] = {}
+        self._composite: Set[str] = set()
+        entries = []
+        for entry in ingredients:
+            canonical_id = entry["names"][0]
+            attributes = frozenset(entry.get("attributes", []))
+            self._attributes[canonical_id] = self._attributes.get(canonical_id, frozenset()) | attributes
+            if entry.get("composite"):
+                self._composite.add(canonical_id)
+            entries.append((canonical_id, entry["names"]))
+        for name, removes in modifiers.items():
+            self._attributes[_MODIFIER_PREFIX + name] = frozenset(removes)
+            entries.append((_MODIFIER_PREFIX + name, [name]))
+        self.index = IngredientIndex(entries)
+
+        self._words: Dict[str, str] = {
+            tokens[0]: canonical_id for tokens, canonical_id in self.index.phrases.items()
+            if not canonical_id.startswith(_MODIFIER_PREFIX) and len(tokens) == 1
+            and len(tokens[0]) >= _MIN_SUBSTRING_LENGTH
+        }
+        self.classify = lru_cache(maxsize=8192)(self._classify)
+
+    @classmethod
+    def from_yaml(cls, path: str = DIET_RULES_PATH) -> "DietRulesEngine":
+        with open(path, 'r') as f:
+            config = yaml.safe_load(f)
+        engine = cls(config.get("diets", {}), config.get("modifiers", {}), config.get("ingredients", []))
+        logger.info(f"✓ Loaded diet rules: {len(engine._diet_forbids)} diets, {len(engine.index)} phrases")
+        return engine
+
+    @property
+    def diets(self) -> List[str]:
+        return sorted(self._diet_forbids)
+
+    def normalize(self, ingredient: str) -> Tuple[str, ...]:
+        """
+        Reduce an ingredient string to the tokens used for matching.
+
+        :param ingredient: Free-form ingredient text, e.g. "2 ripe hass avocados".
+        :return: Normalized tokens, e.g. ("ripe", "hass", "avocado").
+        """
+        return self.index.normalize(ingredient)
+
+    def ingredient_key(self, ingredient: str) -> str:
+        """
+        Canonical form of an ingredient for caching verdicts.
+
+        :param ingredient: Free-form ingredient text.
+        :return: Normalized tokens without descriptor words, e.g. "hass avocado".
+        """
+        return self.index.key(ingredient)
+
+    def restriction_key(self, dietary_restrictions: str) -> str:
+        """
+        Canonical form of a restriction string for caching verdicts.
+
+        :param dietary_restrictions: e.g. "Gluten free, vegan".
+        :return: Sorted diet names for known diets ("gluten-free,vegan"), otherwise the lowercased words.
+        """
+        diets = self.resolve_diets(dietary_restrictions)
+        if diets:
+            return ",".join(sorted(set(diets)))
+        return " ".join(name_tokens(dietary_restrictions))
+
+    def _compound(self, token: str) -> Optional[Tuple[str, str]]:
+        # A word made of two known names, read as modifier + head ("cheesecake");
+        # "honeydew" and "butternut" don't split into known names and stay unknown
+        for split in range(_MIN_SUBSTRING_LENGTH, len(token) - _MIN_SUBSTRING_LENGTH + 1):
+            head = self._words.get(token[split:])
+            modifier = self._words.get(token[:split])
+            if head is not None and modifier is not None:
+                return modifier, head
+        return None
+
+    def _classify(self, ingredient: str) -> Optional[Classification]:
+        tokens = self.normalize(ingredient)
+        removed: Set[str] = set()
+        modifier_positions: Set[int] = set()
+        foods = []
+        for match in self.index.resolve_all(ingredient):
+            if match.canonical_id.startswith(_MODIFIER_PREFIX):
+                removed |= self._attributes[match.canonical_id]
+                modifier_positions.update(range(match.start, match.end))
+            else:
+                foods.append(match)
+
+        content = [i for i, token in enumerate(tokens)
+                   if token not in DESCRIPTOR_WORDS and token not in DISH_WORDS and i not in modifier_positions]
+        head = content[-1] if content else None
+        head_match = next((match for match in foods if head is not None and match.start <= head < match.end), None)
+        head_id = head_match.canonical_id if head_match is not None else None
+        others = [match.canonical_id for match in foods if match.canonical_id != head_id]
+        # "fried chicken" is still chicken, but breaded and fried in who knows what
+        in_dish = any(token in DISH_WORDS for i, token in enumerate(tokens)
+                      if head_match is None or not head_match.start <= i < head_match.end)
+        if head_id is None and head is not None:
+            compound = self._compound(tokens[head])
+            if compound is not None:
+                others.append(compound[0])
+                head_id = compound[1]
+        if head_id is None and not others:
+            return None
+
+        attributes = self._attributes[head_id] - removed if head_id is not None else frozenset()
+        possible: Set[str] = set()
+        for canonical_id in others:
+            possible |= self._attributes[canonical_id]
+        return Classification(
+            attributes=frozenset(attributes),
+            possible=frozenset(possible - removed - attributes),
+            complete=head_id is not None and head_id not in self._composite and not in_dish,
+        )
+
+    def resolve_diets(self, dietary_restrictions: Optional[str]) -> Optional[List[str]]:
+        """
+        Map a free-form restriction string onto known diets.
+
+        :param dietary_restrictions: e.g. "vegan, gluten free".
+        :return: Known diet names, or None if any part is not recognized.
+        """
+        if not dietary_restrictions:
+            return []
+        diets = []
+        for part in _RESTRICTION_SPLIT_RE.split(dietary_restrictions.lower()):
+            key = " ".join(name_tokens(part))
+            if not key:
+                continue
+            diet = self._diet_aliases.get(key)
+            if diet is None:
+                return None
+            diets.append(diet)
+        return diets
+
+    def check(self, ingredient: str, diets: List[str]) -> Optional[bool]:
+        """
+        Decide whether an ingredient complies with every given diet.
+
+        :param ingredient: Free-form ingredient text.
+        :param diets: Diet names from ``resolve_diets``.
+        :return: True or False, or None when the table can't tell (unknown or prepared foods).
+        """
+        classification = self.classify(ingredient)
+        if classification is None:
+            return None
+        forbidden = frozenset().union(*(self._diet_forbids[diet] for diet in diets))
+        if classification.attributes & forbidden:
+            return False
+        if classification.possible & forbidden or not classification.complete:
+            return None
+        return True
+
+
+@lazy_singleton
+def get_diet_rules() -> DietRulesEngine:
+    """The bundled diet rules, loaded on first use."""
+    return DietRulesEngine.from_yaml()
@@ -0,0 +1,339 @@
+import os
+import asyncio
+import logging
+import threading
+import time
+import weakref
+from typing import Optional
+from google.api_core import exceptions as google_exceptions
+from src.model_registry import ModelRegistry, get_model_registry
+from src.rate_limiter import QuotaScheduler, get_quota_scheduler, estimate_tokens, is_rate_limit_error
+from src.call_policy import CallPolicy, get_call_policy
+from src.context_cache import ContextCache, get_context_cache
+from src.settings import lazy_singleton
+from src.tracing import span, record_tokens
+
+logger = logging.getLogger(__name__)
+
+# Errors that mean the resolved model itself is unusable (retired, renamed or not enabled for the key)
+MODEL_ERRORS = (google_exceptions.NotFound, google_exceptions.PermissionDenied)
+
+
+class GeminiClient:
+    """
+    Shared entry point for every Gemini generation call.
+
+    Sync and async calls go through the model registry, wait for budget in
+    the model's rate limiter and are bounded by ``max_concurrency`` in-flight
+    requests. Async calls use the SDK's native async API, so many requests
+    can wait on Gemini from one event loop without holding a thread each.
+    429 responses pause the limiter (using the server's retry hint) and are
+    retried instead of surfacing as failures. Deadlines, retries of transient
+    errors, hedging and model fallback are delegated to the ``CallPolicy``;
+    each attempt's timeout covers the quota wait, a free slot, the request
+    and any 429 back-off, so none of them can outlast the call's deadline.
+    Fixed prompt prefixes are served from the ``ContextCache`` when enabled.
+    """
+
+    def __init__(self, registry: ModelRegistry, max_concurrency: int = 16,
+                 scheduler: Optional[QuotaScheduler] = None, policy: Optional[CallPolicy] = None,
+                 prompt_cache: Optional[ContextCache] = None):
+        """
+        :param registry: Registry that supplies the active model.
+        :param max_concurrency: Maximum in-flight requests, per event loop for async calls.
+        :param scheduler: Per-model rate limits. Defaults to the shared scheduler.
+        :param policy: Deadline/retry/hedging/fallback policy. Defaults to the shared policy.
+        :param prompt_cache: Context cache for prompt prefixes. Defaults to the shared cache.
+        """
+        self.registry = registry
+        self.scheduler = scheduler or get_quota_scheduler()
+        self.policy = policy or get_call_policy()
+        self.prompt_cache = prompt_cache or get_context_cache()
+        self.max_concurrency = max_concurrency
+        self._sync_slots = threading.BoundedSemaphore(max_concurrency)
+        # asyncio semaphores are bound to the loop they are first used on
+        self._async_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, registry: Optional[ModelRegistry] = None) -> "GeminiClient":
+        """Build a client from GEMINI_MAX_CONCURRENCY."""
+        return cls(
+            registry=registry or get_model_registry(),
+            max_concurrency=int(os.getenv("GEMINI_MAX_CONCURRENCY", 16)),
+        )
+
+    def _loop_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._async_slots.get(loop)
+            if slots is None:
+                slots = asyncio.Semaphore(self.max_concurrency)
+                self._async_slots[loop] = slots
+            return slots
+
+    def _retry_rate_limit(self, limiter, error: Exception, attempt: int, deadline: Optional[float]) -> bool:
+        """Pause the limiter and return True if a 429 should be retried before the attempt's deadline."""
+        if is_rate_limit_error(error) and attempt < self.scheduler.max_rate_limit_retries:
+            backoff = self.scheduler.backoff_for(error, attempt)
+            limiter.back_off(backoff)
+            # A pause that outlasts the deadline would only end in a timeout; raise the 429 so the policy can fall back
+            return deadline is None or time.monotonic() + backoff < deadline
+        return False
+
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> Optional[float]:
+        return None if timeout is None else time.monotonic() + timeout
+
+    @staticmethod
+    def _time_left(deadline: Optional[float]) -> Optional[float]:
+        """Seconds left for the attempt; raises DeadlineExceeded once none are left, instead of sending unbounded."""
+        if deadline is None:
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise google_exceptions.DeadlineExceeded("Gemini attempt ran out of time before the request was sent")
+        return remaining
+
+    @staticmethod
+    def _with_timeout(kwargs: dict, timeout: Optional[float]) -> dict:
+        if timeout is None:
+            return kwargs
+        request_options = dict(kwargs.get("request_options") or {})
+        request_options["timeout"] = min(request_options.get("timeout") or timeout, timeout)
+        return {**kwargs, "request_options": request_options}
+
+    def _take_sync_slot(self, deadline: Optional[float]):
+        if not self._sync_slots.acquire(timeout=self._time_left(deadline)):
+            raise TimeoutError(f"No free Gemini request slot (max {self.max_concurrency} in flight)")
+
+    def _attempt(self, model_name: str, model, contents, kwargs: dict, timeout: Optional[float]):
+        deadline = self._deadline(timeout)
+        limiter = self.scheduler.limiter(model_name)
+        tokens = estimate_tokens(contents, kwargs.get("generation_config"))
+        model, contents = self.prompt_cache.apply(model_name, model, contents)
+        rate_limited = 0
+        while True:
+            with span("quota_wait", {"model": model_name}):
+                limiter.acquire(tokens, timeout=self._time_left(deadline))
+            self._take_sync_slot(deadline)
+            try:
+                with span("gemini_call", {"model": model_name}):
+                    response = model.generate_content(contents, **self._with_timeout(kwargs, self._time_left(deadline)))
+                    record_tokens(model_name, response)
+            except Exception as e:
+                if self._retry_rate_limit(limiter, e, rate_limited, deadline):
+                    rate_limited += 1
+                    continue
+                raise
+            finally:
+                self._sync_slots.release()
+            limiter.record_usage(tokens, response)
+            return response
+
+    async def _attempt_async(self, model_name: str, model, contents, kwargs: dict, timeout: Optional[float]):
+        deadline = self._deadline(timeout)
+        limiter = self.scheduler.limiter(model_name)
+        tokens = estimate_tokens(contents, kwargs.get("generation_config"))
+        model, contents = await self.prompt_cache.apply_async(model_name, model, contents)
+        rate_limited = 0
+        while True:
+            with span("quota_wait", {"model": model_name}):
+                await limiter.acquire_async(tokens, timeout=self._time_left(deadline))
+            # Waiting for a slot is bounded by the policy, which cancels the attempt at its timeout
+            async with self._loop_slots():
+                try:
+                    with span("gemini_call", {"model": model_name}):
+                        remaining = self._time_left(deadline)
+                        response = await asyncio.wait_for(
+                            model.generate_content_async(contents, **self._with_timeout(kwargs, remaining)), remaining)
+                        record_tokens(model_name, response)
+                except Exception as e:
+                    if self._retry_rate_limit(limiter, e, rate_limited, deadline):
+                        rate_limited += 1
+                        continue
+                    raise
+            limiter.record_usage(tokens, response)
+            return response
+
+    @staticmethod
+    def chunk_text(chunk) -> str:
+        """Text of one streamed chunk; chunks without text (e.g. a final safety chunk) give ''."""
+        try:
+            return chunk.text
+        except (ValueError, AttributeError):
+            return ""
+
+    def _open_stream(self, model_name: str, model, contents, kwargs: dict, timeout: Optional[float]):
+        deadline = self._deadline(timeout)
+        limiter = self.scheduler.limiter(model_name)
+        tokens = estimate_tokens(contents, kwargs.get("generation_config"))
+        model, contents = self.prompt_cache.apply(model_name, model, contents)
+        rate_limited = 0
+        while True:
+            with span("quota_wait", {"model": model_name}):
+                limiter.acquire(tokens, timeout=self._time_left(deadline))
+            # The slot is held until the stream is exhausted or closed
+            self._take_sync_slot(deadline)
+            try:
+                with span("gemini_first_chunk", {"model": model_name}):
+                    request_kwargs = self._with_timeout(kwargs, self._time_left(deadline))
+                    chunks = iter(model.generate_content(contents, stream=True, **request_kwargs))
+                    first = next(chunks, None)
+            except Exception as e:
+                self._sync_slots.release()
+                if self._retry_rate_limit(limiter, e, rate_limited, deadline):
+                    rate_limited += 1
+                    continue
+                raise
+            return first, chunks, limiter, tokens, model_name
+
+    async def _open_stream_async(self, model_name: str, model, contents, kwargs: dict, timeout: Optional[float]):
+        deadline = self._deadline(timeout)
+        limiter = self.scheduler.limiter(model_name)
+        tokens = estimate_tokens(contents, kwargs.get("generation_config"))
+        model, contents = await self.prompt_cache.apply_async(model_name, model, contents)
+        slots = self._loop_slots()
+        rate_limited = 0
+        while True:
+            with span("quota_wait", {"model": model_name}):
+                await limiter.acquire_async(tokens, timeout=self._time_left(deadline))
+            await slots.acquire()
+            try:
+                # Opening the stream and the first chunk share what is left of the attempt's time
+                with span("gemini_first_chunk", {"model": model_name}):
+                    remaining = self._time_left(deadline)
+                    response = await asyncio.wait_for(
+                        model.generate_content_async(contents, stream=True, **self._with_timeout(kwargs, remaining)),
+                        remaining)
+                    chunks = response.__aiter__()
+                    first = await asyncio.wait_for(chunks.__anext__(), self._time_left(deadline))
+            except StopAsyncIteration:
+                return None, None, limiter, tokens, slots, model_name
+            except BaseException as e:
+                slots.release()
+                if isinstance(e, Exception) and self._retry_rate_limit(limiter, e, rate_limited, deadline):
+                    rate_limited += 1
+                    continue
+                raise
+            return first, chunks, limiter, tokens, slots, model_name
+
+    def _invalidate_on(self, error: Exception):
+        # Timeouts, 5xx and rate limits say nothing about the model, so keep it (and any pin)
+        if isinstance(error, MODEL_ERRORS):
+            self.registry.invalidate(str(error))
+
+    def _fallbacks(self):
+        return self.registry.fallback_models(self.policy.max_fallbacks)
+
+    def generate(self, contents, **kwargs):
+        """
+        Blocking generation call. Invalidates the registry if the call fails
+        because the model is missing or not permitted, so the next call
+        re-resolves it.
+
+        :param contents: Prompt or list of prompt parts.
+        :return: The Gemini response.
+        """
+        kwargs = {name: value for name, value in kwargs.items() if value is not None}
+        model = self.registry.get_model()
+        primary = (self.registry.active_model_name, model)
+        try:
+            return self.policy.call(
+                lambda model_name, model, timeout: self._attempt(model_name, model, contents, kwargs, timeout),
+                primary, self._fallbacks
+            )
+        except Exception as e:
+            self._invalidate_on(e)
+            raise
+
+    async def generate_async(self, contents, **kwargs):
+        """
+        Async generation call, bounded by the per-loop semaphore.
+
+        :param contents: Prompt or list of prompt parts.
+        :return: The Gemini response.
+        """
+        kwargs = {name: value for name, value in kwargs.items() if value is not None}
+        model = await self.registry.get_model_async()
+        primary = (self.registry.active_model_name, model)
+        try:
+            return await self.policy.call_async(
+                lambda model_name, model, timeout: self._attempt_async(model_name, model, contents, kwargs, timeout),
+                primary, self._fallbacks
+            )
+        except Exception as e:
+            self._invalidate_on(e)
+            raise
+
+    def stream(self, contents, **kwargs):
+        """
+        Blocking streaming call. Deadlines, retries and fallback apply until
+        the first chunk arrives; after that chunks are passed through as-is.
+
+        :param contents: Prompt or list of prompt parts.
+        :return: Generator of text chunks.
+        """
+        kwargs = {name: value for name, value in kwargs.items() if value is not None}
+        model = self.registry.get_model()
+        primary = (self.registry.active_model_name, model)
+        try:
+            # The model that answered, which is a fallback if the primary failed
+            first, chunks, limiter, tokens, answered_by = self.policy.call(
+                lambda model_name, model, timeout: self._open_stream(model_name, model, contents, kwargs, timeout),
+                primary, self._fallbacks, hedge=False
+            )
+        except Exception as e:
+            self._invalidate_on(e)
+            raise
+
+        last = first
+        try:
+            with span("gemini_stream"):
+                if first is not None:
+                    yield self.chunk_text(first)
+                    for chunk in chunks:
+                        last = chunk
+                        yield self.chunk_text(chunk)
+        finally:
+            self._sync_slots.release()
+            limiter.record_usage(tokens, last)
+            record_tokens(answered_by, last)
+
+    async def stream_async(self, contents, **kwargs):
+        """
+        Async variant of ``stream``.
+
+        :param contents: Prompt or list of prompt parts.
+        :return: Async generator of text chunks.
+        """
+        kwargs = {name: value for name, value in kwargs.items() if value is not None}
+        model = await self.registry.get_model_async()
+        primary = (self.registry.active_model_name, model)
+        try:
+            first, chunks, limiter, tokens, slots, answered_by = await self.policy.call_async(
+                lambda model_name, model, timeout: self._open_stream_async(model_name, model, contents, kwargs, timeout),
+                primary, self._fallbacks, hedge=False
+            )
+        except Exception as e:
+            self._invalidate_on(e)
+            raise
+
+        last = first
+        try:
+            with span("gemini_stream"):
+                if first is not None:
+                    yield self.chunk_text(first)
+                    async for chunk in chunks:
+                        last = chunk
+                        yield self.chunk_text(chunk)
+        finally:
+            slots.release()
+            limiter.record_usage(tokens, last)
+            record_tokens(answered_by, last)
+
+
+@lazy_singleton
+def get_gemini_client() -> GeminiClient:
+    """The shared client, built from the environment on first use."""
+    return GeminiClient.from_env()
@@ -0,0 +1,216 @@
+import os
+import asyncio
+import logging
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager
+from io import BytesIO
+from typing import Iterable, Iterator, Optional, Union
+import httpx
+import requests
+from PIL import Image
+from src.cache import image_digest
+from src.phash import get_perceptual_index
+from src.image_preprocessing import get_image_preprocessor, PreprocessedImage
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for an image URL to connect or send data
+FETCH_TIMEOUT_SECONDS = 30
+# Downloads are read in chunks of this size, so an oversized image is dropped early
+_CHUNK_BYTES = 64 * 1024
+
+# One pooled async HTTP client per event loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def _async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(follow_redirects=True, timeout=FETCH_TIMEOUT_SECONDS)
+        _async_http_clients[loop] = client
+    return client
+
+
+def _check_content_length(response):
+    """Reject a download up front when the server says it is over the limit."""
+    try:
+        length = int(response.headers.get("Content-Length"))
+    except (TypeError, ValueError):
+        return
+    get_image_preprocessor().check_size(length)
+
+
+def _read_capped(chunks: Iterable[bytes]) -> bytes:
+    """Join downloaded chunks, stopping as soon as they pass MAX_IMAGE_SIZE_MB."""
+    preprocessor = get_image_preprocessor()
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        preprocessor.check_size(len(buffer), partial=True)
+    return bytes(buffer)
+
+
+class ImageHandle:
+    """
+    A single request's image, loaded lazily and decoded at most once.
+
+    The handle can be built from a local path, a URL, encoded bytes or an
+    already decoded PIL image. The source bytes, decoded pixels, pixel digest,
+    perceptual hash and preprocessed upload payload are each computed on first
+    access and memoized, so every tool in a workflow shares the same work.
+    """
+
+    def __init__(self, path: Optional[str] = None, url: Optional[str] = None,
+                 data: Optional[bytes] = None, image=None):
+        if sum(source is not None for source in (path, url, data, image)) != 1:
+            raise ValueError("ImageHandle needs exactly one of path, url, data or image")
+        if data is not None:
+            get_image_preprocessor().check_size(len(data))
+        self.path = path
+        self.url = url
+        self._data = data
+        self._image = image
+        self._digest: Optional[str] = None
+        self._perceptual_hash: Optional[int] = None
+        self._preprocessed: Optional[PreprocessedImage] = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_input(cls, image_input: Union["ImageHandle", str, bytes, Image.Image]) -> "ImageHandle":
+        """
+        Wrap any supported image input in a handle. Handles are returned as is.
+
+        :param image_input: An ImageHandle, a file path, a URL, encoded bytes or a PIL image.
+        :return: An ImageHandle.
+        """
+        if isinstance(image_input, ImageHandle):
+            return image_input
+        if isinstance(image_input, Image.Image):
+            return cls(image=image_input)
+        if isinstance(image_input, (bytes, bytearray)):
+            return cls(data=bytes(image_input))
+        if isinstance(image_input, str):
+            if image_input.startswith("http"):
+                return cls(url=image_input)
+            return cls(path=image_input)
+        raise TypeError(f"Unsupported image input type: {type(image_input).__name__}")
+
+    def __str__(self):
+        if self.path:
+            return self.path
+        if self.url:
+            return self.url
+        return "<in-memory image>"
+
+    @property
+    def raw_bytes(self) -> Optional[bytes]:
+        """
+        Encoded source bytes, read from disk or fetched once. None for handles
+        built from a decoded image.
+        """
+        with self._lock:
+            if self._data is None and self._image is None:
+                with span("image_fetch", {"source": "url" if self.url else "file"}):
+                    if self.url:
+                        with requests.get(self.url, timeout=FETCH_TIMEOUT_SECONDS, stream=True) as response:
+                            response.raise_for_status()
+                            _check_content_length(response)
+                            data = _read_capped(response.iter_content(_CHUNK_BYTES))
+                    else:
+                        if not os.path.isfile(self.path):
+                            raise FileNotFoundError(f"No file found at path: {self.path}")
+                        get_image_preprocessor().check_size(os.path.getsize(self.path))
+                        with open(self.path, "rb") as f:
+                            data = _read_capped(iter(lambda: f.read(_CHUNK_BYTES), b""))
+                self._data = data
+            return self._data
+
+    async def fetch_async(self) -> Optional[bytes]:
+        """
+        Async variant of ``raw_bytes``: URLs are fetched with the shared async
+        HTTP client and files are read in a worker thread.
+        """
+        if self._data is not None or self._image is not None:
+            return self._data
+        if self.url:
+            preprocessor = get_image_preprocessor()
+            with span("image_fetch", {"source": "url"}):
+                async with _async_http_client().stream("GET", self.url) as response:
+                    response.raise_for_status()
+                    _check_content_length(response)
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes(_CHUNK_BYTES):
+                        buffer.extend(chunk)
+                        preprocessor.check_size(len(buffer), partial=True)
+            with self._lock:
+                if self._data is None:
+                    self._data = bytes(buffer)
+            return self._data
+        return await asyncio.to_thread(lambda: self.raw_bytes)
+
+    @property
+    def image(self):
+        """The decoded PIL image, validated against the supported formats."""
+        with self._lock:
+            if self._image is None:
+                data = self.raw_bytes
+                with span("image_load"):
+                    img = Image.open(BytesIO(data))
+                    get_image_preprocessor().check_format(img)
+                    img.load()
+                self._image = img
+            return self._image
+
+    @property
+    def digest(self) -> str:
+        """Pixel digest used for exact-match cache keys."""
+        with self._lock:
+            if self._digest is None:
+                self._digest = image_digest(self.image)
+            return self._digest
+
+    @property
+    def perceptual_hash(self) -> int:
+        """Perceptual hash used for near-duplicate lookups."""
+        with self._lock:
+            if self._perceptual_hash is None:
+                self._perceptual_hash = get_perceptual_index().hash_image(self.image)
+            return self._perceptual_hash
+
+    @property
+    def preprocessed(self) -> PreprocessedImage:
+        """Resized, re-encoded payload ready to upload."""
+        with self._lock:
+            if self._preprocessed is None:
+                image = self.image
+                with span("preprocess"):
+                    self._preprocessed = get_image_preprocessor().preprocess(image, original=self._data)
+            return self._preprocessed
+
+    @contextmanager
+    def spooled_path(self) -> Iterator[str]:
+        """
+        Yield a file path for consumers that only accept paths (e.g. CrewAI
+        task inputs). Path-backed handles yield their own path; otherwise the
+        preprocessed payload is written to a private temp file that is removed
+        on exit, so concurrent requests never share a file.
+        """
+        if self.path:
+            yield self.path
+            return
+        prepared = self.preprocessed
+        suffix = {"image/webp": ".webp", "image/png": ".png"}.get(prepared.mime_type, ".jpg")
+        fd, temp_path = tempfile.mkstemp(prefix="nourishbot-", suffix=suffix)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(prepared.data)
+            yield temp_path
+        finally:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                logger.warning(f"Could not remove temporary image {temp_path}")
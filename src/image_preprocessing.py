@@ -0,0 +1,207 @@
+import os
+import time
+import logging
+import threading
+from io import BytesIO
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# PIL reports format names; map the user-facing extensions onto them. Phones save
+# multi-picture JPEGs that PIL reports as MPO; the first frame is a plain JPEG.
+_FORMAT_ALIASES = {"jpg": "jpeg", "jpeg": "jpeg", "mpo": "jpeg", "png": "png", "webp": "webp", "gif": "gif", "bmp": "bmp"}
+_MIME_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+# Source encodings Gemini accepts as they are, keyed by PIL format name (MPO is not one of them)
+_SOURCE_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+@dataclass
+class PreprocessedImage:
+    """Encoded payload ready to upload, plus what it cost to produce."""
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    original_bytes: Optional[int]
+    elapsed_ms: float
+
+    @property
+    def encoded_bytes(self) -> int:
+        return len(self.data)
+
+    @property
+    def bytes_saved(self) -> Optional[int]:
+        if self.original_bytes is None:
+            return None
+        return self.original_bytes - self.encoded_bytes
+
+    def as_part(self) -> Dict[str, Any]:
+        """Blob dict accepted by ``GenerativeModel.generate_content``."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+
+class ImagePreprocessor:
+    """
+    Normalizes images before upload: applies EXIF orientation, caps the
+    longest side, flattens to RGB and re-encodes without metadata.
+    """
+
+    def __init__(self, max_side: int = 1536, output_format: str = "jpeg", quality: int = 85,
+                 max_size_mb: float = 10, supported_formats: Optional[List[str]] = None):
+        """
+        :param max_side: Longest side in pixels after resizing. 0 disables resizing.
+        :param output_format: ``jpeg`` or ``webp``.
+        :param quality: Encoder quality (1-100).
+        :param max_size_mb: Largest accepted source image, in megabytes.
+        :param supported_formats: Accepted source formats (e.g. jpg, png, webp).
+        """
+        output_format = _FORMAT_ALIASES.get(output_format.lower(), output_format.lower())
+        if output_format not in _MIME_TYPES:
+            raise ValueError(f"Unsupported output image format: {output_format}")
+        self.max_side = max_side
+        self.output_format = output_format
+        self.quality = quality
+        self.max_size_mb = max_size_mb
+        formats = supported_formats or ["jpg", "jpeg", "png", "webp"]
+        self.supported_formats = {_FORMAT_ALIASES.get(f.strip().lower(), f.strip().lower()) for f in formats if f.strip()}
+        self._lock = threading.Lock()
+        self._totals = {"images": 0, "encoded_bytes": 0, "bytes_saved": 0, "elapsed_ms": 0.0}
+
+    @classmethod
+    def from_env(cls) -> "ImagePreprocessor":
+        """Build a preprocessor from IMAGE_MAX_SIDE, IMAGE_OUTPUT_FORMAT, IMAGE_QUALITY, MAX_IMAGE_SIZE_MB and SUPPORTED_IMAGE_FORMATS."""
+        return cls(
+            max_side=int(os.getenv("IMAGE_MAX_SIDE", 1536)),
+            output_format=os.getenv("IMAGE_OUTPUT_FORMAT", "jpeg"),
+            quality=int(os.getenv("IMAGE_QUALITY", 85)),
+            max_size_mb=float(os.getenv("MAX_IMAGE_SIZE_MB", 10)),
+            supported_formats=os.getenv("SUPPORTED_IMAGE_FORMATS", "jpg,jpeg,png,webp").split(","),
+        )
+
+    @property
+    def signature(self) -> str:
+        """Settings that change what the model sees, for use in cache keys."""
+        return f"{self.output_format}:{self.max_side}:{self.quality}"
+
+    @property
+    def max_bytes(self) -> Optional[int]:
+        """MAX_IMAGE_SIZE_MB in bytes, or None when there is no limit."""
+        return int(self.max_size_mb * 1024 * 1024) if self.max_size_mb > 0 else None
+
+    def check_size(self, num_bytes: Optional[int], partial: bool = False):
+        """
+        Reject sources larger than MAX_IMAGE_SIZE_MB.
+
+        :param num_bytes: Size of the encoded source image, if known.
+        :param partial: ``num_bytes`` is only what has been read so far, so the image is at least that large.
+        """
+        if num_bytes is not None and self.max_bytes is not None and num_bytes > self.max_bytes:
+            at_least = "at least " if partial else ""
+            raise ValueError(
+                f"Image is {at_least}{num_bytes / (1024 * 1024):.1f} MB, larger than the {self.max_size_mb:g} MB limit"
+            )
+
+    def check_format(self, img):
+        """
+        Reject images whose source format is not in SUPPORTED_IMAGE_FORMATS.
+        In-memory images with no source format are accepted.
+
+        :param img: A PIL image.
+        """
+        source_format = (img.format or "").lower()
+        source_format = _FORMAT_ALIASES.get(source_format, source_format)
+        if source_format and source_format not in self.supported_formats:
+            raise ValueError(
+                f"Unsupported image format '{source_format}'. Supported formats: {', '.join(sorted(self.supported_formats))}"
+            )
+
+    def _to_output_mode(self, img):
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if has_alpha and self.output_format == "webp":
+            return img.convert("RGBA")
+        if has_alpha:
+            rgba = img.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            return background
+        return img if img.mode == "RGB" else img.convert("RGB")
+
+    @staticmethod
+    def _upload_as_is(img, original: Optional[bytes], resized: bool) -> Optional[str]:
+        """MIME type to upload ``original`` under if it can be sent unchanged, else None."""
+        # EXIF carries the orientation and things not to upload (e.g. GPS), so only re-encoding drops it
+        if original is None or resized or img.getexif():
+            return None
+        return _SOURCE_MIME_TYPES.get(img.format)
+
+    def preprocess(self, img, original_bytes: Optional[int] = None, original: Optional[bytes] = None) -> PreprocessedImage:
+        """
+        Orient, resize, convert and re-encode an image for upload. When the
+        source has no EXIF, needs no resizing and re-encoding would make it
+        larger (e.g. a small, flat PNG), the source bytes are uploaded instead.
+
+        :param img: A PIL image.
+        :param original_bytes: Size of the source encoding, used to report bytes saved.
+        :param original: The source encoding, if at hand.
+        :return: The encoded payload and its statistics.
+        """
+        start = time.perf_counter()
+        if original is not None:
+            original_bytes = len(original)
+        if original_bytes is None:
+            filename = getattr(img, "filename", None)
+            if filename and os.path.isfile(filename):
+                original_bytes = os.path.getsize(filename)
+
+        processed = ImageOps.exif_transpose(img)
+        resized = bool(self.max_side) and max(processed.size) > self.max_side
+        if resized:
+            processed = processed.copy() if processed is img else processed
+            processed.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+        processed = self._to_output_mode(processed)
+
+        buffer = BytesIO()
+        save_kwargs = {"quality": self.quality}
+        if self.output_format == "jpeg":
+            save_kwargs["optimize"] = True
+        else:
+            save_kwargs["method"] = 4
+        processed.save(buffer, format=self.output_format.upper(), **save_kwargs)
+        data, mime_type = buffer.getvalue(), _MIME_TYPES[self.output_format]
+        source_mime_type = self._upload_as_is(img, original, resized)
+        if source_mime_type and len(original) <= len(data):
+            data, mime_type = original, source_mime_type
+
+        result = PreprocessedImage(
+            data=data,
+            mime_type=mime_type,
+            size=processed.size,
+            original_bytes=original_bytes,
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+        )
+        with self._lock:
+            self._totals["images"] += 1
+            self._totals["encoded_bytes"] += result.encoded_bytes
+            self._totals["bytes_saved"] += result.bytes_saved or 0
+            self._totals["elapsed_ms"] += result.elapsed_ms
+
+        saved = f", saved {result.bytes_saved} bytes" if result.bytes_saved is not None else ""
+        encoding = self.output_format if data is not original else f"{img.format.lower()} (source kept, re-encoding was larger)"
+        logger.info(
+            f"✓ Preprocessed image {img.size} -> {result.size}: {result.encoded_bytes} bytes "
+            f"{encoding}{saved} in {result.elapsed_ms:.1f} ms"
+        )
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """Cumulative image count, bytes uploaded, bytes saved and time spent."""
+        with self._lock:
+            return dict(self._totals)
+
+
+@lazy_singleton
+def get_image_preprocessor() -> ImagePreprocessor:
+    """The shared preprocessor, built from the environment on first use."""
+    return ImagePreprocessor.from_env()
@@ -0,0 +1,315 @@
+import os
+import re
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# Quantity words dropped before matching ("2 cups of milk" -> "milk")
+UNIT_WORDS = {
+    "g", "gram", "grams", "kg", "mg", "oz", "ounce", "ounces", "lb", "lbs", "pound", "pounds",
+    "ml", "l", "litre", "liter", "cup", "cups", "tbsp", "tablespoon", "tablespoons", "tsp",
+    "teaspoon", "teaspoons", "slice", "slices", "piece", "pieces", "clove", "cloves", "can",
+    "cans", "bunch", "handful", "pinch", "of", "a", "an", "some", "x",
+}
+# Preparation, size and form words that don't change which food it is ("fresh baby spinach leaves").
+# They still match when part of a known name ("fried rice", "whole milk"); otherwise they are ignored.
+DESCRIPTOR_WORDS = {
+    "fresh", "freshly", "ripe", "raw", "cooked", "uncooked", "organic", "frozen", "thawed", "chilled",
+    "chopped", "diced", "sliced", "minced", "grated", "shredded", "crushed", "ground", "peeled",
+    "halved", "quartered", "cubed", "julienned", "trimmed", "pitted", "seeded", "rinsed", "drained",
+    "large", "small", "medium", "big", "mini", "baby", "young", "whole", "extra", "jumbo",
+    "lean", "boneless", "skinless", "unsalted", "salted", "unsweetened", "sweetened", "plain",
+    "grilled", "roasted", "roast", "baked", "boiled", "steamed", "sauteed", "poached",
+    "toasted", "smoked", "canned", "tinned", "natural", "homemade", "leftover", "mixed",
+    "assorted", "warm", "cold", "hot", "thin", "thick", "thinly", "finely", "roughly", "lightly",
+    "leaf", "leaves", "floret", "florets", "fillet", "fillets", "wedge", "wedges", "chunk", "chunks",
+    "cube", "cubes", "strip", "strips", "stick", "sticks", "sprig", "sprigs", "stalk", "stalks",
+    "ring", "rings", "head", "heads", "and", "or", "with", "for", "to", "taste", "garnish", "optional",
+}
+# Cooking words that make a dish with other ingredients out of a food ("fried rice" has egg and oil,
+# "mashed potatoes" butter and milk). Unlike descriptors they are never dropped, so "fried rice"
+# and "rice" are different foods with different keys.
+DISH_WORDS = {
+    "fried", "mashed", "creamed", "stuffed", "breaded", "battered", "glazed", "candied", "buttered",
+    "scalloped", "gratin",
+}
+IRREGULAR_PLURALS = {"leaves": "leaf", "loaves": "loaf", "halves": "half", "geese": "goose"}
+_TOKEN_RE = re.compile(r"[a-z]+")
+FOOD_WORDS_PATH = os.path.join(os.path.dirname(__file__), "config", "food_words.txt")
+# Shortest vocabulary token offered as a correction
+_MIN_FUZZY_LENGTH = 4
+_FUZZY_CANDIDATES = 8
+
+
+def _max_edits(length: int) -> int:
+    # Short words are one edit away from too many others ("pear", "peas"); longer ones can take two typos
+    if length < 6:
+        return 0
+    return 1 if length < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance counting insertions, deletions, substitutions and swaps of adjacent letters.
+
+    :param limit: Stop early once the distance is certainly above this.
+    :return: The distance, or ``limit + 1`` if it is larger than ``limit``.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous, current = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return min(current[-1], limit + 1)
+
+
+@lazy_singleton
+def food_words() -> FrozenSet[str]:
+    """Correctly spelled food words from src/config/food_words.txt, which fuzzy matching leaves alone."""
+    with open(FOOD_WORDS_PATH) as f:
+        return frozenset(line.strip() for line in f if line.strip() and not line.startswith("#"))
+
+
+def name_tokens(text: str) -> List[str]:
+    # Configured names keep every word, including ones that look like quantities
+    return _TOKEN_RE.findall(text.lower())
+
+
+def raw_tokens(text: str) -> List[str]:
+    text = re.sub(r"\([^)]*\)", " ", text.lower())
+    return [token for token in _TOKEN_RE.findall(text) if token not in UNIT_WORDS]
+
+
+def _trigrams(token: str) -> Set[str]:
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True)
+class IngredientMatch:
+    """A known name found in a raw ingredient string."""
+    canonical_id: str
+    name: str
+    confidence: float
+    method: str  # exact, phrase, tokens or fuzzy
+    start: int = 0
+    end: int = 0
+
+
+class IngredientIndex:
+    """
+    Resolves free-form ingredient strings to canonical IDs without calling the model.
+
+    Names are compiled once into three structures: a phrase table (token
+    tuple -> canonical ID), a token inverted index (token -> phrases containing
+    it, for reordered names like "breast of chicken") and a character-trigram
+    inverted index over the vocabulary (for misspellings like "brocoli").
+
+    Raw strings are normalized the same way every time: lowercased, text in
+    parentheses and quantity words dropped, plurals folded onto the
+    vocabulary and misspelled tokens corrected to their closest known token.
+    Only words that are not real food words themselves are corrected, and
+    the edits allowed grow with word length (none below six letters, two
+    from eight), so "custard" never becomes "mustard" and "brocoli" still
+    becomes "broccoli".
+    Descriptor words ("fresh", "chopped", "leaves") only count when they are
+    part of a known name. Confidence is 1.0 when a name accounts for every
+    remaining word and lower when tokens were corrected. A name that covers
+    only part of the words ("milk" in "soy milk", "chicken" in "chicken soup")
+    may be a different food altogether, so such matches score below 0.6.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, Iterable[str]]], known_words: Optional[Iterable[str]] = None):
+        """
+        :param entries: ``(canonical_id, names)`` pairs.
+        :param known_words: Correctly spelled words that are never corrected; defaults to ``food_words()``.
+        """
+        self._known_words = frozenset(food_words() if known_words is None else known_words)
+        names: Dict[Tuple[str, ...], str] = {}
+        for canonical_id, entry_names in entries:
+            for name in entry_names:
+                tokens = tuple(name_tokens(name))
+                if tokens:
+                    names.setdefault(tokens, canonical_id)
+        # Plural names are folded like the input will be ("red onions" and alias "onions" -> "onion")
+        self._vocabulary: Set[str] = {token for tokens in names for token in tokens}
+        self._phrases: Dict[Tuple[str, ...], str] = {}
+        for tokens, canonical_id in names.items():
+            self._phrases.setdefault(tuple(self._singular(token) for token in tokens), canonical_id)
+
+        self._vocabulary = set()
+        self._token_postings: Dict[str, List[Tuple[str, ...]]] = {}
+        for tokens in self._phrases:
+            self._vocabulary.update(tokens)
+            for token in set(tokens):
+                self._token_postings.setdefault(token, []).append(tokens)
+        self._trigram_postings: Dict[str, List[str]] = {}
+        for token in sorted(self._vocabulary):
+            if len(token) >= _MIN_FUZZY_LENGTH:
+                for trigram in _trigrams(token):
+                    self._trigram_postings.setdefault(trigram, []).append(token)
+        self._max_phrase_length = max((len(tokens) for tokens in self._phrases), default=1)
+
+        self.resolve = lru_cache(maxsize=16384)(self._resolve)
+        self.resolve_all = lru_cache(maxsize=16384)(self._resolve_all)
+        self._correct = lru_cache(maxsize=16384)(self._correct_token)
+
+    def __len__(self) -> int:
+        return len(self._phrases)
+
+    @property
+    def phrases(self) -> Dict[Tuple[str, ...], str]:
+        """Every known name as normalized tokens, mapped to its canonical ID."""
+        return self._phrases
+
+    def _singular(self, token: str) -> str:
+        if token in IRREGULAR_PLURALS:
+            return IRREGULAR_PLURALS[token]
+        candidates = []
+        if token.endswith("ies"):
+            candidates += [token[:-3] + "y", token[:-1]]
+        if token.endswith("es"):
+            candidates.append(token[:-2])
+        if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+            candidates.append(token[:-1])
+        for candidate in candidates:
+            if candidate in self._vocabulary:
+                return candidate
+        return token
+
+    def _correct_token(self, token: str) -> Tuple[str, float]:
+        max_edits = _max_edits(len(token))
+        if not max_edits or token in self._vocabulary or token in DESCRIPTOR_WORDS or self._is_known_word(token):
+            return token, 1.0
+        shared: Dict[str, int] = {}
+        for trigram in _trigrams(token):
+            for candidate in self._trigram_postings.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        best, best_edits = token, max_edits + 1
+        for candidate in sorted(shared, key=lambda name: (-shared[name], name))[:_FUZZY_CANDIDATES]:
+            edits = edit_distance(token, candidate, max_edits)
+            if edits < best_edits:
+                best, best_edits = candidate, edits
+        if best_edits <= max_edits:
+            return best, round(1 - best_edits / max(len(token), len(best)), 3)
+        return token, 1.0
+
+    def _is_known_word(self, token: str) -> bool:
+        # "custards" is known because "custard" is
+        if token in self._known_words:
+            return True
+        if token.endswith("ies") and token[:-3] + "y" in self._known_words:
+            return True
+        return token.endswith("s") and (token[:-1] in self._known_words or token[:-2] in self._known_words)
+
+    def normalize(self, ingredient: str) -> Tuple[str, ...]:
+        """
+        Reduce an ingredient string to the tokens used for matching.
+
+        :param ingredient: Free-form ingredient text, e.g. "2 ripe hass avocados".
+        :return: Normalized tokens, e.g. ("ripe", "hass", "avocado").
+        """
+        return tuple(self._singular(token) for token in raw_tokens(ingredient))
+
+    def key(self, ingredient: str) -> str:
+        """
+        Canonical text for an ingredient, for caching: normalized and spell-corrected
+        tokens without descriptor words ("Fresh Baby Spinach Leaves" and "spinach" share a key).
+
+        :param ingredient: Free-form ingredient text.
+        :return: Space-joined tokens, or the lowercased input if nothing is left.
+        """
+        tokens = [token for token in self._corrected(ingredient)[0] if token not in DESCRIPTOR_WORDS]
+        return " ".join(tokens) or ingredient.strip().lower()
+
+    def _corrected(self, ingredient: str) -> Tuple[Tuple[str, ...], Tuple[float, ...]]:
+        tokens, similarities = [], []
+        for token in self.normalize(ingredient):
+            corrected, similarity = self._correct(token)
+            tokens.append(corrected)
+            similarities.append(similarity)
+        return tuple(tokens), tuple(similarities)
+
+    def _scan(self, tokens: Tuple[str, ...], similarities: Tuple[float, ...]) -> List[IngredientMatch]:
+        matches = []
+        i = 0
+        while i < len(tokens):
+            for length in range(min(self._max_phrase_length, len(tokens) - i), 0, -1):
+                phrase = tokens[i:i + length]
+                canonical_id = self._phrases.get(phrase)
+                if canonical_id is not None:
+                    similarity = min(similarities[i:i + length])
+                    method = "fuzzy" if similarity < 1.0 else "exact" if length == len(tokens) else "phrase"
+                    matches.append(IngredientMatch(canonical_id, " ".join(phrase), similarity, method, i, i + length))
+                    i += length
+                    break
+            else:
+                i += 1
+        return matches
+
+    def _resolve_all(self, ingredient: str) -> Tuple[IngredientMatch, ...]:
+        """
+        Every known name in the string, longest phrase first, left to right.
+
+        :param ingredient: Free-form ingredient text, e.g. "vegan cheddar cheese".
+        :return: Matches in order of appearance.
+        """
+        return tuple(self._scan(*self._corrected(ingredient)))
+
+    def _unordered_match(self, tokens: Tuple[str, ...], similarities: Tuple[float, ...]):
+        # Same words in another order ("breast of chicken", "beans, black")
+        present = set(tokens)
+        candidates = {phrase for token in present for phrase in self._token_postings.get(token, ())}
+        fits = [phrase for phrase in candidates if len(phrase) > 1 and set(phrase) <= present]
+        if not fits:
+            return None
+        phrase = max(fits, key=lambda candidate: (len(candidate), candidate))
+        covered = {i for i, token in enumerate(tokens) if token in phrase}
+        similarity = min(similarities[i] for i in covered)
+        method = "fuzzy" if similarity < 1.0 else "tokens"
+        # Reordered words are a weaker signal than the name as written
+        return IngredientMatch(self._phrases[phrase], " ".join(phrase), 0.9 * similarity, method), covered
+
+    def _resolve(self, ingredient: str) -> Optional[IngredientMatch]:
+        """
+        The single canonical food an ingredient string refers to.
+
+        :param ingredient: Free-form ingredient text, e.g. "fresh baby spinach leaves".
+        :return: The best match with its confidence, or None if no known name is found.
+        """
+        tokens, similarities = self._corrected(ingredient)
+        content = [i for i, token in enumerate(tokens) if token not in DESCRIPTOR_WORDS]
+
+        # Candidates: phrases over all words, phrases over the words left after
+        # dropping descriptors ("grilled chicken breast"), and reordered names
+        candidates = []
+        for positions in (list(range(len(tokens))), content):
+            matches = self._scan(tuple(tokens[i] for i in positions), tuple(similarities[i] for i in positions))
+            if matches:
+                # Longest name wins; on a tie the later one is usually the head noun ("tomato sauce")
+                best = max(reversed(matches), key=lambda match: match.end - match.start)
+                candidates.append((best, {positions[i] for i in range(best.start, best.end)}))
+        unordered = self._unordered_match(tokens, similarities)
+        if unordered is not None:
+            candidates.append(unordered)
+
+        resolved = None
+        for match, covered in candidates:
+            leftover = len([i for i in content if i not in covered])
+            coverage = 1.0 if not leftover else 0.6 * len(covered) / (len(covered) + leftover)
+            confidence = round(match.confidence * coverage, 3)
+            if resolved is None or confidence > resolved.confidence:
+                resolved = IngredientMatch(match.canonical_id, match.name, confidence, match.method,
+                                           min(covered), max(covered) + 1)
+        return resolved
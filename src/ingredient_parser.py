@@ -0,0 +1,184 @@
+import re
+import logging
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+from src.ingredient_index import DESCRIPTOR_WORDS, UNIT_WORDS, name_tokens, raw_tokens
+
+logger = logging.getLogger(__name__)
+
+# Names that contain "and" but are one food; anything else is split ("salt and pepper")
+AND_COMPOUNDS = {
+    "half and half", "macaroni and cheese", "mac and cheese", "fish and chips", "sweet and sour",
+    "salt and vinegar", "peanut butter and jelly", "surf and turf", "bread and butter", "pork and beans",
+}
+QUANTITY_UNITS = UNIT_WORDS - {"of", "a", "an", "some", "x"}
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3, "⅛": 0.125}
+
+# "- ", "* ", "• ", "1. ", "2) " at the start of a line; "1.5 cups" is a quantity, not a list marker
+_LIST_MARKER_RE = re.compile(r"^\s*(?:[-*•+]|\d{1,2}[.)])\s+")
+_MARKDOWN_RE = re.compile(r"\*\*|__|`|^#+\s*")
+# "Vegetables: carrots, peas" -> "carrots, peas"
+_LABEL_RE = re.compile(r"^[a-z][a-z /&-]{0,40}:\s+(?=\S)", re.IGNORECASE)
+_AMOUNT = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d+(?:\.\d+)?(?:\s*[½¼¾⅓⅔⅛])?|[½¼¾⅓⅔⅛])"
+_QUANTITY_RE = re.compile(rf"^(?P<amount>{_AMOUNT})(?:\s*(?:-|–|to)\s*{_AMOUNT})?(?![\d%/.,])(?P<space>\s*)(?P<rest>.*)$")
+_UNIT_RE = re.compile(r"^(?P<unit>[a-z]+)\.?(?:\s+|$)(?P<rest>.*)$", re.IGNORECASE)
+# A weight or volume given in parentheses: "chicken breast (about 150 g)"
+_PAREN_QUANTITY_RE = re.compile(rf"\((?:[^)]*?\s)?(?P<amount>{_AMOUNT})\s*(?P<unit>[a-z]+)\b[^)]*\)", re.IGNORECASE)
+_PARENS_RE = re.compile(r"\([^)]*\)?")
+_AND_RE = re.compile(r"\s+(?:and|&)\s+", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class IngredientRecord:
+    """One ingredient parsed from model output."""
+    name: str  # lowercased, without quantity or markdown: "cherry tomatoes"
+    text: str  # the item as written, without list markers: "1 cup cherry tomatoes, halved"
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+
+
+def _amount(text: str) -> float:
+    text = text.strip()
+    if " " in text and "/" in text:
+        whole, fraction = text.split(None, 1)
+        return float(whole) + _amount(fraction)
+    if "/" in text:
+        numerator, denominator = text.split("/")
+        return float(numerator) / float(denominator) if float(denominator) else float(numerator)
+    if text[-1] in _FRACTIONS:
+        return (float(text[:-1]) if text[:-1].strip() else 0.0) + _FRACTIONS[text[-1]]
+    return float(text)
+
+
+def split_quantity(item: str) -> Tuple[str, Optional[float], Optional[str]]:
+    """
+    Separate a leading or parenthesized quantity from an ingredient.
+
+    Only a number followed by whitespace or a known unit counts, so names that
+    start with a digit ("7up", "2% milk") are left alone.
+
+    :param item: One ingredient, e.g. "200g chicken breast" or "2 cups of rice".
+    :return: The remaining text, the amount and its unit (either may be None).
+    """
+    quantity, unit = None, None
+    match = _QUANTITY_RE.match(item)
+    if match:
+        rest = match.group("rest")
+        unit_match = _UNIT_RE.match(rest)
+        if unit_match and unit_match.group("unit").lower() in QUANTITY_UNITS:
+            quantity, unit = _amount(match.group("amount")), unit_match.group("unit").lower()
+            item = unit_match.group("rest")
+        elif match.group("space") and rest:
+            quantity = _amount(match.group("amount"))
+            item = rest
+        if quantity is not None:
+            item = re.sub(r"^(?:of|x)\s+", "", item, flags=re.IGNORECASE)
+
+    if quantity is None:
+        paren = _PAREN_QUANTITY_RE.search(item)
+        if paren and paren.group("unit").lower() in QUANTITY_UNITS:
+            quantity, unit = _amount(paren.group("amount")), paren.group("unit").lower()
+    return item, quantity, unit
+
+
+def _split_top_level(text: str, separators: str = ",;") -> List[str]:
+    # Commas inside parentheses belong to the item: "cheese (cheddar, mozzarella)"
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth = max(0, depth - 1)
+        elif char in separators and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return parts
+
+
+class IngredientStreamParser:
+    """
+    Incremental parser for model-written ingredient lists.
+
+    Text is fed in chunks as it streams; every line is parsed as soon as its
+    newline arrives, so callers can act on the first ingredients while the
+    model is still writing the rest. Handles markdown bullets and numbered
+    lists, headings and "Label: a, b" lines, comma- and "and"-separated items
+    and leading quantities. Descriptor-only parts ("tomatoes, sliced", "salt,
+    to taste") stay with their ingredient, and each name is emitted once.
+    """
+
+    def __init__(self, compounds: Iterable[str] = AND_COMPOUNDS):
+        self._compounds = {f" {' '.join(name_tokens(name))} " for name in compounds}
+        self._buffer = ""
+        self._seen: Set[str] = set()
+
+    def feed(self, chunk: str) -> List[IngredientRecord]:
+        """
+        :param chunk: The next piece of streamed text.
+        :return: Ingredients from the lines this chunk completed.
+        """
+        self._buffer += chunk
+        if "\n" not in chunk:
+            return []
+        *lines, self._buffer = self._buffer.split("\n")
+        return [record for line in lines for record in self._parse_line(line)]
+
+    def close(self) -> List[IngredientRecord]:
+        """:return: Ingredients from the last, unterminated line."""
+        line, self._buffer = self._buffer, ""
+        return self._parse_line(line)
+
+    def _parse_line(self, line: str) -> List[IngredientRecord]:
+        line = _MARKDOWN_RE.sub("", _LIST_MARKER_RE.sub("", line)).strip()
+        if not line or line.endswith(":"):
+            # Blank lines and headings ("Ingredients:", "**Vegetables:**")
+            return []
+        line = _LABEL_RE.sub("", line)
+
+        records = []
+        for item in self._items(line):
+            record = self._record(item)
+            if record is not None and record.name not in self._seen:
+                self._seen.add(record.name)
+                records.append(record)
+        return records
+
+    def _items(self, line: str) -> List[str]:
+        items: List[str] = []
+        for part in _split_top_level(line):
+            part = re.sub(r"^(?:and|&)\s+", "", part.strip(), flags=re.IGNORECASE)
+            if not part:
+                continue
+            if items and all(token in DESCRIPTOR_WORDS for token in raw_tokens(part)):
+                items[-1] = f"{items[-1]}, {part}"
+                continue
+            items.extend(self._split_and(part))
+        return items
+
+    def _split_and(self, item: str) -> List[str]:
+        words = f" {' '.join(name_tokens(item.replace('&', ' and ')))} "
+        if any(compound in words for compound in self._compounds):
+            return [item]
+        return [part for part in _AND_RE.split(item) if part.strip()]
+
+    def _record(self, item: str) -> Optional[IngredientRecord]:
+        text = item.strip().rstrip(".;:").strip()
+        rest, quantity, unit = split_quantity(text)
+        name = _PARENS_RE.sub(" ", _split_top_level(rest)[0])
+        name = " ".join(name.lower().split()).strip(" .;:-*•")
+        if len(name) <= 2:  # Ignore very short items
+            return None
+        return IngredientRecord(name=name, text=text, quantity=quantity, unit=unit)
+
+
+def parse_ingredients(text: str, compounds: Iterable[str] = AND_COMPOUNDS) -> List[IngredientRecord]:
+    """
+    Parse a complete ingredient list.
+
+    :param text: Model output, e.g. "- 2 eggs\\n- salt and pepper".
+    :param compounds: Names containing "and" that are kept whole.
+    :return: One record per distinct ingredient, in order of appearance.
+    """
+    parser = IngredientStreamParser(compounds)
+    return parser.feed(text) + parser.close()
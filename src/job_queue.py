@@ -0,0 +1,244 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+import contextvars
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+from src.tracing import metrics, record_stage
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+JOBS = metrics.counter("nourishbot_jobs_total", "Interactive jobs by outcome (completed, failed, cancelled, rejected).")
+
+_DONE = object()
+
+
+class QueueFullError(Exception):
+    """Raised by ``JobQueue.submit`` when a job is not admitted; the message is shown to the user."""
+
+
+@dataclass
+class JobUpdate:
+    """One item streamed back to the submitter: a new queue position or a snapshot of the job's output."""
+    position: Optional[int] = None
+    output: Optional[str] = None
+
+
+class Job:
+    """A queued or running call of an async generator, and the updates it produced so far."""
+
+    def __init__(self, job_id: int, user: str, run: Callable[[], AsyncIterator[str]]):
+        self.id = job_id
+        self.user = user
+        self.run = run
+        # The submitter's context variables (e.g. Gradio's event for progress updates), not the worker's
+        self.context = contextvars.copy_context()
+        self.updates: asyncio.Queue = asyncio.Queue()
+        self.enqueued_at = time.monotonic()
+        self.task: Optional[asyncio.Task] = None
+        self.position: Optional[int] = None
+        self.cancelled = False
+
+
+class JobQueue:
+    """
+    Bounded job queue in front of the analysis pipeline, drained by a fixed pool of workers.
+
+    Jobs wait in one FIFO per user and workers take them round-robin across
+    users, so a user who uploads a burst only delays their own jobs. Admission
+    is decided up front: when ``max_depth`` jobs are already waiting, or the
+    user has ``max_per_user`` jobs queued or running, ``submit`` raises
+    ``QueueFullError`` immediately instead of letting the request time out.
+    Waiting jobs are told their position whenever it changes, and a job whose
+    submitter goes away is dropped from the queue or, once running, cancelled.
+    Jobs run in a copy of their submitter's context, so context variables such
+    as the current trace or Gradio's progress target follow the request.
+
+    Workers are asyncio tasks on the loop that submits the first job: the
+    pipeline spends its time waiting on Gemini, and the rate limiter already
+    holds calls beyond the API quota, so more workers than the quota allows
+    only queue there instead of here.
+    """
+
+    def __init__(self, workers: int = 8, max_depth: int = 64, max_per_user: int = 4):
+        if workers < 1:
+            raise ValueError(f"JOB_WORKERS must be at least 1, got {workers}")
+        self.workers = workers
+        self.max_depth = max_depth
+        self.max_per_user = max_per_user
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._pending: "OrderedDict[str, Deque[Job]]" = OrderedDict()
+        self._active: Dict[str, int] = {}
+        self._available: Optional[asyncio.Semaphore] = None
+        self._ids = itertools.count(1)
+        self.running = 0
+
+    @classmethod
+    def from_env(cls) -> "JobQueue":
+        """Build from JOB_WORKERS, JOB_MAX_QUEUE_DEPTH and JOB_MAX_PER_USER."""
+        return cls(
+            workers=int(os.getenv("JOB_WORKERS", 8)),
+            max_depth=int(os.getenv("JOB_MAX_QUEUE_DEPTH", 64)),
+            max_per_user=int(os.getenv("JOB_MAX_PER_USER", 4)),
+        )
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting for a worker."""
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First job, or the previous loop is gone (e.g. successive asyncio.run calls)
+        self._loop = loop
+        self._pending.clear()
+        self._active.clear()
+        self.running = 0
+        self._available = asyncio.Semaphore(0)
+        # Workers get an empty context; each job brings its submitter's
+        self._worker_tasks = [loop.create_task(self._worker(), context=contextvars.Context()) for _ in range(self.workers)]
+        logger.info(f"✓ Job queue started: {self.workers} workers, max depth {self.max_depth}, "
+                    f"{self.max_per_user} jobs per user")
+
+    def submit(self, user: str, run: Callable[[], AsyncIterator[str]]) -> Job:
+        """
+        Queue a job, or reject it straight away.
+
+        :param user: Key the fairness and per-user limits apply to (e.g. the Gradio session).
+        :param run: Zero-argument function returning the async generator to run.
+        :return: The queued job; pass it to ``stream``.
+        :raises QueueFullError: The queue or the user's share of it is full.
+        """
+        self._start()
+        if self.depth >= self.max_depth:
+            JOBS.inc(outcome="rejected")
+            raise QueueFullError(f"The service is busy ({self.depth} requests waiting). Please try again in a minute.")
+        if self._active.get(user, 0) >= self.max_per_user:
+            JOBS.inc(outcome="rejected")
+            raise QueueFullError(f"You already have {self.max_per_user} requests in progress. "
+                                 "Please wait for one to finish.")
+
+        job = Job(next(self._ids), user, run)
+        self._pending.setdefault(user, deque()).append(job)
+        self._active[user] = self._active.get(user, 0) + 1
+        self._publish_positions()
+        self._available.release()
+        return job
+
+    def _order(self) -> List[Job]:
+        # The order workers will take the waiting jobs in: one per user per round
+        queues = [list(jobs) for jobs in self._pending.values()]
+        return [job for round_ in itertools.zip_longest(*queues) for job in round_ if job is not None]
+
+    def _publish_positions(self):
+        for position, job in enumerate(self._order(), 1):
+            if job.position != position:
+                job.position = position
+                job.updates.put_nowait(JobUpdate(position=position))
+
+    def _next_job(self) -> Optional[Job]:
+        if not self._pending:
+            return None
+        user, jobs = next(iter(self._pending.items()))
+        job = jobs.popleft()
+        # The user goes to the back of the rotation; users with nothing left leave it
+        del self._pending[user]
+        if jobs:
+            self._pending[user] = jobs
+        return job
+
+    def _release(self, job: Job):
+        remaining = self._active.get(job.user, 0) - 1
+        if remaining > 0:
+            self._active[job.user] = remaining
+        else:
+            self._active.pop(job.user, None)
+
+    async def _run(self, job: Job):
+        async for output in job.run():
+            job.updates.put_nowait(JobUpdate(output=output))
+
+    async def _worker(self):
+        while True:
+            await self._available.acquire()
+            job = self._next_job()
+            if job is None:
+                # A queued job was cancelled after its release
+                continue
+            self._publish_positions()
+            job.context.run(record_stage, "queue_wait", time.monotonic() - job.enqueued_at)
+
+            self.running += 1
+            job.task = self._loop.create_task(self._run(job), context=job.context)
+            try:
+                # wait() rather than await: a cancelled job must not stop the worker
+                await asyncio.wait({job.task})
+            finally:
+                self.running -= 1
+                self._release(job)
+
+            if job.task.cancelled():
+                JOBS.inc(outcome="cancelled")
+                continue
+            error = job.task.exception()
+            JOBS.inc(outcome="failed" if error is not None else "completed")
+            job.updates.put_nowait(error if error is not None else _DONE)
+
+    def cancel(self, job: Job):
+        """
+        Drop a job that is still queued or stop it if it is running. Finished jobs are left alone.
+
+        :param job: Job returned by ``submit``.
+        """
+        if job.cancelled or (job.task is not None and job.task.done()):
+            return
+        job.cancelled = True
+        if job.task is not None:
+            job.task.cancel()
+            logger.info(f"Cancelled running job {job.id} for {job.user}")
+            return
+
+        jobs = self._pending.get(job.user)
+        if jobs is not None and job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self._pending[job.user]
+            self._release(job)
+            JOBS.inc(outcome="cancelled")
+            self._publish_positions()
+            logger.info(f"Dropped queued job {job.id} for {job.user}")
+
+    async def stream(self, job: Job) -> AsyncIterator[JobUpdate]:
+        """
+        Follow a job: its queue positions while it waits, then its output. Closing
+        the iterator, or cancelling the task consuming it, cancels the job.
+
+        :param job: Job returned by ``submit``.
+        :return: Async iterator of updates; ends when the job finishes and re-raises its error.
+        """
+        try:
+            while True:
+                update = await job.updates.get()
+                if update is _DONE:
+                    return
+                if isinstance(update, BaseException):
+                    raise update
+                yield update
+        finally:
+            self.cancel(job)
+
+    def stats(self) -> Dict[str, int]:
+        return {"queued": self.depth, "running": self.running, "users": len(self._active)}
+
+
+@lazy_singleton
+def get_job_queue() -> JobQueue:
+    """The shared queue behind the UI, built from the environment on first use."""
+    return JobQueue.from_env()
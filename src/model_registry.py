@@ -0,0 +1,203 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import List, Optional, Tuple
+from src.prompts import measure_tokens, token_report
+from src.settings import configure_genai, lazy_singleton
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Fallback order used when the model list cannot be fetched
+MODEL_PRIORITY = [
+    'gemini-2.0-flash',
+    'gemini-1.5-flash',
+    'gemini-1.5-pro',
+    'gemini-pro',
+    'gemini-pro-vision',
+]
+
+DEFAULT_TTL_SECONDS = 3600
+
+
+class ModelRegistry:
+    """
+    Process-wide registry that resolves the Gemini model once and hands out
+    the cached ``GenerativeModel`` to every tool call.
+
+    The resolved model is kept until the TTL expires or a caller reports it
+    missing or not permitted through ``invalidate()``; the next ``get_model()``
+    then resolves again.
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None, preferred_model: Optional[str] = None):
+        """
+        :param ttl_seconds: Seconds before the resolved model is refreshed. Defaults to MODEL_REGISTRY_TTL_SECONDS.
+        :param preferred_model: Model to use when available. Defaults to GEMINI_MODEL.
+        """
+        if ttl_seconds is None:
+            ttl_seconds = float(os.getenv("MODEL_REGISTRY_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+        self.ttl_seconds = ttl_seconds
+        self.preferred_model = preferred_model if preferred_model is not None else os.getenv("GEMINI_MODEL")
+        self._lock = threading.Lock()
+        self._model = None
+        self._model_name: Optional[str] = None
+        self._candidates: List[str] = []
+        self._resolved_at = 0.0
+        self._pinned = False
+        self._fallbacks = {}
+
+    @property
+    def active_model_name(self) -> Optional[str]:
+        """Name of the model currently handed out, or None if nothing is resolved yet."""
+        return self._model_name
+
+    @property
+    def candidates(self) -> List[str]:
+        """Model names usable for generateContent, in the order they will be tried."""
+        return list(self._candidates)
+
+    def _is_stale(self) -> bool:
+        if self._model is None:
+            return True
+        if self._pinned:
+            return False
+        return self.ttl_seconds > 0 and (time.monotonic() - self._resolved_at) > self.ttl_seconds
+
+    def _discover_candidates(self) -> List[str]:
+        """List the models that support generateContent, falling back to MODEL_PRIORITY."""
+        genai = configure_genai()
+        candidates = []
+        try:
+            for model in genai.list_models():
+                if 'generateContent' in model.supported_generation_methods:
+                    candidates.append(model.name.replace('models/', ''))
+        except Exception as e:
+            logger.warning(f"Could not list models: {str(e)}")
+
+        if not candidates:
+            candidates = list(MODEL_PRIORITY)
+
+        if self.preferred_model:
+            if self.preferred_model in candidates:
+                candidates.remove(self.preferred_model)
+            candidates.insert(0, self.preferred_model)
+        return candidates
+
+    def _resolve(self):
+        with span("model_resolve"):
+            self._resolve_candidates()
+
+    def _resolve_candidates(self):
+        candidates = self._discover_candidates()
+        genai = configure_genai()
+        for model_name in candidates:
+            try:
+                model = genai.GenerativeModel(model_name)
+            except Exception as e:
+                logger.debug(f"Model {model_name} not available: {str(e)}")
+                continue
+            self._model = model
+            self._model_name = model_name
+            self._candidates = candidates
+            self._resolved_at = time.monotonic()
+            logger.info(f"✓ Using model: {model_name}")
+            return
+
+        raise Exception("No compatible Gemini vision models available. Check your API key and enabled APIs.")
+
+    def get_model(self):
+        """
+        Return the cached model, resolving it first if missing or stale.
+
+        :return: A ``genai.GenerativeModel`` instance.
+        """
+        if self._is_stale():
+            with self._lock:
+                if self._is_stale():
+                    self._resolve()
+        return self._model
+
+    async def get_model_async(self):
+        """
+        Async variant of ``get_model``. Discovery runs in a worker thread so
+        the event loop is only blocked when nothing is cached yet.
+
+        :return: A ``genai.GenerativeModel`` instance.
+        """
+        if self._is_stale():
+            return await asyncio.to_thread(self.get_model)
+        return self._model
+
+    def warm_up(self):
+        """
+        Resolve the model eagerly, e.g. at application startup, and count the
+        prompt prefixes with its tokenizer so token figures are measured, not estimated.
+        """
+        try:
+            model = self.get_model()
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {str(e)}")
+            return
+        measure_tokens(model)
+        logger.info("Prompt prefix sizes:\n" + token_report())
+
+    def fallback_models(self, limit: int) -> List[Tuple[str, object]]:
+        """
+        Models to try after the active one, in candidate order.
+
+        :param limit: Maximum number of fallbacks to return.
+        :return: ``(model_name, model)`` pairs, built on first use and reused afterwards.
+        """
+        with self._lock:
+            names = [name for name in self._candidates if name != self._model_name]
+        fallbacks = []
+        for model_name in names:
+            if len(fallbacks) >= limit:
+                break
+            model = self._fallbacks.get(model_name)
+            if model is None:
+                try:
+                    model = configure_genai().GenerativeModel(model_name)
+                except Exception as e:
+                    logger.debug(f"Fallback model {model_name} not available: {str(e)}")
+                    continue
+                self._fallbacks[model_name] = model
+            fallbacks.append((model_name, model))
+        return fallbacks
+
+    def pin(self, model, model_name: str):
+        """
+        Serve a specific model object until ``invalidate()`` is called,
+        bypassing discovery and the TTL (e.g. a local stand-in for load tests).
+
+        :param model: Object exposing ``generate_content``.
+        :param model_name: Name reported as the active model.
+        """
+        with self._lock:
+            self._model = model
+            self._model_name = model_name
+            self._candidates = [model_name]
+            self._resolved_at = time.monotonic()
+            self._pinned = True
+
+    def invalidate(self, reason: Optional[str] = None):
+        """
+        Drop the cached model so the next call resolves again.
+
+        :param reason: Optional description of the failure, for logging.
+        """
+        with self._lock:
+            if self._model_name:
+                logger.info(f"Invalidating model {self._model_name}" + (f": {reason}" if reason else ""))
+            self._model = None
+            self._model_name = None
+            self._pinned = False
+
+
+@lazy_singleton
+def get_model_registry() -> ModelRegistry:
+    """The process-wide registry, built from the environment on first use."""
+    return ModelRegistry()
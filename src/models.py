@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 
 class Recipe(BaseModel):
     title: str = Field(..., description="Recipe title")
@@ -32,3 +32,66 @@ class NutrientAnalysisOutput(BaseModel):
     nutrients: NutrientBreakdown = Field(default_factory=NutrientBreakdown, description="Detailed nutrient breakdown")
     health_evaluation: Optional[str] = Field(None, description="Health evaluation summary")
 
+
+class CombinedAnalysisOutput(BaseModel):
+    ingredients: List[str] = Field(default_factory=list, description="Ingredients and food items visible in the image")
+    analysis: NutrientAnalysisOutput = Field(default_factory=NutrientAnalysisOutput, description="Nutritional analysis of the dish")
+
+
+class PortionEstimate(BaseModel):
+    name: str = Field(..., description="Generic food name, e.g. 'chicken breast' or 'white rice'")
+    grams: float = Field(..., description="Estimated weight of this food in the portion, in grams")
+
+class PortionAnalysisOutput(BaseModel):
+    dish: Optional[str] = Field(None, description="Identified dish")
+    portion_size: Optional[str] = Field(None, description="Portion size description")
+    items: List[PortionEstimate] = Field(default_factory=list, description="Every food in the portion with its weight")
+
+class CombinedPortionOutput(BaseModel):
+    ingredients: List[str] = Field(default_factory=list, description="Ingredients and food items visible in the image")
+    portions: PortionAnalysisOutput = Field(default_factory=PortionAnalysisOutput, description="Dish and portion estimates")
+
+
+def _to_gemini_schema(node: Dict[str, Any], defs: Dict[str, Any]) -> Dict[str, Any]:
+    if "$ref" in node:
+        resolved = dict(defs[node["$ref"].split("/")[-1]])
+        if "description" in node:
+            resolved["description"] = node["description"]
+        node = resolved
+
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        schema = _to_gemini_schema(options[0], defs)
+        if len(options) < len(node["anyOf"]):
+            schema["nullable"] = True
+        if "description" in node:
+            schema["description"] = node["description"]
+        return schema
+
+    schema = {"type": node["type"]}
+    if "description" in node:
+        schema["description"] = node["description"]
+    if "enum" in node:
+        schema["enum"] = node["enum"]
+    if node["type"] == "object":
+        schema["properties"] = {
+            name: _to_gemini_schema(prop, defs) for name, prop in node.get("properties", {}).items()
+        }
+        if node.get("required"):
+            schema["required"] = node["required"]
+    elif node["type"] == "array":
+        schema["items"] = _to_gemini_schema(node["items"], defs)
+    return schema
+
+
+def gemini_response_schema(model_cls: type) -> Dict[str, Any]:
+    """
+    Convert a Pydantic model into the OpenAPI subset Gemini accepts as a
+    ``response_schema``: references are inlined, Optional fields become
+    ``nullable`` and titles/defaults are dropped.
+
+    :param model_cls: Pydantic model class.
+    :return: Schema dict for ``generation_config["response_schema"]``.
+    """
+    json_schema = model_cls.model_json_schema()
+    return _to_gemini_schema(json_schema, json_schema.get("$defs", {}))
@@ -0,0 +1,197 @@
+import os
+import csv
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from src.ingredient_index import IngredientIndex
+from src.models import MineralInfo, NutrientAnalysisOutput, NutrientBreakdown, PortionEstimate, VitaminInfo
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "config")
+NUTRIENTS_PATH = os.path.join(CONFIG_DIR, "nutrients.csv")
+# Lower-confidence matches (names covering only part of the words, heavy spelling correction) are left out of totals
+MIN_MATCH_CONFIDENCE = 0.7
+
+# Reference daily values (FDA, adults) used for %DV and the health summary
+DAILY_VALUES = {
+    "kcal": 2000, "fats_g": 78, "carbohydrates_g": 275, "fiber_g": 28, "sugar_g": 50, "protein_g": 50,
+    "vitamin_a_ug": 900, "vitamin_c_mg": 90, "calcium_mg": 1300, "iron_mg": 18, "potassium_mg": 4700,
+    "sodium_mg": 2300,
+}
+VITAMINS = (("Vitamin A", "vitamin_a_ug"), ("Vitamin C", "vitamin_c_mg"))
+MINERALS = (("Calcium", "calcium_mg", "mg"), ("Iron", "iron_mg", "mg"),
+            ("Potassium", "potassium_mg", "mg"), ("Sodium", "sodium_mg", "mg"))
+
+
+@dataclass
+class MealTotals:
+    """Summed nutrients for a list of portions, plus the portions that weren't in the table."""
+    values: Dict[str, float]
+    matched: List[Tuple[str, str, float]] = field(default_factory=list)
+    unmatched: List[str] = field(default_factory=list)
+
+    def __getitem__(self, column: str) -> float:
+        return self.values[column]
+
+
+class NutrientTable:
+    """
+    Offline nutrient database (per 100 g) held as a columnar NumPy store.
+
+    Every nutrient is one contiguous float64 column of a Fortran-ordered
+    ``foods x nutrients`` matrix, so a meal total is a single vector-matrix
+    product: ``grams / 100 @ values[rows]``. Food names are resolved through an
+    ``IngredientIndex`` over the table's names and aliases; matches below
+    ``min_confidence`` count as not found rather than borrowing the numbers
+    of a different food.
+    """
+
+    def __init__(self, names: List[str], aliases: List[List[str]], columns: List[str], values: np.ndarray,
+                 min_confidence: float = MIN_MATCH_CONFIDENCE):
+        self.names = names
+        self.columns = columns
+        self.values = np.asfortranarray(values, dtype=np.float64)
+        self.min_confidence = min_confidence
+        self._column_index = {column: i for i, column in enumerate(columns)}
+        self._rows = {name: row for row, name in enumerate(names)}
+        self.index = IngredientIndex((name, [name] + food_aliases) for name, food_aliases in zip(names, aliases))
+
+    @classmethod
+    def from_csv(cls, path: str = NUTRIENTS_PATH, min_confidence: Optional[float] = None) -> "NutrientTable":
+        """
+        :param path: CSV of foods, ``;``-separated aliases and nutrients per 100 g.
+        :param min_confidence: Match threshold; defaults to INGREDIENT_MATCH_MIN_CONFIDENCE.
+        """
+        if min_confidence is None:
+            min_confidence = float(os.getenv("INGREDIENT_MATCH_MIN_CONFIDENCE", MIN_MATCH_CONFIDENCE))
+        with open(path, 'r', newline='') as f:
+            reader = csv.reader(line for line in f if line.strip() and not line.startswith("#"))
+            header = next(reader)
+            rows = list(reader)
+        columns = header[2:]
+        table = cls(
+            names=[row[0].strip() for row in rows],
+            aliases=[[alias.strip() for alias in row[1].split(";") if alias.strip()] for row in rows],
+            columns=columns,
+            values=np.array([[float(value) for value in row[2:]] for row in rows], dtype=np.float64).reshape(-1, len(columns)),
+            min_confidence=min_confidence,
+        )
+        logger.info(f"✓ Loaded nutrient table: {len(table.names)} foods, {len(columns)} nutrients")
+        return table
+
+    def column(self, name: str) -> np.ndarray:
+        """:return: One nutrient (per 100 g) for every food in the table."""
+        return self.values[:, self._column_index[name]]
+
+    def lookup(self, food: str) -> Optional[int]:
+        """:return: The table row for a free-form food name, or None if it isn't confidently in the table."""
+        match = self.index.resolve(food)
+        if match is None or match.confidence < self.min_confidence:
+            return None
+        return self._rows[match.canonical_id]
+
+    def match(self, food: str) -> Optional[str]:
+        """
+        :param food: Free-form food name, e.g. "2 grilled chicken breasts".
+        :return: The table's name for it ("chicken breast"), or None if it isn't in the table.
+        """
+        row = self.lookup(food)
+        return None if row is None else self.names[row]
+
+    def totals(self, portions: Sequence[PortionEstimate]) -> MealTotals:
+        """
+        Sum the nutrients of every portion found in the table.
+
+        :param portions: Food names with their estimated weight in grams.
+        :return: Totals per nutrient column, which portions matched and which didn't.
+        """
+        rows, grams, matched, unmatched = [], [], [], []
+        for portion in portions:
+            row = self.lookup(portion.name)
+            if row is None or portion.grams <= 0:
+                unmatched.append(portion.name)
+                continue
+            rows.append(row)
+            grams.append(portion.grams)
+            matched.append((portion.name, self.names[row], portion.grams))
+
+        if rows:
+            sums = np.asarray(grams, dtype=np.float64) / 100.0 @ self.values[rows]
+        else:
+            sums = np.zeros(len(self.columns))
+        return MealTotals(dict(zip(self.columns, sums.tolist())), matched, unmatched)
+
+    def analyze(self, portions: Sequence[PortionEstimate], dish: Optional[str] = None,
+                portion_size: Optional[str] = None) -> NutrientAnalysisOutput:
+        """
+        Build a nutrient analysis from portion estimates without calling the model.
+
+        :param portions: Food names with their estimated weight in grams.
+        :param dish: Identified dish.
+        :param portion_size: Description of the whole portion.
+        :return: Calories, macros, key vitamins (%DV) and minerals, and a health summary.
+        """
+        totals = self.totals(portions)
+        if totals.unmatched:
+            logger.info(f"Not in nutrient table: {', '.join(totals.unmatched)}")
+        if not totals.matched:
+            return NutrientAnalysisOutput(dish=dish, portion_size=portion_size,
+                                          health_evaluation=health_summary(totals))
+        return NutrientAnalysisOutput(
+            dish=dish,
+            portion_size=portion_size,
+            estimated_calories=round(totals["kcal"]),
+            nutrients=NutrientBreakdown(
+                protein=f"{totals['protein_g']:.1f}g",
+                carbohydrates=f"{totals['carbohydrates_g']:.1f}g",
+                fats=f"{totals['fats_g']:.1f}g",
+                vitamins=[VitaminInfo(name=name, percentage_dv=f"{100 * totals[column] / DAILY_VALUES[column]:.0f}%")
+                          for name, column in VITAMINS],
+                minerals=[MineralInfo(name=name, amount=f"{totals[column]:.1f}{unit}" if totals[column] < 10
+                                      else f"{totals[column]:.0f}{unit}")
+                          for name, column, unit in MINERALS],
+            ),
+            health_evaluation=health_summary(totals),
+        )
+
+
+def health_summary(totals: MealTotals) -> str:
+    """
+    Deterministic one-paragraph evaluation of a meal from its totals.
+
+    :param totals: Output of ``NutrientTable.totals``.
+    :return: Energy split, notable highs and lows against daily values, and any foods left out.
+    """
+    if not totals.matched:
+        return "None of the identified foods are in the nutrient table, so no totals could be computed."
+
+    energy = {"protein": 4 * totals["protein_g"], "carbohydrates": 4 * totals["carbohydrates_g"],
+              "fat": 9 * totals["fats_g"]}
+    energy_total = sum(energy.values()) or 1.0
+    sentences = [
+        f"About {totals['kcal']:.0f} kcal ({100 * totals['kcal'] / DAILY_VALUES['kcal']:.0f}% of a 2,000 kcal day), "
+        + ", ".join(f"{100 * value / energy_total:.0f}% from {name}" for name, value in energy.items()) + "."
+    ]
+
+    highs = [label for label, column in (("sodium", "sodium_mg"), ("sugar", "sugar_g"), ("fat", "fats_g"))
+             if totals[column] >= 0.4 * DAILY_VALUES[column]]
+    goods = [label for label, column in (("protein", "protein_g"), ("fiber", "fiber_g"),
+                                         ("vitamin C", "vitamin_c_mg"), ("vitamin A", "vitamin_a_ug"),
+                                         ("potassium", "potassium_mg"), ("calcium", "calcium_mg"))
+             if totals[column] >= 0.2 * DAILY_VALUES[column]]
+    if goods:
+        sentences.append(f"Good source of {', '.join(goods)}.")
+    if highs:
+        sentences.append(f"High in {', '.join(highs)} (40% or more of the daily value).")
+    if totals.unmatched:
+        sentences.append(f"Not included in the totals: {', '.join(totals.unmatched)}.")
+    return " ".join(sentences)
+
+
+@lazy_singleton
+def get_nutrient_db() -> NutrientTable:
+    """The bundled nutrient table, loaded on first use."""
+    return NutrientTable.from_csv()
@@ -0,0 +1,225 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from src.cache import env_flag
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II basis, so a 2-D DCT is ``D @ X @ D.T``."""
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0, :] = np.sqrt(1.0 / n)
+    return matrix
+
+
+_DCT_CACHE: Dict[int, np.ndarray] = {}
+
+
+def _pack_bits(bits: np.ndarray) -> int:
+    value = 0
+    for byte in np.packbits(bits.astype(np.uint8).ravel()):
+        value = (value << 8) | int(byte)
+    return value
+
+
+def _grayscale(img, size: Tuple[int, int]) -> np.ndarray:
+    small = img.convert("L").resize(size, Image.Resampling.LANCZOS)
+    return np.asarray(small, dtype=np.float64)
+
+
+def dhash(img, hash_size: int = 8) -> int:
+    """
+    Difference hash: compares horizontally adjacent pixels of a downscaled
+    grayscale image.
+
+    :param img: A PIL image.
+    :param hash_size: Side of the hash grid; the hash has ``hash_size ** 2`` bits.
+    :return: The hash as an integer.
+    """
+    pixels = _grayscale(img, (hash_size + 1, hash_size))
+    return _pack_bits(pixels[:, 1:] > pixels[:, :-1])
+
+
+def phash(img, hash_size: int = 8, highfreq_factor: int = 4) -> int:
+    """
+    Perceptual hash: thresholds the low-frequency DCT coefficients of a
+    downscaled grayscale image against their median.
+
+    :param img: A PIL image.
+    :param hash_size: Side of the low-frequency block; the hash has ``hash_size ** 2`` bits.
+    :param highfreq_factor: Oversampling factor of the image before the DCT.
+    :return: The hash as an integer.
+    """
+    size = hash_size * highfreq_factor
+    dct = _DCT_CACHE.get(size)
+    if dct is None:
+        dct = _DCT_CACHE.setdefault(size, _dct_matrix(size))
+    pixels = _grayscale(img, (size, size))
+    low = (dct @ pixels @ dct.T)[:hash_size, :hash_size]
+    return _pack_bits(low > np.median(low))
+
+
+HASH_FUNCTIONS = {"phash": phash, "dhash": dhash}
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance, for
+    finding every stored hash within a radius without a linear scan.
+    """
+
+    def __init__(self):
+        # Node layout: [hash, values, {distance: child}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, hash_value: int, value: Any):
+        self._size += 1
+        if self._root is None:
+            self._root = [hash_value, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming_distance(hash_value, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_value, [value], {}]
+                return
+            node = child
+
+    def search(self, hash_value: int, max_distance: int) -> List[Tuple[int, Any]]:
+        """
+        :return: ``(distance, value)`` pairs within ``max_distance``, closest first.
+        """
+        if self._root is None:
+            return []
+        matches = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            distance = hamming_distance(hash_value, node[0])
+            if distance <= max_distance:
+                matches.extend((distance, value) for value in node[1])
+            low, high = distance - max_distance, distance + max_distance
+            stack.extend(child for d, child in node[2].items() if low <= d <= high)
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class PerceptualIndex:
+    """
+    Near-duplicate lookup for images. Each namespace (prompt + model) has its
+    own BK-tree mapping perceptual hashes to result-cache keys, so a re-encoded
+    or resized copy of an analyzed photo resolves to the earlier result.
+    """
+
+    def __init__(self, enabled: bool = True, max_distance: int = 6,
+                 algorithm: str = "phash", max_entries: int = 4096):
+        """
+        :param enabled: Whether lookups and inserts do anything.
+        :param max_distance: Largest Hamming distance (out of 64 bits) treated as the same image.
+        :param algorithm: ``phash`` or ``dhash``.
+        :param max_entries: Entries kept per namespace; the oldest are dropped beyond this.
+        """
+        if algorithm not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown perceptual hash algorithm: {algorithm}")
+        self.enabled = enabled
+        self.max_distance = max_distance
+        self.algorithm = algorithm
+        self.max_entries = max_entries
+        self._hash = HASH_FUNCTIONS[algorithm]
+        self._lock = threading.Lock()
+        self._trees: Dict[str, BKTree] = {}
+        self._entries: Dict[str, "OrderedDict[Any, int]"] = {}
+        self._counters = {"near_hits": 0, "near_misses": 0}
+
+    @classmethod
+    def from_env(cls) -> "PerceptualIndex":
+        """Build an index from ENABLE_CACHE, PHASH_MAX_DISTANCE and PHASH_ALGORITHM."""
+        return cls(
+            enabled=env_flag("ENABLE_CACHE"),
+            max_distance=int(os.getenv("PHASH_MAX_DISTANCE", 6)),
+            algorithm=os.getenv("PHASH_ALGORITHM", "phash"),
+        )
+
+    def hash_image(self, img) -> int:
+        return self._hash(img)
+
+    def lookup(self, namespace: str, image_hash: int) -> Optional[Any]:
+        """
+        Find the closest stored value within ``max_distance``.
+
+        :param namespace: Prompt/model namespace.
+        :param image_hash: Hash from ``hash_image``.
+        :return: The stored value, or None if nothing is close enough.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            tree = self._trees.get(namespace)
+            matches = tree.search(image_hash, self.max_distance) if tree else []
+            self._counters["near_hits" if matches else "near_misses"] += 1
+        if matches:
+            distance, value = matches[0]
+            logger.info(f"✓ Near-duplicate image found (distance {distance})")
+            return value
+        return None
+
+    def add(self, namespace: str, image_hash: int, value: Any):
+        """Remember ``value`` for images perceptually close to ``image_hash``."""
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self._entries.setdefault(namespace, OrderedDict())
+            if entries.get(value) == image_hash:
+                entries.move_to_end(value)
+                return
+            entries[value] = image_hash
+            entries.move_to_end(value)
+            if len(entries) > self.max_entries:
+                # BK-trees do not support deletion, so rebuild from the newest entries
+                while len(entries) > self.max_entries // 2:
+                    entries.popitem(last=False)
+                tree = BKTree()
+                for stored_value, stored_hash in entries.items():
+                    tree.add(stored_hash, stored_value)
+                self._trees[namespace] = tree
+            else:
+                self._trees.setdefault(namespace, BKTree()).add(image_hash, value)
+
+    def clear(self):
+        with self._lock:
+            self._trees.clear()
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["entries"] = sum(len(tree) for tree in self._trees.values())
+        counters["max_distance"] = self.max_distance
+        counters["algorithm"] = self.algorithm
+        return counters
+
+
+@lazy_singleton
+def get_perceptual_index() -> PerceptualIndex:
+    """The shared near-duplicate index, built from the environment on first use."""
+    return PerceptualIndex.from_env()
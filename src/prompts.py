@@ -0,0 +1,173 @@
+import re
+import logging
+import textwrap
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from src.rate_limiter import CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+_INNER_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}")
+
+
+def compact(text: str) -> str:
+    """
+    Drop whitespace that costs tokens but carries no meaning: indentation
+    from triple-quoted source, repeated and trailing spaces and runs of blank lines.
+    Indentation of list items ("   - **Protein**") is kept.
+
+    :param text: Prompt text.
+    :return: The compacted text.
+    """
+    lines = [_INNER_SPACES_RE.sub(" ", line.rstrip()) for line in textwrap.dedent(text).strip().splitlines()]
+    lines = [line if line.lstrip().startswith(("-", "*")) else line.lstrip() for line in lines]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    """
+    A prompt split into a fixed prefix and a per-call suffix.
+
+    The prefix is identical on every call, so it is what context caching can
+    share between requests; the suffix holds the ``{placeholders}``. Keeping
+    every placeholder out of the prefix is what makes a template cacheable.
+    """
+    name: str
+    prefix: str
+    suffix: str = ""
+
+    def __post_init__(self):
+        object.__setattr__(self, "prefix", compact(self.prefix) + ("\n\n" if self.suffix else ""))
+        object.__setattr__(self, "suffix", compact(self.suffix))
+
+    @property
+    def text(self) -> str:
+        """The whole template; for templates without placeholders, the prompt itself."""
+        return self.prefix + self.suffix
+
+    def render(self, **values) -> str:
+        """
+        :param values: Values for the suffix's placeholders.
+        :return: The prompt to send.
+        """
+        return self.prefix + self.suffix.format(**values)
+
+    @property
+    def prefix_tokens(self) -> int:
+        """Tokens of the fixed prefix: measured with ``measure_tokens`` if it has run, else estimated."""
+        return _measured.get(self.name) or estimate_tokens(self.prefix)
+
+
+EXTRACTION = PromptTemplate("extraction", """
+    Analyze this image and extract all the ingredients or food items you can see.
+    List each ingredient on a new line. Be specific and detailed.
+    Only list the ingredients, nothing else.
+""")
+
+# Instructions first and the per-call lists last, so every call shares the prefix
+DIETARY_FILTER = PromptTemplate("dietary_filter", """
+    You are an AI nutritionist specialized in dietary restrictions.
+    Decide for each ingredient below whether it complies with the dietary restriction.
+    Return ONLY a JSON object mapping each ingredient, spelled exactly as given, to true if it complies or false if it does not.
+    If an ingredient is uncertain, mark it true.
+""", """
+    Dietary restriction: {dietary_restrictions}
+
+    Ingredients, one per line:
+    {ingredients}
+""")
+
+# The disclaimer is appended locally (NUTRITION_DISCLAIMER) instead of being generated on every call
+NUTRITION = PromptTemplate("nutrition", """
+    You are an expert nutritionist. Analyze the food in this image and answer in Markdown with these sections:
+
+    1. **Identification**: Each identified food item, one per line.
+
+    2. **Portion Size & Calorie Estimation**: One bullet per food item:
+       - **[Food Item]**: [Portion Size], [Number of Calories] calories
+
+    3. **Total Calories**: Total Calories: [Number]
+
+    4. **Nutrient Breakdown**:
+       - **Protein**: [Food contributions] = [Total]
+       - **Carbohydrates**: [Food contributions] = [Total]
+       - **Fats**: [Food contributions] = [Total]
+       - **Vitamins**: Key vitamins with %DV
+       - **Minerals**: Key minerals with amounts
+
+    5. **Health Evaluation**: One paragraph on how healthy the meal is.
+""")
+
+NUTRITION_DISCLAIMER = compact("""
+    6. **Disclaimer**:
+    The nutritional information and calorie estimates provided are approximate and are based on general food data.
+    Actual values may vary depending on factors such as portion size, specific ingredients, preparation methods, and individual variations.
+    For precise dietary advice or medical guidance, consult a qualified nutritionist or healthcare provider.
+""")
+
+COMBINED = PromptTemplate("combined", """
+    You are an expert nutritionist. Analyze the food in this image and return JSON with:
+    - ingredients: every ingredient or food item you can see, one short name per entry.
+    - analysis: the identified dish, its portion size, the estimated calories for the whole portion,
+      a nutrient breakdown (protein, carbohydrates and fats with units, key vitamins with %DV,
+      key minerals with amounts) and a one-paragraph health evaluation.
+""")
+
+PORTION = PromptTemplate("portion", """
+    You are an expert nutritionist. Identify the food in this image and return JSON with:
+    - dish: the identified dish.
+    - portion_size: a short description of the whole portion.
+    - items: every food in the portion, each with a plain generic name (e.g. "chicken breast", "white rice")
+      and its estimated weight in grams. Do not estimate calories or nutrients.
+""")
+
+COMBINED_PORTION = PromptTemplate("combined_portion", """
+    You are an expert nutritionist. Analyze the food in this image and return JSON with:
+    - ingredients: every ingredient or food item you can see, one short name per entry.
+    - portions: the identified dish, a short description of the whole portion, and every food in the portion,
+      each with a plain generic name (e.g. "chicken breast", "white rice") and its estimated weight in grams.
+      Do not estimate calories or nutrients.
+""")
+
+PROMPTS: Tuple[PromptTemplate, ...] = (EXTRACTION, DIETARY_FILTER, NUTRITION, COMBINED, PORTION, COMBINED_PORTION)
+
+_measured: Dict[str, int] = {}
+
+
+def measure_tokens(model) -> Dict[str, int]:
+    """
+    Count every template's prefix with the model's tokenizer (one ``count_tokens``
+    call each); later ``prefix_tokens`` reads use the measured numbers.
+
+    :param model: ``genai.GenerativeModel`` to count with.
+    :return: Prefix tokens per template name.
+    """
+    for template in PROMPTS:
+        try:
+            _measured[template.name] = model.count_tokens(template.prefix).total_tokens
+        except Exception as e:
+            logger.warning(f"Could not count tokens for prompt {template.name}: {str(e)}")
+    return {template.name: template.prefix_tokens for template in PROMPTS}
+
+
+def find_template(prompt: str) -> Optional[PromptTemplate]:
+    """:return: The template whose fixed prefix ``prompt`` starts with, if any."""
+    for template in PROMPTS:
+        if prompt.startswith(template.prefix):
+            return template
+    return None
+
+
+def token_report() -> str:
+    """:return: One line per template with its prefix size, for logs and the command line."""
+    source = "measured" if _measured else "estimated"
+    return "\n".join(f"{template.name:<18}{template.prefix_tokens:>6} tokens ({source})" for template in PROMPTS)
+
+
+if __name__ == "__main__":
+    print(token_report())
@@ -0,0 +1,383 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+import threading
+from http import HTTPStatus
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+from google.api_core import exceptions as google_exceptions
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first
+INTERACTIVE_PRIORITY = 0
+BATCH_PRIORITY = 10
+
+# Rough token costs used before a call; corrected from usage_metadata afterwards
+CHARS_PER_TOKEN = 4
+IMAGE_TOKENS = 258
+DEFAULT_OUTPUT_TOKENS = 512
+
+# Waiters behind the head of the queue re-check at least this often
+_POLL_INTERVAL = 0.01
+_MAX_SLEEP = 1.0
+_RETRY_HINT_RE = re.compile(r"retry(?:_delay)?\D{0,20}?([\d.]+)\s*s", re.IGNORECASE)
+
+_priority: ContextVar[int] = ContextVar("gemini_request_priority", default=INTERACTIVE_PRIORITY)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """
+    Run the enclosed Gemini calls at the given priority.
+
+    The value lives in a context variable, so it follows asyncio tasks and
+    ``asyncio.to_thread`` calls started inside the block.
+
+    :param priority: ``INTERACTIVE_PRIORITY``, ``BATCH_PRIORITY`` or any int (lower goes first).
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def estimate_tokens(contents, generation_config=None) -> int:
+    """
+    Estimate the tokens a request will consume, input plus expected output.
+
+    :param contents: Prompt or list of prompt parts (strings, blob dicts or images).
+    :param generation_config: Optional generation config; ``max_output_tokens`` is used if set.
+    :return: Estimated total tokens.
+    """
+    parts = contents if isinstance(contents, (list, tuple)) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, str):
+            tokens += len(part) // CHARS_PER_TOKEN + 1
+        else:
+            tokens += IMAGE_TOKENS
+    max_output = None
+    if isinstance(generation_config, dict):
+        max_output = generation_config.get("max_output_tokens")
+    elif generation_config is not None:
+        max_output = getattr(generation_config, "max_output_tokens", None)
+    return tokens + (max_output or DEFAULT_OUTPUT_TOKENS)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    :param error: Exception raised by the Gemini SDK or an HTTP client.
+    :return: True for a 429 / RESOURCE_EXHAUSTED response, judged by type or status code, never by the message.
+    """
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    return status == HTTPStatus.TOO_MANY_REQUESTS
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """
+    Extract the server's retry hint from a rate-limit error.
+
+    :param error: Exception raised by the Gemini SDK.
+    :return: Seconds to wait, or None if the error carries no hint.
+    """
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    match = _RETRY_HINT_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to one minute of budget."""
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        self._refill(now)
+        # Requests larger than the bucket only wait for a full bucket
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def consume(self, amount: float):
+        self.tokens -= amount
+
+    def refund(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Waiter:
+    __slots__ = ("tokens", "cancelled")
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+        self.cancelled = False
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limits for one model.
+
+    Callers queue by priority and then arrival order; only the head of the
+    queue can take budget, so batch work never jumps ahead of waiting
+    interactive requests. A server retry hint pauses the whole limiter.
+    """
+
+    def __init__(self, model_name: str, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None):
+        """
+        :param model_name: Model the limits apply to, for logging.
+        :param requests_per_minute: RPM quota. None or 0 for no limit.
+        :param tokens_per_minute: TPM quota. None or 0 for no limit.
+        """
+        self.model_name = model_name
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._waiters: List[Tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"granted": 0, "waited": 0, "wait_seconds": 0.0, "rate_limited": 0}
+
+    @property
+    def limited(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def _enqueue(self, tokens: int, priority: int) -> _Waiter:
+        waiter = _Waiter(tokens)
+        with self._lock:
+            heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        return waiter
+
+    def _cancel(self, waiter: _Waiter):
+        with self._lock:
+            waiter.cancelled = True
+            self._drop_cancelled()
+
+    def _drop_cancelled(self):
+        while self._waiters and self._waiters[0][2].cancelled:
+            heapq.heappop(self._waiters)
+
+    def _budget_wait(self, tokens: int, now: float) -> float:
+        wait = self._paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.time_until(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.time_until(tokens, now))
+        return max(wait, 0.0)
+
+    def _try_grant(self, waiter: _Waiter) -> float:
+        """Take budget for ``waiter`` if it is at the head of the queue; otherwise return how long to wait."""
+        with self._lock:
+            self._drop_cancelled()
+            now = time.monotonic()
+            head = self._waiters[0][2]
+            wait = self._budget_wait(head.tokens, now)
+            if head is not waiter:
+                return max(wait, _POLL_INTERVAL)
+            if wait > 0:
+                return wait
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(waiter.tokens)
+            heapq.heappop(self._waiters)
+            return 0.0
+
+    def _record_grant(self, waited: float):
+        with self._lock:
+            self._counters["granted"] += 1
+            if waited > 0.001:
+                self._counters["waited"] += 1
+                self._counters["wait_seconds"] += waited
+
+    def _sleep_for(self, wait: float, start: float, timeout: Optional[float]) -> float:
+        """How long to sleep before trying again; raises TimeoutError once ``timeout`` has run out."""
+        if timeout is None:
+            return min(wait, _MAX_SLEEP)
+        remaining = start + timeout - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"No quota for {self.model_name} within {timeout:.1f}s")
+        return min(wait, _MAX_SLEEP, remaining)
+
+    def acquire(self, tokens: int = 0, priority: Optional[int] = None, timeout: Optional[float] = None):
+        """
+        Block until the request fits the quota.
+
+        :param tokens: Estimated tokens for the request.
+        :param priority: Queue priority; defaults to the current ``request_priority``.
+        :param timeout: Longest time to wait, or None to wait as long as it takes.
+        :raises TimeoutError: If no budget was granted within ``timeout``; the place in the queue is given up.
+        """
+        if not self.limited and self._paused_until <= time.monotonic():
+            self._record_grant(0.0)
+            return
+        start = time.monotonic()
+        waiter = self._enqueue(tokens, current_priority() if priority is None else priority)
+        try:
+            while True:
+                wait = self._try_grant(waiter)
+                if wait == 0:
+                    break
+                time.sleep(self._sleep_for(wait, start, timeout))
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        self._record_grant(time.monotonic() - start)
+
+    async def acquire_async(self, tokens: int = 0, priority: Optional[int] = None, timeout: Optional[float] = None):
+        """Async variant of ``acquire``; waiting does not block the event loop."""
+        if not self.limited and self._paused_until <= time.monotonic():
+            self._record_grant(0.0)
+            return
+        start = time.monotonic()
+        waiter = self._enqueue(tokens, current_priority() if priority is None else priority)
+        try:
+            while True:
+                wait = self._try_grant(waiter)
+                if wait == 0:
+                    break
+                await asyncio.sleep(self._sleep_for(wait, start, timeout))
+        except BaseException:
+            self._cancel(waiter)
+            raise
+        self._record_grant(time.monotonic() - start)
+
+    def record_usage(self, estimated_tokens: int, response):
+        """
+        Correct the token bucket with the real usage reported by Gemini.
+
+        :param estimated_tokens: Tokens reserved by ``acquire``.
+        :param response: Gemini response carrying ``usage_metadata``.
+        """
+        if self.tokens is None:
+            return
+        usage = getattr(response, "usage_metadata", None)
+        actual = getattr(usage, "total_token_count", None) if usage is not None else None
+        if not actual:
+            return
+        with self._lock:
+            if actual > estimated_tokens:
+                self.tokens.consume(actual - estimated_tokens)
+            else:
+                self.tokens.refund(estimated_tokens - actual)
+
+    def back_off(self, seconds: float):
+        """
+        Pause all grants after a 429, honouring the server's retry hint.
+
+        :param seconds: How long to hold new requests.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._counters["rate_limited"] += 1
+        logger.warning(f"Rate limited on {self.model_name}, pausing requests for {seconds:.1f}s")
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            counters = dict(self._counters)
+            counters["queued"] = len(self._waiters)
+        counters["wait_seconds"] = round(counters["wait_seconds"], 3)
+        return counters
+
+
+def _parse_overrides(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "gemini-1.5-flash=15:1000000,gemini-1.5-pro=2:32000"
+    overrides = {}
+    for entry in spec.split(","):
+        if "=" not in entry:
+            continue
+        name, limits = entry.split("=", 1)
+        rpm, _, tpm = limits.partition(":")
+        overrides[name.strip()] = (float(rpm or 0), float(tpm or 0))
+    return overrides
+
+
+class QuotaScheduler:
+    """Hands out one ``RateLimiter`` per model, created on first use."""
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 overrides: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_rate_limit_retries: int = 3, default_backoff_seconds: float = 2.0):
+        """
+        :param requests_per_minute: Default RPM per model. None or 0 for no limit.
+        :param tokens_per_minute: Default TPM per model. None or 0 for no limit.
+        :param overrides: Per-model (rpm, tpm) limits.
+        :param max_rate_limit_retries: Times a 429 is retried after backing off.
+        :param default_backoff_seconds: Base pause when a 429 carries no retry hint.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.overrides = overrides or {}
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.default_backoff_seconds = default_backoff_seconds
+        self._limiters: Dict[str, RateLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "QuotaScheduler":
+        """Build a scheduler from MAX_REQUESTS_PER_MINUTE, MAX_TOKENS_PER_MINUTE, GEMINI_RATE_LIMITS and RATE_LIMIT_MAX_RETRIES."""
+        return cls(
+            requests_per_minute=float(os.getenv("MAX_REQUESTS_PER_MINUTE", 0)) or None,
+            tokens_per_minute=float(os.getenv("MAX_TOKENS_PER_MINUTE", 0)) or None,
+            overrides=_parse_overrides(os.getenv("GEMINI_RATE_LIMITS", "")),
+            max_rate_limit_retries=int(os.getenv("RATE_LIMIT_MAX_RETRIES", 3)),
+        )
+
+    def limiter(self, model_name: Optional[str]) -> RateLimiter:
+        """
+        :param model_name: Active model name.
+        :return: The limiter shared by every call to that model.
+        """
+        model_name = model_name or "default"
+        with self._lock:
+            limiter = self._limiters.get(model_name)
+            if limiter is None:
+                rpm, tpm = self.overrides.get(model_name, (self.requests_per_minute, self.tokens_per_minute))
+                limiter = RateLimiter(model_name, rpm, tpm)
+                self._limiters[model_name] = limiter
+                if limiter.limited:
+                    logger.info(f"✓ Rate limits for {model_name}: {rpm or 'unlimited'} RPM, {tpm or 'unlimited'} TPM")
+            return limiter
+
+    def backoff_for(self, error: Exception, attempt: int) -> float:
+        """
+        :param error: The rate-limit error.
+        :param attempt: Zero-based retry attempt.
+        :return: Seconds to pause: the server hint if present, else exponential backoff.
+        """
+        hint = retry_after(error)
+        return hint if hint is not None else self.default_backoff_seconds * (2 ** attempt)
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+@lazy_singleton
+def get_quota_scheduler() -> QuotaScheduler:
+    """The shared scheduler, built from the environment on first use."""
+    return QuotaScheduler.from_env()
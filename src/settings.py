@@ -0,0 +1,125 @@
+import os
+import logging
+import functools
+import threading
+from dataclasses import dataclass
+from typing import Callable, Optional, TypeVar
+from dotenv import load_dotenv
+
+logger = logging.getLogger(__name__)
+
+LOG_FORMAT = '%(levelname)s:%(name)s:%(message)s'
+
+T = TypeVar("T")
+
+
+@dataclass
+class Settings:
+    """Process-wide configuration that entry points set up explicitly with ``init()``."""
+    google_api_key: Optional[str] = None
+    log_level: str = "INFO"
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Build settings from GOOGLE_API_KEY and LOG_LEVEL."""
+        return cls(
+            google_api_key=os.getenv("GOOGLE_API_KEY") or None,
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        )
+
+    def require_api_key(self) -> str:
+        """
+        :return: The Google API key.
+        :raises ValueError: If no key is configured.
+        """
+        if not self.google_api_key:
+            raise ValueError("GOOGLE_API_KEY not found in environment variables")
+        return self.google_api_key
+
+
+_settings: Optional[Settings] = None
+_genai_configured = False
+_dotenv_loaded = False
+_lock = threading.RLock()
+
+
+def init(settings: Optional[Settings] = None, configure_logging: bool = True) -> Settings:
+    """
+    Set up the process: load .env, store the settings and, for entry points
+    that own the process (the app, the batch CLI, workers), configure logging.
+    Importing ``src`` modules does none of this, and the shared clients, caches
+    and tables are built on first use (see ``lazy_singleton``), so they read
+    the environment as it is after ``init()``.
+
+    :param settings: Settings to use. Defaults to ``Settings.from_env()``.
+    :param configure_logging: Install a root logging handler at ``settings.log_level``.
+    :return: The active settings.
+    """
+    global _settings, _genai_configured, _dotenv_loaded
+    with _lock:
+        if not _dotenv_loaded:
+            load_dotenv()
+            _dotenv_loaded = True
+        _settings = settings or Settings.from_env()
+        _genai_configured = False
+        if configure_logging:
+            logging.basicConfig(level=_settings.log_level, format=LOG_FORMAT)
+        return _settings
+
+
+def get_settings() -> Settings:
+    """The settings passed to ``init()``, or read from the environment on first use."""
+    global _settings
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = Settings.from_env()
+    return _settings
+
+
+def lazy_singleton(factory: Callable[[], T]) -> Callable[[], T]:
+    """
+    Decorator for module-level accessors of shared objects: the object is built
+    on the first call, not at import, and the same one is returned afterwards.
+    ``accessor.reset()`` drops it so the next call builds it again from the
+    current environment (e.g. in tests).
+
+    :param factory: Builds the object, usually via its ``from_env()``.
+    :return: The accessor.
+    """
+    instance = []
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def accessor() -> T:
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    def reset():
+        with lock:
+            instance.clear()
+
+    accessor.reset = reset
+    return accessor
+
+
+def configure_genai():
+    """
+    Import and configure the Gemini SDK on first use, so importing the tools
+    needs neither the SDK nor credentials.
+
+    :return: The configured ``google.generativeai`` module.
+    :raises ValueError: If no API key is configured.
+    """
+    global _genai_configured
+    import google.generativeai as genai
+
+    if not _genai_configured:
+        with _lock:
+            if not _genai_configured:
+                genai.configure(api_key=get_settings().require_api_key())
+                _genai_configured = True
+    return genai
@@ -0,0 +1,181 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from crewai.crews.crew_output import CrewOutput
+
+from src.tracing import span
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_DIVIDER = "\n\n----------\n\n"
+
+
+class TaskGraph:
+    """
+    Dependency graph of CrewAI tasks, built from their ``context=[...]`` declarations.
+    A task can start as soon as every task in its context has finished.
+    """
+
+    def __init__(self, tasks: List[Any]):
+        self.tasks: List[Any] = []
+        self.dependencies: Dict[int, List[Any]] = {}
+        for task in tasks:
+            self._add(task)
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_tasks(cls, tasks: List[Any]) -> "TaskGraph":
+        """
+        :param tasks: Tasks in declaration order. Context tasks missing from the list are added.
+        :return: The task graph.
+        :raises ValueError: If the context declarations form a cycle.
+        """
+        return cls(tasks)
+
+    def _add(self, task) -> None:
+        if id(task) in self.dependencies:
+            return
+        context = [dep for dep in (getattr(task, "context", None) or []) if dep is not task]
+        self.dependencies[id(task)] = context
+        for dep in context:
+            self._add(dep)
+        self.tasks.append(task)
+
+    def _topological_order(self) -> List[Any]:
+        order, state = [], {}
+
+        def visit(task, path):
+            if state.get(id(task)) == "done":
+                return
+            if state.get(id(task)) == "visiting":
+                cycle = " -> ".join(task_name(t) for t in path + [task])
+                raise ValueError(f"Task context declarations form a cycle: {cycle}")
+            state[id(task)] = "visiting"
+            for dep in self.dependencies[id(task)]:
+                visit(dep, path + [task])
+            state[id(task)] = "done"
+            order.append(task)
+
+        for task in self.tasks:
+            visit(task, [])
+        return order
+
+    def depends_on(self, task) -> List[Any]:
+        """:return: The tasks whose output ``task`` needs as context."""
+        return self.dependencies[id(task)]
+
+    def critical_path(self, durations: Dict[int, float]) -> float:
+        """
+        Longest chain of dependent task durations: the best possible end-to-end latency.
+
+        :param durations: Seconds per task, keyed by ``id(task)``.
+        :return: Length of the critical path in seconds.
+        """
+        finish: Dict[int, float] = {}
+        for task in self.order:
+            start = max((finish[id(dep)] for dep in self.depends_on(task)), default=0.0)
+            finish[id(task)] = start + durations.get(id(task), 0.0)
+        return max(finish.values(), default=0.0)
+
+
+def task_name(task) -> str:
+    return getattr(task, "name", None) or (getattr(task, "description", "") or "task")[:40]
+
+
+class ParallelCrew:
+    """
+    Crew that runs tasks as a DAG instead of one after another: each task starts
+    once the tasks in its context are done, and independent tasks run
+    concurrently on up to ``max_concurrency`` threads. End-to-end latency is the
+    critical path of the graph rather than the sum of all tasks.
+
+    Tasks that share an agent still run one at a time, since an agent holds
+    per-run executor state.
+    """
+
+    def __init__(self, agents: List[Any], tasks: List[Any], max_concurrency: Optional[int] = None,
+                 task_callback: Optional[Callable] = None):
+        self.agents = agents
+        self.tasks = tasks
+        self.graph = TaskGraph.from_tasks(tasks)
+        self.max_concurrency = max(1, max_concurrency or int(os.getenv("CREW_MAX_CONCURRENCY", "4")))
+        self.task_callback = task_callback
+        self._agent_locks: Dict[int, threading.Lock] = {}
+        self.durations: Dict[int, float] = {}
+
+    def _interpolate_inputs(self, inputs: Dict[str, Any]) -> None:
+        for task in self.graph.tasks:
+            task.interpolate_inputs(inputs)
+        for agent in self.agents:
+            agent.interpolate_inputs(inputs)
+
+    def _agent_lock(self, agent) -> threading.Lock:
+        return self._agent_locks.setdefault(id(agent), threading.Lock())
+
+    def _execute(self, task, outputs: Dict[int, Any]):
+        agent = task.agent
+        if agent is None:
+            raise ValueError(f"No agent available for task: {task_name(task)}")
+        context = CONTEXT_DIVIDER.join(
+            outputs[id(dep)].raw for dep in self.graph.depends_on(task) if id(dep) in outputs
+        ) or None
+        with self._agent_lock(agent), span("crew.task", {"task": task_name(task)}) as task_span:
+            try:
+                return task.execute_sync(agent=agent, context=context,
+                                         tools=task.tools or agent.tools or [])
+            finally:
+                self.durations[id(task)] = time.perf_counter() - task_span.start
+
+    def kickoff(self, inputs: Optional[Dict[str, Any]] = None):
+        """
+        Run every task in dependency order, starting each one as soon as its context is ready.
+
+        :param inputs: Inputs interpolated into the task and agent descriptions.
+        :return: A ``CrewOutput`` whose result is the last declared task's output.
+        :raises Exception: If any task fails; tasks not yet started are cancelled.
+        """
+        if inputs:
+            self._interpolate_inputs(inputs)
+
+        outputs: Dict[int, Any] = {}
+        pending = list(self.graph.order)
+        running: Dict[Future, Any] = {}
+        start = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="crew-task") as pool:
+            while pending or running:
+                for task in list(pending):
+                    if all(id(dep) in outputs for dep in self.graph.depends_on(task)):
+                        pending.remove(task)
+                        # Each task runs in a copy of this context so its spans join the trace
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._execute, task, outputs)] = task
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    try:
+                        outputs[id(task)] = future.result()
+                    except Exception as e:
+                        for other in running:
+                            other.cancel()
+                        raise Exception(f"Failed to run task {task_name(task)}: {str(e)}")
+                    logger.info(f"✓ Task {task_name(task)} finished")
+                    if self.task_callback:
+                        self.task_callback(outputs[id(task)])
+
+        logger.info(f"✓ Crew finished in {time.perf_counter() - start:.2f}s "
+                    f"(critical path {self.graph.critical_path(self.durations):.2f}s, "
+                    f"tasks total {sum(self.durations.values()):.2f}s)")
+        final = outputs[id(self.tasks[-1])]
+        return CrewOutput(
+            raw=final.raw,
+            pydantic=final.pydantic,
+            json_dict=final.json_dict,
+            tasks_output=[outputs[id(task)] for task in self.graph.order],
+        )
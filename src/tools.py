@@ -1,110 +1,386 @@
 import json
-import os
-import base64
-import requests
-from langchain.tools import tool
-from PIL import Image
-from io import BytesIO
-from typing import List, Optional
+from typing import AsyncIterator, Callable, FrozenSet, Iterator, List, Optional, Union
+import time
+import asyncio
 import logging
-import google.generativeai as genai
-from dotenv import load_dotenv
+import threading
+from src.model_registry import get_model_registry
+from src.gemini_client import get_gemini_client
+from src.cache import get_result_cache, get_verdict_cache, make_cache_key, make_verdict_key, env_flag
+from src.phash import get_perceptual_index
+from src.image_preprocessing import get_image_preprocessor
+from src.image_handle import ImageHandle
+from src.diet_rules import get_diet_rules
+from src.nutrient_db import get_nutrient_db
+from src.settings import lazy_singleton
+from src.ingredient_parser import AND_COMPOUNDS, IngredientRecord, IngredientStreamParser, parse_ingredients
+from src.models import (
+    CombinedAnalysisOutput, CombinedPortionOutput, NutrientAnalysisOutput, PortionAnalysisOutput,
+    gemini_response_schema
+)
+from src.tracing import span, traced
+from src import prompts
+
+# Logging, credentials and the Gemini SDK are set up by the entry point (see src.settings)
+logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
-logger = logging.getLogger(__name__)
+def diet_rules_enabled() -> bool:
+    """Answer well-known diets from src/config/diet_rules.yaml before asking the model."""
+    return env_flag("ENABLE_DIET_RULES", "true")
+
+
+def nutrient_db_enabled() -> bool:
+    """Compute calories and nutrients from src/config/nutrients.csv; the model only identifies foods and portions."""
+    return env_flag("ENABLE_NUTRIENT_DB", "true")
+
+
+def nutrient_json_enabled() -> bool:
+    """Return ``NutrientAnalysisOutput`` JSON from ``analyze_image`` instead of the Markdown report."""
+    return env_flag("NUTRIENT_ANALYSIS_JSON", "false")
+
+
+@lazy_singleton
+def ingredient_compounds() -> FrozenSet[str]:
+    """Known names containing "and" ("half and half"), kept whole when parsing ingredient lists."""
+    return frozenset(AND_COMPOUNDS | {
+        " ".join(tokens) for index in (get_nutrient_db().index, get_diet_rules().index) for tokens in index.phrases
+        if "and" in tokens
+    })
+
+
+class lazy_tool:
+    """
+    Drop-in for LangChain's ``@tool(name)`` that builds the tool (and imports
+    LangChain) the first time it is accessed, e.g. when a crew creates its
+    agents. The direct and async functions never pay for it.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.func: Optional[Callable] = None
+        self._tool = None
+        self._lock = threading.Lock()
+
+    def __call__(self, func: Callable) -> "lazy_tool":
+        self.func = func
+        return self
 
-# Configure Google Gemini
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("GOOGLE_API_KEY not found in environment variables")
+    def __get__(self, instance, owner):
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    from langchain.tools import tool
+                    self._tool = tool(self.name)(self.func)
+        return self._tool
 
-genai.configure(api_key=GOOGLE_API_KEY)
 
 # Helper function to get the best available model
 def get_best_vision_model():
-    """Find and return the best available Gemini vision model"""
-    # Try to list available models and find one that supports generateContent
-    try:
-        available_models = genai.list_models()
-        for model in available_models:
-            # Check if model supports generateContent
-            if 'generateContent' in model.supported_generation_methods:
-                model_name = model.name.replace('models/', '')
-                logger.info(f"✓ Found available model: {model_name}")
-                return genai.GenerativeModel(model_name)
-    except Exception as e:
-        logger.warning(f"Could not list models: {str(e)}")
-    
-    # Fallback to hardcoded list if listing fails
-    model_priority = [
-        'gemini-2.0-flash',
-        'gemini-1.5-flash',
-        'gemini-1.5-pro',
-        'gemini-pro',
-        'gemini-pro-vision',
+    """Return the process-wide Gemini model, resolving it on first use"""
+    return get_model_registry().get_model()
+
+
+def generate_content(contents, **kwargs):
+    """
+    Send a generation request through the shared Gemini client.
+
+    :param contents: Prompt or list of prompt parts passed to ``generate_content``.
+    :return: The Gemini response.
+    """
+    return get_gemini_client().generate(contents, **kwargs)
+
+
+async def generate_content_async(contents, **kwargs):
+    """
+    Async variant of ``generate_content``, bounded by the client's concurrency limit.
+
+    :param contents: Prompt or list of prompt parts passed to ``generate_content_async``.
+    :return: The Gemini response.
+    """
+    return await get_gemini_client().generate_async(contents, **kwargs)
+
+
+@traced("cache_lookup")
+def _vision_cache_lookup(prompt: str, image: ImageHandle):
+    """
+    Look up a prior result for this prompt and image, exactly or by near-duplicate.
+
+    :return: ``(cached_text, store)`` where ``store`` is the argument tuple for
+        ``_vision_cache_store``, or None when caching is disabled.
+    """
+    result_cache = get_result_cache()
+    if not result_cache.enabled:
+        return None, None
+
+    get_best_vision_model()
+    model_name = get_model_registry().active_model_name
+    key = make_cache_key(image.digest, prompt, f"{model_name}:{get_image_preprocessor().signature}")
+    cached = result_cache.get(key)
+    if cached is not None:
+        logger.info("✓ Served from result cache")
+        return cached, None
+
+    namespace = None
+    near_hash = None
+    perceptual_index = get_perceptual_index()
+    if perceptual_index.enabled:
+        namespace = make_cache_key("", prompt, model_name)
+        near_hash = image.perceptual_hash
+        near_key = perceptual_index.lookup(namespace, near_hash)
+        cached = result_cache.get(near_key) if near_key else None
+        if cached is not None:
+            logger.info("✓ Served near-duplicate image from result cache")
+            return cached, None
+
+    return None, (key, namespace, near_hash)
+
+
+def _vision_cache_store(store, text: str):
+    if store is None:
+        return
+    key, namespace, near_hash = store
+    get_result_cache().set(key, text)
+    if near_hash is not None:
+        get_perceptual_index().add(namespace, near_hash, key)
+
+
+def generate_vision_text(prompt: str, image: ImageHandle, generation_config: Optional[dict] = None) -> str:
+    """
+    Run a prompt against an image, serving repeated requests from the result
+    cache and near-identical images from the perceptual index.
+
+    :param prompt: Instruction text sent with the image.
+    :param image: The request's image handle.
+    :param generation_config: Optional Gemini generation config (e.g. a JSON response schema).
+    :return: The model's text response.
+    """
+    cached, store = _vision_cache_lookup(prompt, image)
+    if cached is not None:
+        return cached
+
+    response = generate_content([prompt, image.preprocessed.as_part()], generation_config=generation_config)
+    text = response.text
+    _vision_cache_store(store, text)
+    return text
+
+
+async def generate_vision_text_async(prompt: str, image: ImageHandle, generation_config: Optional[dict] = None) -> str:
+    """
+    Async variant of ``generate_vision_text``. Image fetching uses the async
+    HTTP client; decoding, hashing and preprocessing run in a worker thread.
+
+    :param prompt: Instruction text sent with the image.
+    :param image: The request's image handle.
+    :param generation_config: Optional Gemini generation config (e.g. a JSON response schema).
+    :return: The model's text response.
+    """
+    await image.fetch_async()
+    await get_model_registry().get_model_async()
+    cached, store = await asyncio.to_thread(_vision_cache_lookup, prompt, image)
+    if cached is not None:
+        return cached
+
+    prepared = await asyncio.to_thread(lambda: image.preprocessed)
+    response = await generate_content_async([prompt, prepared.as_part()], generation_config=generation_config)
+    text = response.text
+    _vision_cache_store(store, text)
+    return text
+
+
+def stream_vision_text(prompt: str, image: ImageHandle, generation_config: Optional[dict] = None) -> Iterator[str]:
+    """
+    Streaming variant of ``generate_vision_text`` that yields text chunks as
+    Gemini produces them. Cached results are yielded as a single chunk; the
+    full text is cached once the stream completes.
+
+    :param prompt: Instruction text sent with the image.
+    :param image: The request's image handle.
+    :param generation_config: Optional Gemini generation config.
+    :return: Generator of text chunks.
+    """
+    cached, store = _vision_cache_lookup(prompt, image)
+    if cached is not None:
+        yield cached
+        return
+
+    start = time.perf_counter()
+    first_chunk_at = None
+    parts = []
+    for chunk in get_gemini_client().stream([prompt, image.preprocessed.as_part()], generation_config=generation_config):
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - start
+        parts.append(chunk)
+        yield chunk
+    _log_stream_timing(first_chunk_at, time.perf_counter() - start, parts)
+    _vision_cache_store(store, "".join(parts))
+
+
+async def stream_vision_text_async(prompt: str, image: ImageHandle,
+                                   generation_config: Optional[dict] = None) -> AsyncIterator[str]:
+    """
+    Async variant of ``stream_vision_text``.
+
+    :param prompt: Instruction text sent with the image.
+    :param image: The request's image handle.
+    :param generation_config: Optional Gemini generation config.
+    :return: Async generator of text chunks.
+    """
+    await image.fetch_async()
+    await get_model_registry().get_model_async()
+    cached, store = await asyncio.to_thread(_vision_cache_lookup, prompt, image)
+    if cached is not None:
+        yield cached
+        return
+
+    prepared = await asyncio.to_thread(lambda: image.preprocessed)
+    start = time.perf_counter()
+    first_chunk_at = None
+    parts = []
+    async for chunk in get_gemini_client().stream_async([prompt, prepared.as_part()], generation_config=generation_config):
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - start
+        parts.append(chunk)
+        yield chunk
+    _log_stream_timing(first_chunk_at, time.perf_counter() - start, parts)
+    _vision_cache_store(store, "".join(parts))
+
+
+def _log_stream_timing(first_chunk_at: Optional[float], total: float, parts: List[str]):
+    ttfb = f"{first_chunk_at:.2f}s" if first_chunk_at is not None else "n/a"
+    logger.info(f"✓ Streamed {sum(len(part) for part in parts)} chars in {len(parts)} chunks: "
+                f"first chunk {ttfb}, total {total:.2f}s")
+
+
+# Prompt texts live in src/prompts.py as templates with a fixed, cacheable prefix
+EXTRACTION_PROMPT = prompts.EXTRACTION.text
+NUTRITION_PROMPT = prompts.NUTRITION.text
+COMBINED_PROMPT = prompts.COMBINED.text
+PORTION_PROMPT = prompts.PORTION.text
+COMBINED_PORTION_PROMPT = prompts.COMBINED_PORTION.text
+
+DIETARY_FILTER_GENERATION_CONFIG = {"response_mime_type": "application/json"}
+
+COMBINED_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": gemini_response_schema(CombinedAnalysisOutput),
+}
+
+PORTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": gemini_response_schema(PortionAnalysisOutput),
+}
+
+COMBINED_PORTION_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": gemini_response_schema(CombinedPortionOutput),
+}
+
+
+def _with_disclaimer(report: str) -> str:
+    # The fixed disclaimer is added here rather than generated by the model on every call
+    return report.rstrip() + "\n\n" + prompts.NUTRITION_DISCLAIMER
+
+
+def _nutrients_from_portions(portions: PortionAnalysisOutput) -> NutrientAnalysisOutput:
+    with span("nutrient_totals"):
+        return get_nutrient_db().analyze(portions.items, dish=portions.dish, portion_size=portions.portion_size)
+
+
+def _nutrient_report(analysis: NutrientAnalysisOutput) -> str:
+    """Table-based totals as the Markdown report ``NUTRITION_PROMPT`` asks the model for, or JSON when opted in."""
+    if nutrient_json_enabled():
+        return analysis.model_dump_json(indent=2)
+    nutrients = analysis.nutrients
+    calories = "unknown" if analysis.estimated_calories is None else analysis.estimated_calories
+    lines = [
+        f"1. **Identification**: {analysis.dish or 'Unidentified dish'}",
+        "",
+        "2. **Portion Size & Calorie Estimation**:",
+        f"   - **{analysis.dish or 'Portion'}**: {analysis.portion_size or 'one portion'}, {calories} calories",
+        "",
+        f"3. **Total Calories**: Total Calories: {calories}",
+        "",
+        "4. **Nutrient Breakdown**:",
+        f"   - **Protein**: {nutrients.protein or 'unknown'}",
+        f"   - **Carbohydrates**: {nutrients.carbohydrates or 'unknown'}",
+        f"   - **Fats**: {nutrients.fats or 'unknown'}",
+        f"   - **Vitamins**: {', '.join(f'{v.name} {v.percentage_dv} DV' for v in nutrients.vitamins) or 'none listed'}",
+        f"   - **Minerals**: {', '.join(f'{m.name} {m.amount}' for m in nutrients.minerals) or 'none listed'}",
     ]
-    
-    for model_name in model_priority:
-        try:
-            model = genai.GenerativeModel(model_name)
-            logger.info(f"✓ Using model: {model_name}")
-            return model
-        except Exception as e:
-            logger.debug(f"Model {model_name} not available: {str(e)}")
-            continue
-    
-    raise Exception("No compatible Gemini vision models available. Check your API key and enabled APIs.")
+    if analysis.health_evaluation:
+        lines += ["", f"5. **Health Evaluation**: {analysis.health_evaluation}"]
+    return _with_disclaimer("\n".join(lines))
 
 
 class ExtractIngredientsTool():
     @staticmethod
-    def extract_ingredient_direct(image_input: str):
+    @traced("tool.extract_ingredients")
+    def extract_ingredient_direct(image_input: Union[str, ImageHandle]):
         """
         Direct function to extract ingredients (without LangChain tool wrapper)
         
-        :param image_input: The image file path (local) or URL (remote).
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
         :return: A list of ingredients extracted from the image.
         """
         try:
-            logger.info(f"Loading image from: {image_input}")
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Loading image from: {image}")
             
-            # Load image
-            if image_input.startswith("http"):
-                response = requests.get(image_input)
-                response.raise_for_status()
-                img = Image.open(BytesIO(response.content))
-            else:
-                if not os.path.isfile(image_input):
-                    raise FileNotFoundError(f"No file found at path: {image_input}")
-                img = Image.open(image_input)
-
-            logger.info("Image loaded successfully")
+            logger.info("Sending request to Gemini API...")
             
-            # Get the best available model
-            model = get_best_vision_model()
+            # Generate response
+            text = generate_vision_text(EXTRACTION_PROMPT, image)
             
-            # Create prompt
-            prompt = """Analyze this image and extract all the ingredients or food items you can see.
-            List each ingredient on a new line. Be specific and detailed.
-            Only list the ingredients, nothing else."""
+            logger.info(f"✓ Gemini response received: {text[:100]}...")
+            return text
             
-            logger.info("Sending request to Gemini API...")
+        except Exception as e:
+            logger.error(f"Error in extract_ingredient: {str(e)}")
+            raise Exception(f"Failed to extract ingredients: {str(e)}")
+
+    @staticmethod
+    @traced("tool.extract_ingredients")
+    async def extract_ingredient_async(image_input: Union[str, ImageHandle]):
+        """
+        Async variant of ``extract_ingredient_direct``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: A list of ingredients extracted from the image.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Loading image from: {image}")
             
-            # Generate response
-            response = model.generate_content([prompt, img])
+            text = await generate_vision_text_async(EXTRACTION_PROMPT, image)
             
-            logger.info(f"✓ Gemini response received: {response.text[:100]}...")
-            return response.text
+            logger.info(f"✓ Gemini response received: {text[:100]}...")
+            return text
             
         except Exception as e:
             logger.error(f"Error in extract_ingredient: {str(e)}")
             raise Exception(f"Failed to extract ingredients: {str(e)}")
 
-    @tool("Extract ingredients")
+    @staticmethod
+    @traced("tool.extract_ingredients")
+    async def extract_ingredient_stream_async(image_input: Union[str, ImageHandle]) -> AsyncIterator[str]:
+        """
+        Streaming variant of ``extract_ingredient_async`` that yields partial text.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Async generator of raw ingredient text chunks.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Streaming ingredients from: {image}")
+            async for chunk in stream_vision_text_async(EXTRACTION_PROMPT, image):
+                yield chunk
+                
+        except Exception as e:
+            logger.error(f"Error in extract_ingredient: {str(e)}")
+            raise Exception(f"Failed to extract ingredients: {str(e)}")
+
+    @lazy_tool("Extract ingredients")
     def extract_ingredient(image_input: str):
         """
         Extract ingredients from a food item image using Google Gemini Vision.
@@ -117,6 +393,7 @@ class ExtractIngredientsTool():
 
 class FilterIngredientsTool:
     @staticmethod
+    @traced("tool.filter_ingredients")
     def filter_ingredients_direct(raw_ingredients: str) -> List[str]:
         """
         Direct function to filter ingredients (without LangChain tool wrapper)
@@ -127,21 +404,8 @@ class FilterIngredientsTool:
         try:
             logger.info(f"Filtering ingredients from: {raw_ingredients[:100]}...")
             
-            # Split by newlines and commas, clean up
-            ingredients = []
-            for line in raw_ingredients.split('\n'):
-                # Remove numbering, bullets, and extra whitespace
-                cleaned = line.strip().lstrip('0123456789.-*• ').strip()
-                if cleaned and len(cleaned) > 2:  # Ignore very short items
-                    ingredients.append(cleaned.lower())
-            
-            # Remove duplicates while preserving order
-            seen = set()
-            unique_ingredients = []
-            for item in ingredients:
-                if item not in seen:
-                    seen.add(item)
-                    unique_ingredients.append(item)
+            # Bullets, numbered lists, comma and "and" lists, quantities; duplicates dropped in order
+            unique_ingredients = [record.name for record in parse_ingredients(raw_ingredients, ingredient_compounds())]
             
             logger.info(f"✓ Filtered to {len(unique_ingredients)} ingredients: {unique_ingredients}")
             return unique_ingredients
@@ -150,7 +414,12 @@ class FilterIngredientsTool:
             logger.error(f"Error in filter_ingredients: {str(e)}")
             return []
 
-    @tool("Filter ingredients")
+    @staticmethod
+    def stream_parser() -> IngredientStreamParser:
+        """:return: A parser that turns streamed extraction output into ingredients line by line."""
+        return IngredientStreamParser(ingredient_compounds())
+
+    @lazy_tool("Filter ingredients")
     def filter_ingredients(raw_ingredients: str) -> List[str]:
         """
         Processes the raw ingredient data and filters out non-food items or noise.
@@ -163,14 +432,16 @@ class FilterIngredientsTool:
 
 class DietaryFilterTool:
     @staticmethod
-    def filter_based_on_restrictions_direct(ingredients: List[str], dietary_restrictions: Optional[str] = None) -> List[str]:
+    @traced("tool.dietary_filter")
+    def filter_based_on_restrictions_direct(ingredients: Union[List[str], str], dietary_restrictions: Optional[str] = None) -> List[str]:
         """
         Direct function to filter by dietary restrictions (without LangChain tool wrapper)
 
-        :param ingredients: List of ingredients.
+        :param ingredients: List of ingredients, or the same as text (one per line or comma-separated).
         :param dietary_restrictions: Dietary restrictions (e.g., vegan, gluten-free). Defaults to None.
         :return: Filtered list of ingredients that comply with the dietary restrictions.
         """
+        ingredients = DietaryFilterTool._as_list(ingredients)
         try:
             # If no dietary restrictions are provided, return the original ingredients
             if not dietary_restrictions or dietary_restrictions.strip() == "":
@@ -178,115 +449,387 @@ class DietaryFilterTool:
                 return ingredients
 
             logger.info(f"Filtering {len(ingredients)} ingredients for: {dietary_restrictions}")
-            
-            # Get the best available model
-            model = get_best_vision_model()
 
-            # Create a prompt for filtering
-            prompt = f"""You are an AI nutritionist specialized in dietary restrictions.
+            verdicts, misses = DietaryFilterTool._known_verdicts(ingredients, dietary_restrictions)
+            if misses:
+                try:
+                    prompt = prompts.DIETARY_FILTER.render(
+                        ingredients='\n'.join(misses.values()),
+                        dietary_restrictions=dietary_restrictions
+                    )
+                    response = generate_content(prompt, generation_config=DIETARY_FILTER_GENERATION_CONFIG)
+                    DietaryFilterTool._apply_model_verdicts(response.text, ingredients, verdicts, misses, dietary_restrictions)
+                except Exception as e:
+                    logger.error(f"Error asking Gemini for dietary verdicts, keeping unknown ingredients: {str(e)}")
+            return DietaryFilterTool._merge_verdicts(ingredients, verdicts)
 
-Given the following list of ingredients:
-{', '.join(ingredients)}
+        except Exception as e:
+            logger.error(f"Error in filter_based_on_restrictions: {str(e)}")
+            return ingredients  # Return original if filtering fails
+
+    @staticmethod
+    @traced("tool.dietary_filter")
+    async def filter_based_on_restrictions_async(ingredients: Union[List[str], str], dietary_restrictions: Optional[str] = None) -> List[str]:
+        """
+        Async variant of ``filter_based_on_restrictions_direct``.
 
-And the dietary restriction: {dietary_restrictions}
+        :param ingredients: List of ingredients, or the same as text (one per line or comma-separated).
+        :param dietary_restrictions: Dietary restrictions (e.g., vegan, gluten-free). Defaults to None.
+        :return: Filtered list of ingredients that comply with the dietary restrictions.
+        """
+        ingredients = DietaryFilterTool._as_list(ingredients)
+        try:
+            if not dietary_restrictions or dietary_restrictions.strip() == "":
+                logger.info("No dietary restrictions provided, returning all ingredients")
+                return ingredients
 
-Please remove any ingredient that does NOT comply with this dietary restriction.
-Return ONLY the compliant ingredients as a comma-separated list with no additional text, commentary, or explanation.
-If an ingredient is uncertain, include it.
+            logger.info(f"Filtering {len(ingredients)} ingredients for: {dietary_restrictions}")
 
-Compliant ingredients:"""
+            # Cache lookups may hit SQLite, so keep them off the event loop
+            verdicts, misses = await asyncio.to_thread(DietaryFilterTool._known_verdicts, ingredients, dietary_restrictions)
+            await DietaryFilterTool._model_verdicts_async(ingredients, verdicts, misses, dietary_restrictions)
+            return DietaryFilterTool._merge_verdicts(ingredients, verdicts)
 
-            # Generate response
-            response = model.generate_content(prompt)
-            filtered_text = response.text.strip()
-            
-            # Parse the response
-            filtered_list = [item.strip().lower() for item in filtered_text.split(',') if item.strip()]
-            
-            logger.info(f"✓ Filtered to {len(filtered_list)} compliant ingredients: {filtered_list}")
-            return filtered_list if filtered_list else ingredients
-            
         except Exception as e:
             logger.error(f"Error in filter_based_on_restrictions: {str(e)}")
             return ingredients  # Return original if filtering fails
 
-    @tool("Filter based on dietary restrictions")
-    def filter_based_on_restrictions(ingredients: List[str], dietary_restrictions: Optional[str] = None) -> List[str]:
+    @staticmethod
+    def _as_list(ingredients: Union[List[str], str]) -> List[str]:
+        # Agents sometimes pass the list as text; parse it like extraction output
+        if isinstance(ingredients, str):
+            return [record.name for record in parse_ingredients(ingredients, ingredient_compounds())]
+        return ingredients
+
+    @staticmethod
+    def _local_verdicts(ingredients: List[str], dietary_restrictions: str) -> Optional[List[Optional[bool]]]:
         """
-        Uses Google Gemini to filter ingredients based on dietary restrictions.
+        Check ingredients against the local diet rules.
 
         :param ingredients: List of ingredients.
+        :param dietary_restrictions: Dietary restrictions (e.g., vegan, gluten-free).
+        :return: Per-ingredient True/False/None (unknown), or None if the restrictions aren't all known diets.
+        """
+        if not diet_rules_enabled():
+            return None
+        diet_rules = get_diet_rules()
+        diets = diet_rules.resolve_diets(dietary_restrictions)
+        if not diets:
+            logger.info(f"Restrictions not covered by local diet rules: {dietary_restrictions}")
+            return None
+        return [diet_rules.check(ingredient, diets) for ingredient in ingredients]
+
+    @staticmethod
+    def _known_verdicts(ingredients: List[str], dietary_restrictions: str):
+        """
+        Resolve what can be answered without the model: local rules first, then the verdict cache.
+
+        :param ingredients: List of ingredients.
+        :param dietary_restrictions: Dietary restrictions (e.g., vegan, gluten-free).
+        :return: Per-ingredient verdicts (None where still unknown) and the misses to send to
+                 the model, as an ordered dict of ingredient key to ingredient text.
+        """
+        verdicts = DietaryFilterTool._local_verdicts(ingredients, dietary_restrictions) or [None] * len(ingredients)
+        local = sum(verdict is not None for verdict in verdicts)
+        diet_rules = get_diet_rules()
+        verdict_cache = get_verdict_cache()
+        restriction_key = diet_rules.restriction_key(dietary_restrictions)
+
+        cached = {}
+        misses = {}
+        for i, ingredient in enumerate(ingredients):
+            if verdicts[i] is not None:
+                continue
+            ingredient_key = diet_rules.ingredient_key(ingredient)
+            if ingredient_key not in cached and ingredient_key not in misses:
+                verdict = verdict_cache.get(make_verdict_key(ingredient_key, restriction_key))
+                if verdict is None:
+                    misses[ingredient_key] = ingredient.strip()
+                else:
+                    cached[ingredient_key] = verdict
+            verdicts[i] = cached.get(ingredient_key)
+
+        logger.info(f"✓ Dietary verdicts for {restriction_key}: {local} from rules, {len(cached)} cached, "
+                    f"{len(misses)} sent to Gemini")
+        return verdicts, misses
+
+    @staticmethod
+    async def _model_verdicts_async(ingredients: List[str], verdicts: List[Optional[bool]], misses: dict,
+                                    dietary_restrictions: str):
+        # Ask Gemini about the misses in one call; on failure they stay unknown (and are kept)
+        if not misses:
+            return
+        try:
+            prompt = prompts.DIETARY_FILTER.render(
+                ingredients='\n'.join(misses.values()),
+                dietary_restrictions=dietary_restrictions
+            )
+            response = await generate_content_async(prompt, generation_config=DIETARY_FILTER_GENERATION_CONFIG)
+            await asyncio.to_thread(DietaryFilterTool._apply_model_verdicts, response.text, ingredients,
+                                    verdicts, misses, dietary_restrictions)
+        except Exception as e:
+            logger.error(f"Error asking Gemini for dietary verdicts, keeping unknown ingredients: {str(e)}")
+
+    @staticmethod
+    def _apply_model_verdicts(response_text: str, ingredients: List[str], verdicts: List[Optional[bool]],
+                              misses: dict, dietary_restrictions: str):
+        """
+        Parse the model's JSON verdicts, cache them and fill the unknown entries of ``verdicts``.
+
+        Ingredients the model left out stay unknown (and are kept), and are not cached.
+        """
+        with span("parse"):
+            answers = json.loads(response_text)
+        by_name = {str(name).strip().lower(): value for name, value in answers.items()}
+        diet_rules = get_diet_rules()
+        restriction_key = diet_rules.restriction_key(dietary_restrictions)
+
+        decided = {}
+        for ingredient_key, ingredient in misses.items():
+            value = by_name.get(ingredient.lower())
+            if isinstance(value, bool):
+                decided[ingredient_key] = value
+                get_verdict_cache().set(make_verdict_key(ingredient_key, restriction_key), value)
+
+        for i, ingredient in enumerate(ingredients):
+            if verdicts[i] is None:
+                verdicts[i] = decided.get(diet_rules.ingredient_key(ingredient))
+        logger.info(f"✓ Gemini decided {len(decided)}/{len(misses)} dietary verdicts")
+
+    @staticmethod
+    def _merge_verdicts(ingredients: List[str], verdicts: List[Optional[bool]]) -> List[str]:
+        # Keep the original order; anything still unknown is kept ("if uncertain, include it")
+        filtered_list = [
+            ingredient.strip().lower() for ingredient, verdict in zip(ingredients, verdicts)
+            if verdict is not False
+        ]
+        logger.info(f"✓ Filtered to {len(filtered_list)} compliant ingredients: {filtered_list}")
+        return filtered_list
+
+    @lazy_tool("Filter based on dietary restrictions")
+    def filter_based_on_restrictions(ingredients: Union[List[str], str], dietary_restrictions: Optional[str] = None) -> List[str]:
+        """
+        Uses Google Gemini to filter ingredients based on dietary restrictions.
+
+        :param ingredients: List of ingredients, or the same as text (one per line or comma-separated).
         :param dietary_restrictions: Dietary restrictions (e.g., vegan, gluten-free). Defaults to None.
         :return: Filtered list of ingredients that comply with the dietary restrictions.
         """
         return DietaryFilterTool.filter_based_on_restrictions_direct(ingredients, dietary_restrictions)
 
+
+class StreamingIngredientFilter:
+    """
+    Ingredient filtering that runs while extraction is still streaming.
+
+    Each chunk of model output goes through ``feed_async``; every completed
+    line is parsed into ingredients and, if there are dietary restrictions,
+    checked against the local diet rules and the verdict cache right away.
+    ``finish_async`` parses the last line and sends only the ingredients that
+    are still unknown to Gemini, in one call, once generation has finished.
+    """
+
+    def __init__(self, dietary_restrictions: Optional[str] = None):
+        self.dietary_restrictions = (dietary_restrictions or "").strip()
+        self.parser = FilterIngredientsTool.stream_parser()
+        self.ingredients: List[str] = []
+        self.verdicts: List[Optional[bool]] = []
+        self.misses: dict = {}
+
+    async def feed_async(self, chunk: str) -> List[IngredientRecord]:
+        """
+        :param chunk: The next piece of extraction output.
+        :return: Ingredients from the lines this chunk completed.
+        """
+        records = self.parser.feed(chunk)
+        if records:
+            await self._add([record.name for record in records])
+        return records
+
+    async def _add(self, ingredients: List[str]):
+        self.ingredients += ingredients
+        if not self.dietary_restrictions:
+            return
+        # Cache lookups may hit SQLite, so keep them off the event loop
+        verdicts, misses = await asyncio.to_thread(DietaryFilterTool._known_verdicts, ingredients,
+                                                   self.dietary_restrictions)
+        self.verdicts += verdicts
+        for ingredient_key, ingredient in misses.items():
+            self.misses.setdefault(ingredient_key, ingredient)
+
+    @property
+    def compliant(self) -> List[str]:
+        """Ingredients parsed so far that haven't been ruled out (unknown ones are kept)."""
+        if not self.dietary_restrictions:
+            return list(self.ingredients)
+        return [ingredient for ingredient, verdict in zip(self.ingredients, self.verdicts) if verdict is not False]
+
+    async def finish_async(self) -> List[str]:
+        """
+        Call once the stream has ended.
+
+        :return: The filtered ingredients, in order of appearance.
+        """
+        records = self.parser.close()
+        if records:
+            await self._add([record.name for record in records])
+        logger.info(f"✓ Parsed {len(self.ingredients)} ingredients while streaming: {self.ingredients}")
+        if not self.dietary_restrictions:
+            return list(self.ingredients)
+
+        with span("tool.dietary_filter"):
+            await DietaryFilterTool._model_verdicts_async(self.ingredients, self.verdicts, self.misses,
+                                                          self.dietary_restrictions)
+            return DietaryFilterTool._merge_verdicts(self.ingredients, self.verdicts)
+
     
 class NutrientAnalysisTool():
     @staticmethod
-    def analyze_image_direct(image_input: str):
+    @traced("tool.nutrient_analysis")
+    def analyze_image_direct(image_input: Union[str, ImageHandle]):
         """
         Direct function to analyze nutrition (without LangChain tool wrapper)
         
-        :param image_input: The image file path (local) or URL (remote).
-        :return: A string with nutrient breakdown and estimated calorie information.
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: A Markdown report with nutrient breakdown and estimated calorie information; with
+            ENABLE_NUTRIENT_DB on the figures come from the nutrient table (``NutrientAnalysisOutput``
+            JSON instead when NUTRIENT_ANALYSIS_JSON is on).
         """
+        if nutrient_db_enabled():
+            return _nutrient_report(NutrientAnalysisTool.analyze_nutrients_direct(image_input))
         try:
-            logger.info(f"Analyzing nutrition from image: {image_input}")
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Analyzing nutrition from image: {image}")
             
-            # Load image
-            if image_input.startswith("http"):
-                response = requests.get(image_input)
-                response.raise_for_status()
-                img = Image.open(BytesIO(response.content))
-            else:
-                if not os.path.isfile(image_input):
-                    raise FileNotFoundError(f"No file found at path: {image_input}")
-                img = Image.open(image_input)
-
-            logger.info("Image loaded, getting model...")
+            logger.info("Sending nutrition analysis request to Gemini...")
+            
+            # Generate response
+            text = generate_vision_text(NUTRITION_PROMPT, image)
             
-            # Get the best available model
-            model = get_best_vision_model()
+            logger.info("✓ Nutrition analysis completed")
+            return _with_disclaimer(text)
             
-            # Detailed nutritionist prompt
-            prompt = """You are an expert nutritionist. Analyze the food in this image and provide a detailed nutritional assessment using the following format:
-
-1. **Identification**: List each identified food item clearly, one per line.
-
-2. **Portion Size & Calorie Estimation**: For each identified food item, specify the portion size and provide an estimated number of calories. Use bullet points:
-   - **[Food Item]**: [Portion Size], [Number of Calories] calories
-
-3. **Total Calories**: Provide the total number of calories for all food items.
-   Total Calories: [Number]
-
-4. **Nutrient Breakdown**: Include key nutrients:
-   - **Protein**: [Food contributions] = [Total]
-   - **Carbohydrates**: [Food contributions] = [Total]
-   - **Fats**: [Food contributions] = [Total]
-   - **Vitamins**: List key vitamins with %DV
-   - **Minerals**: List key minerals with amounts
-
-5. **Health Evaluation**: Evaluate the healthiness of the meal in one paragraph.
-
-6. **Disclaimer**: 
-The nutritional information and calorie estimates provided are approximate and are based on general food data. 
-Actual values may vary depending on factors such as portion size, specific ingredients, preparation methods, and individual variations. 
-For precise dietary advice or medical guidance, consult a qualified nutritionist or healthcare provider."""
+        except Exception as e:
+            logger.error(f"Error in analyze_image: {str(e)}")
+            raise Exception(f"Failed to analyze nutrition: {str(e)}")
 
+    @staticmethod
+    @traced("tool.nutrient_analysis")
+    async def analyze_image_async(image_input: Union[str, ImageHandle]):
+        """
+        Async variant of ``analyze_image_direct``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Same as ``analyze_image_direct``.
+        """
+        if nutrient_db_enabled():
+            return _nutrient_report(await NutrientAnalysisTool.analyze_nutrients_async(image_input))
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Analyzing nutrition from image: {image}")
             logger.info("Sending nutrition analysis request to Gemini...")
             
-            # Generate response
-            response = model.generate_content([prompt, img])
+            text = await generate_vision_text_async(NUTRITION_PROMPT, image)
             
             logger.info("✓ Nutrition analysis completed")
-            return response.text
+            return _with_disclaimer(text)
             
         except Exception as e:
             logger.error(f"Error in analyze_image: {str(e)}")
             raise Exception(f"Failed to analyze nutrition: {str(e)}")
 
-    @tool("Analyze nutritional values and calories of the dish from uploaded image")
+    @staticmethod
+    @traced("tool.nutrient_portions")
+    def analyze_nutrients_direct(image_input: Union[str, ImageHandle]) -> NutrientAnalysisOutput:
+        """
+        Ask Gemini only for the dish and per-food portion weights, then compute
+        calories and nutrients from the local nutrient table.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Validated nutrient analysis.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Estimating portions from image: {image}")
+            
+            text = generate_vision_text(PORTION_PROMPT, image, generation_config=PORTION_GENERATION_CONFIG)
+            with span("parse"):
+                portions = PortionAnalysisOutput.model_validate_json(text)
+            result = _nutrients_from_portions(portions)
+            
+            logger.info(f"✓ Nutrition analysis completed from {len(portions.items)} portions")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_nutrients: {str(e)}")
+            raise Exception(f"Failed to analyze nutrition: {str(e)}")
+
+    @staticmethod
+    @traced("tool.nutrient_portions")
+    async def analyze_nutrients_async(image_input: Union[str, ImageHandle]) -> NutrientAnalysisOutput:
+        """
+        Async variant of ``analyze_nutrients_direct``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Validated nutrient analysis.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Estimating portions from image: {image}")
+            
+            text = await generate_vision_text_async(PORTION_PROMPT, image, generation_config=PORTION_GENERATION_CONFIG)
+            with span("parse"):
+                portions = PortionAnalysisOutput.model_validate_json(text)
+            result = _nutrients_from_portions(portions)
+            
+            logger.info(f"✓ Nutrition analysis completed from {len(portions.items)} portions")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_nutrients: {str(e)}")
+            raise Exception(f"Failed to analyze nutrition: {str(e)}")
+
+    @staticmethod
+    @traced("tool.nutrient_analysis")
+    def analyze_image_stream(image_input: Union[str, ImageHandle]) -> Iterator[str]:
+        """
+        Streaming variant of ``analyze_image_direct`` that yields partial text.
+        Always the model's free-text report; use ``analyze_nutrients_*`` for table-based totals.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Generator of nutrition report text chunks.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Streaming nutrition analysis for image: {image}")
+            yield from stream_vision_text(NUTRITION_PROMPT, image)
+            yield "\n\n" + prompts.NUTRITION_DISCLAIMER
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_image: {str(e)}")
+            raise Exception(f"Failed to analyze nutrition: {str(e)}")
+
+    @staticmethod
+    @traced("tool.nutrient_analysis")
+    async def analyze_image_stream_async(image_input: Union[str, ImageHandle]) -> AsyncIterator[str]:
+        """
+        Async variant of ``analyze_image_stream``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Async generator of nutrition report text chunks.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Streaming nutrition analysis for image: {image}")
+            async for chunk in stream_vision_text_async(NUTRITION_PROMPT, image):
+                yield chunk
+            yield "\n\n" + prompts.NUTRITION_DISCLAIMER
+                
+        except Exception as e:
+            logger.error(f"Error in analyze_image: {str(e)}")
+            raise Exception(f"Failed to analyze nutrition: {str(e)}")
+
+    @lazy_tool("Analyze nutritional values and calories of the dish from uploaded image")
     def analyze_image(image_input: str):
         """
         Provide a detailed nutrient breakdown and estimate the total calories using Google Gemini Vision.
@@ -294,4 +837,73 @@ For precise dietary advice or medical guidance, consult a qualified nutritionist
         :param image_input: The image file path (local) or URL (remote).
         :return: A string with nutrient breakdown and estimated calorie information.
         """
-        return NutrientAnalysisTool.analyze_image_direct(image_input)
\ No newline at end of file
+        return NutrientAnalysisTool.analyze_image_direct(image_input)
+
+
+class CombinedAnalysisTool():
+    @staticmethod
+    def _from_portions(text: str) -> CombinedAnalysisOutput:
+        with span("parse"):
+            combined = CombinedPortionOutput.model_validate_json(text)
+        return CombinedAnalysisOutput(ingredients=combined.ingredients,
+                                      analysis=_nutrients_from_portions(combined.portions))
+
+    @staticmethod
+    @traced("tool.combined_analysis")
+    def analyze_combined_direct(image_input: Union[str, ImageHandle]) -> CombinedAnalysisOutput:
+        """
+        Extract ingredients and analyze nutrition with a single Gemini call
+        that returns JSON matching ``CombinedAnalysisOutput``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Validated ingredients and nutrient analysis.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Running combined analysis on image: {image}")
+            
+            if nutrient_db_enabled():
+                text = generate_vision_text(COMBINED_PORTION_PROMPT, image,
+                                            generation_config=COMBINED_PORTION_GENERATION_CONFIG)
+                result = CombinedAnalysisTool._from_portions(text)
+            else:
+                text = generate_vision_text(COMBINED_PROMPT, image, generation_config=COMBINED_GENERATION_CONFIG)
+                with span("parse"):
+                    result = CombinedAnalysisOutput.model_validate_json(text)
+            
+            logger.info(f"✓ Combined analysis completed with {len(result.ingredients)} ingredients")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_combined: {str(e)}")
+            raise Exception(f"Failed to analyze image: {str(e)}")
+
+    @staticmethod
+    @traced("tool.combined_analysis")
+    async def analyze_combined_async(image_input: Union[str, ImageHandle]) -> CombinedAnalysisOutput:
+        """
+        Async variant of ``analyze_combined_direct``.
+        
+        :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+        :return: Validated ingredients and nutrient analysis.
+        """
+        try:
+            image = ImageHandle.from_input(image_input)
+            logger.info(f"Running combined analysis on image: {image}")
+            
+            if nutrient_db_enabled():
+                text = await generate_vision_text_async(COMBINED_PORTION_PROMPT, image,
+                                                        generation_config=COMBINED_PORTION_GENERATION_CONFIG)
+                result = CombinedAnalysisTool._from_portions(text)
+            else:
+                text = await generate_vision_text_async(COMBINED_PROMPT, image,
+                                                        generation_config=COMBINED_GENERATION_CONFIG)
+                with span("parse"):
+                    result = CombinedAnalysisOutput.model_validate_json(text)
+            
+            logger.info(f"✓ Combined analysis completed with {len(result.ingredients)} ingredients")
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error in analyze_combined: {str(e)}")
+            raise Exception(f"Failed to analyze image: {str(e)}")
\ No newline at end of file
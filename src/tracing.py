@@ -0,0 +1,392 @@
+import os
+import time
+import inspect
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from src.cache import env_flag
+from src.settings import lazy_singleton
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans from sub-millisecond parsing up to slow generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _render_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0]
+                self._series[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Upper bucket bound containing the q-th observation, like ``histogram_quantile`` without interpolation."""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            if series is None or series[2] == 0:
+                return None
+            target = q * series[2]
+            for bound, count in zip(self.buckets, series[0]):
+                if count >= target:
+                    return bound
+            return float("inf")
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_render_labels(key, ('le', repr(bound)))} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_render_labels(key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_render_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_render_labels(key)} {count}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = dict(self._values)
+        lines.extend(f"{self.name}{_render_labels(key)} {value}" for key, value in sorted(values.items()))
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric exported on the metrics endpoint."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram("nourishbot_stage_duration_seconds", "Duration of each request stage in seconds.")
+STAGE_ERRORS = metrics.counter("nourishbot_stage_errors_total", "Stages that ended with an exception.")
+GEMINI_TOKENS = metrics.counter("nourishbot_gemini_tokens_total", "Tokens reported by Gemini, by model and direction.")
+
+
+@lazy_singleton
+def _otel_tracer():
+    if not env_flag("ENABLE_OTEL"):
+        return None
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning("ENABLE_OTEL is set but opentelemetry is not installed; exporting metrics only")
+        return None
+    logger.info("✓ OpenTelemetry spans enabled")
+    return trace.get_tracer("nourishbot")
+
+
+class Span:
+    """A timed stage. Attributes are attached to the OpenTelemetry span and the request summary."""
+
+    __slots__ = ("name", "labels", "attributes", "start", "duration", "_otel")
+
+    def __init__(self, name: str, labels: Dict[str, Any], attributes: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self._otel = None
+
+    def set_attribute(self, name: str, value: Any):
+        self.attributes[name] = value
+        if self._otel is not None:
+            self._otel.set_attribute(name, value)
+
+
+class Trace:
+    """Every span finished while handling one request, for the per-request log line."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: List[Span] = []
+        self.tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add_tokens(self, **counts: int):
+        with self._lock:
+            for direction, count in counts.items():
+                self.tokens[direction] = self.tokens.get(direction, 0) + count
+
+    def summary(self) -> str:
+        # Sum repeated stages (e.g. two Gemini calls) and keep first-seen order
+        totals: Dict[str, float] = {}
+        for span in self.spans:
+            totals[span.name] = totals.get(span.name, 0.0) + (span.duration or 0.0)
+        summary = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in totals.items())
+        if self.tokens:
+            summary += "; tokens " + ", ".join(f"{direction}={count}" for direction, count in self.tokens.items())
+        return summary
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("nourishbot_trace", default=None)
+_current_span: ContextVar[Optional[Span]] = ContextVar("nourishbot_span", default=None)
+
+
+def _reset(var: ContextVar, token):
+    try:
+        var.reset(token)
+    except ValueError:
+        # A generator closed from another context (e.g. by the garbage collector)
+        pass
+
+
+@contextmanager
+def span(name: str, labels: Optional[Dict[str, Any]] = None, **attributes) -> Iterator[Span]:
+    """
+    Time a stage and record it in ``nourishbot_stage_duration_seconds``.
+
+    Works around blocking and awaited code alike. Spans nest through a context
+    variable, so stages run via ``asyncio.to_thread`` still join the request.
+
+    :param name: Stage name, used as the ``stage`` label.
+    :param labels: Extra low-cardinality metric labels (e.g. model).
+    :param attributes: Free-form attributes for OpenTelemetry and the span object.
+    """
+    current = Span(name, labels or {}, attributes)
+    otel_context = None
+    tracer = _otel_tracer()
+    if tracer is not None:
+        otel_context = tracer.start_as_current_span(name, attributes={**current.labels, **attributes})
+        current._otel = otel_context.__enter__()
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = e
+        STAGE_ERRORS.inc(stage=name, **current.labels)
+        raise
+    finally:
+        _reset(_current_span, token)
+        current.duration = time.perf_counter() - current.start
+        STAGE_SECONDS.observe(current.duration, stage=name, **current.labels)
+        request_trace = _current_trace.get()
+        if request_trace is not None:
+            request_trace.spans.append(current)
+        if otel_context is not None:
+            if error is not None:
+                current._otel.record_exception(error)
+            otel_context.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+        logger.debug(f"⏱ {name}: {current.duration * 1000:.1f}ms")
+
+
+@contextmanager
+def trace_request(name: str, labels: Optional[Dict[str, Any]] = None, **attributes) -> Iterator[Span]:
+    """
+    Root span for one request; logs a per-stage breakdown when it finishes.
+
+    :param name: Stage name for the whole request.
+    :param labels: Extra metric labels (e.g. workflow).
+    """
+    request_trace = Trace(name)
+    token = _current_trace.set(request_trace)
+    try:
+        with span(name, labels, **attributes) as root:
+            yield root
+    finally:
+        _reset(_current_trace, token)
+        logger.info(f"✓ Trace {name}: {request_trace.summary()}")
+
+
+def record_stage(name: str, seconds: float, labels: Optional[Dict[str, Any]] = None):
+    """
+    Record a stage timed elsewhere (e.g. by a framework callback) as if it were a span.
+
+    :param name: Stage name.
+    :param seconds: Measured duration.
+    :param labels: Extra metric labels.
+    """
+    STAGE_SECONDS.observe(seconds, stage=name, **(labels or {}))
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        finished = Span(name, labels or {}, {})
+        finished.duration = seconds
+        request_trace.spans.append(finished)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record_tokens(model_name: Optional[str], response):
+    """
+    Count input/output tokens from a Gemini response's ``usage_metadata``,
+    attach them to the current span and add them to the request's totals.
+
+    :param model_name: Model that produced the response.
+    :param response: Gemini response or final streamed chunk.
+    """
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    # Part of the input served from a context cache (billed at the cached rate)
+    cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+    GEMINI_TOKENS.inc(input_tokens, model=model_name, direction="input")
+    GEMINI_TOKENS.inc(output_tokens, model=model_name, direction="output")
+    if cached_tokens:
+        GEMINI_TOKENS.inc(cached_tokens, model=model_name, direction="cached")
+    active = current_span()
+    if active is not None:
+        active.set_attribute("input_tokens", input_tokens)
+        active.set_attribute("output_tokens", output_tokens)
+        active.set_attribute("cached_tokens", cached_tokens)
+    request_trace = _current_trace.get()
+    if request_trace is not None:
+        request_trace.add_tokens(input=input_tokens, cached=cached_tokens, output=output_tokens)
+    logger.info(f"✓ Gemini tokens ({model_name}): input {input_tokens} ({cached_tokens} cached), "
+                f"output {output_tokens}")
+
+
+def traced(name: str, **labels):
+    """
+    Decorator form of ``span`` for functions, coroutines and (async) generators.
+    Generators are timed from the first item until they are exhausted or closed.
+
+    :param name: Stage name.
+    :param labels: Extra metric labels.
+    """
+    def decorator(func):
+        if inspect.isasyncgenfunction(func):
+            @functools.wraps(func)
+            async def async_gen_wrapper(*args, **kwargs):
+                with span(name, labels):
+                    async for item in func(*args, **kwargs):
+                        yield item
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def gen_wrapper(*args, **kwargs):
+                with span(name, labels):
+                    yield from func(*args, **kwargs)
+            return gen_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of the application log
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: Optional[str] = None) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve ``/metrics`` in the Prometheus text format from a daemon thread.
+
+    :param port: Port to listen on. Defaults to METRICS_PORT; nothing is started if unset.
+    :param host: Interface to bind. Defaults to METRICS_HOST or 127.0.0.1.
+    :return: The running server, or None if metrics are disabled.
+    """
+    global _metrics_server
+    port = port if port is not None else int(os.getenv("METRICS_PORT", 0))
+    if not port:
+        return None
+    host = host or os.getenv("METRICS_HOST", "127.0.0.1")
+    with _metrics_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, name="metrics-server", daemon=True).start()
+            logger.info(f"✓ Metrics available at http://{host}:{port}/metrics")
+    return _metrics_server
@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+from src.image_handle import ImageHandle
+from src.tools import (
+    ExtractIngredientsTool,
+    FilterIngredientsTool,
+    DietaryFilterTool,
+    NutrientAnalysisTool,
+    CombinedAnalysisTool,
+    StreamingIngredientFilter,
+    nutrient_db_enabled
+)
+from src.models import NutrientAnalysisOutput
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FullWorkflowResult:
+    """Outcome of the combined recipe + analysis workflow."""
+    ingredients: List[str] = field(default_factory=list)
+    analysis: Optional[str] = None
+    analysis_data: Optional[NutrientAnalysisOutput] = None
+    timings: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+
+
+async def _extraction_branch(image: ImageHandle, dietary_restrictions: Optional[str], result: FullWorkflowResult):
+    start = time.perf_counter()
+    # Ingredients are parsed and checked against the diet rules line by line as they stream in
+    ingredient_filter = StreamingIngredientFilter(dietary_restrictions)
+    async for chunk in ExtractIngredientsTool.extract_ingredient_stream_async(image):
+        await ingredient_filter.feed_async(chunk)
+    result.timings["extraction"] = time.perf_counter() - start
+
+    filter_start = time.perf_counter()
+    result.ingredients = await ingredient_filter.finish_async()
+    if dietary_restrictions:
+        result.timings["dietary_filter"] = time.perf_counter() - filter_start
+    result.timings["extraction_branch"] = time.perf_counter() - start
+
+
+async def _analysis_branch(image: ImageHandle, result: FullWorkflowResult):
+    start = time.perf_counter()
+    if nutrient_db_enabled():
+        result.analysis_data = await NutrientAnalysisTool.analyze_nutrients_async(image)
+    else:
+        result.analysis = await NutrientAnalysisTool.analyze_image_async(image)
+    result.timings["analysis_branch"] = time.perf_counter() - start
+
+
+async def _run_combined(image: ImageHandle, dietary_restrictions: Optional[str]) -> FullWorkflowResult:
+    result = FullWorkflowResult()
+    start = time.perf_counter()
+
+    combined = await CombinedAnalysisTool.analyze_combined_async(image)
+    ingredients = FilterIngredientsTool.filter_ingredients_direct("\n".join(combined.ingredients))
+    result.analysis_data = combined.analysis
+    result.timings["combined_analysis"] = time.perf_counter() - start
+
+    if dietary_restrictions:
+        filter_start = time.perf_counter()
+        ingredients = await DietaryFilterTool.filter_based_on_restrictions_async(ingredients, dietary_restrictions)
+        result.timings["dietary_filter"] = time.perf_counter() - filter_start
+
+    result.ingredients = ingredients
+    result.timings["total"] = time.perf_counter() - start
+    logger.info("✓ Full workflow completed: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in result.timings.items()))
+    return result
+
+
+async def run_full_workflow(image_input: Union[str, ImageHandle], dietary_restrictions: Optional[str] = None,
+                            mode: Optional[str] = None) -> FullWorkflowResult:
+    """
+    Produce ingredients and a nutrient analysis for one image.
+
+    In ``combined`` mode a single Gemini call returns both as structured JSON.
+    In ``parallel`` mode ingredient extraction (plus dietary filtering) and the
+    free-text nutrient analysis run concurrently against the same decoded
+    image, so wall-clock time is roughly the slower branch.
+
+    :param image_input: The image file path (local), URL (remote), bytes, PIL image or ImageHandle.
+    :param dietary_restrictions: Dietary restrictions applied to the ingredients.
+    :param mode: ``combined`` or ``parallel``. Defaults to FULL_WORKFLOW_MODE.
+    :return: Ingredients, analysis, per-stage timings and any branch errors.
+    """
+    image = ImageHandle.from_input(image_input)
+    mode = mode or os.getenv("FULL_WORKFLOW_MODE", "combined")
+    if mode == "combined":
+        return await _run_combined(image, dietary_restrictions)
+    if mode != "parallel":
+        raise ValueError(f"Unknown full workflow mode: {mode}")
+
+    result = FullWorkflowResult()
+    start = time.perf_counter()
+
+    outcomes = await asyncio.gather(
+        _extraction_branch(image, dietary_restrictions, result),
+        _analysis_branch(image, result),
+        return_exceptions=True
+    )
+    for branch, outcome in zip(("extraction", "analysis"), outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Full workflow {branch} branch failed: {str(outcome)}")
+            result.errors[branch] = str(outcome)
+
+    result.timings["total"] = time.perf_counter() - start
+    if len(result.errors) == 2:
+        raise Exception(f"Failed to process image: {result.errors['extraction']}")
+
+    logger.info("✓ Full workflow completed: " + ", ".join(f"{name}={seconds:.2f}s" for name, seconds in result.timings.items()))
+    return result
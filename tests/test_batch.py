@@ -0,0 +1,25 @@
+import pytest
+from google.api_core import exceptions as google_exceptions
+from src import batch
+
+
+def failing(error):
+    def process_image(source, workflow, dietary_restrictions):
+        try:
+            raise error
+        except Exception as e:
+            # The tools re-raise Gemini errors like this
+            raise Exception(f"Failed to analyze image: {str(e)}")
+    return process_image
+
+
+@pytest.mark.parametrize("error, attempts", [
+    (google_exceptions.ServiceUnavailable("503"), 3),
+    # Already retried by the Gemini client, so not retried again per image
+    (google_exceptions.ResourceExhausted("quota"), 1),
+])
+def test_rate_limits_are_not_retried_again(monkeypatch, error, attempts):
+    monkeypatch.setattr(batch, "process_image", failing(error))
+    result = batch._process_with_retries("food.jpg", "analysis", None, batch.Throttle(), max_retries=2,
+                                         backoff_seconds=0)
+    assert (result.status, result.attempts) == ("error", attempts)
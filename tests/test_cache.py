@@ -0,0 +1,54 @@
+import time
+from PIL import Image
+from src.cache import MemoryCache, ResultCache, image_digest, make_cache_key, make_verdict_key
+
+
+def test_keys_change_with_every_part():
+    key = make_cache_key("image", "prompt", "model")
+    assert key == make_cache_key("image", "prompt", "model")
+    assert len({key, make_cache_key("other", "prompt", "model"), make_cache_key("image", "other", "model"),
+                make_cache_key("image", "prompt", "other"), make_cache_key("image", "prompt", None)}) == 5
+    assert make_verdict_key("honey", "vegan") == "verdict:vegan:honey"
+
+
+def test_image_digest_depends_on_pixels_only():
+    red = Image.new("RGB", (8, 8), (255, 0, 0))
+    assert image_digest(red) == image_digest(red.copy())
+    assert image_digest(red) != image_digest(Image.new("RGB", (8, 8), (254, 0, 0)))
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.evictions == 1
+
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(ttl_seconds=0.05)
+    cache.set("a", 1)
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResultCache(enabled=False)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_disk_hits_survive_a_restart_and_are_promoted(tmp_path):
+    path = str(tmp_path / "results.db")
+    ResultCache(db_path=path).set("a", {"ingredients": ["egg"]})
+
+    cache = ResultCache(db_path=path)
+    assert cache.get("a") == {"ingredients": ["egg"]}
+    assert cache.get("a") == {"ingredients": ["egg"]}
+    assert cache.get("b") is None
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 1)
+    assert stats["hit_ratio"] == round(2 / 3, 4)
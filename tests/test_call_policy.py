@@ -0,0 +1,145 @@
+import asyncio
+import time
+import pytest
+from google.api_core import exceptions as google_exceptions
+from src.call_policy import CallPolicy
+
+
+def policy(**kwargs):
+    kwargs.setdefault("backoff_seconds", 0)
+    return CallPolicy(**kwargs)
+
+
+class Script:
+    """Attempt function answering from a list of results per model; exceptions are raised."""
+
+    def __init__(self, **results):
+        self.results = {name: list(outcomes) for name, outcomes in results.items()}
+        self.calls = []
+
+    def __call__(self, model_name, model, timeout):
+        self.calls.append((model_name, timeout))
+        outcome = self.results[model_name].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    async def run_async(self, model_name, model, timeout):
+        return self(model_name, model, timeout)
+
+
+def fallbacks(*names):
+    return lambda: [(name, None) for name in names]
+
+
+def test_transient_errors_are_retried_on_the_same_model():
+    attempt = Script(primary=[google_exceptions.ServiceUnavailable("503"), "ok"])
+    call_policy = policy(max_retries=2)
+    assert call_policy.call(attempt, ("primary", None), fallbacks("backup")) == "ok"
+    assert [name for name, _ in attempt.calls] == ["primary", "primary"]
+    assert call_policy.stats()["rescued_by_retry"] == 1
+
+
+def test_model_errors_fall_back_without_retrying():
+    attempt = Script(primary=[google_exceptions.NotFound("model retired")], backup=["ok"])
+    call_policy = policy(max_retries=2)
+    assert call_policy.call(attempt, ("primary", None), fallbacks("backup")) == "ok"
+    assert [name for name, _ in attempt.calls] == ["primary", "backup"]
+    assert call_policy.stats()["rescued_by_fallback"] == 1
+
+
+def test_other_errors_are_raised_straight_away():
+    attempt = Script(primary=[google_exceptions.InvalidArgument("bad request")])
+    with pytest.raises(google_exceptions.InvalidArgument):
+        policy().call(attempt, ("primary", None), fallbacks("backup"))
+    assert len(attempt.calls) == 1
+
+
+def test_fallbacks_are_limited():
+    error = google_exceptions.NotFound("missing")
+    attempt = Script(primary=[error], first=[error], second=[error], third=["ok"])
+    with pytest.raises(google_exceptions.NotFound):
+        policy(max_fallbacks=2).call(attempt, ("primary", None), fallbacks("first", "second", "third"))
+    assert [name for name, _ in attempt.calls] == ["primary", "first", "second"]
+
+
+def test_deadline_bounds_the_whole_call():
+    def slow_failure(model_name, model, timeout):
+        time.sleep(min(timeout, 0.1))
+        raise google_exceptions.ServiceUnavailable("503")
+
+    call_policy = policy(timeout_seconds=0.1, deadline_seconds=0.25, max_retries=10)
+    start = time.monotonic()
+    with pytest.raises(google_exceptions.ServiceUnavailable):
+        call_policy.call(slow_failure, ("primary", None), fallbacks("backup"))
+    assert time.monotonic() - start < 0.4
+    assert call_policy.stats()["deadline_exceeded"] == 1
+
+
+def test_attempts_get_no_more_than_the_time_left():
+    attempt = Script(primary=[google_exceptions.ServiceUnavailable("503"), "ok"])
+    policy(timeout_seconds=60, deadline_seconds=5).call(attempt, ("primary", None), fallbacks())
+    assert all(timeout <= 5 for _, timeout in attempt.calls)
+
+
+def test_async_calls_follow_the_same_policy():
+    attempt = Script(primary=[asyncio.TimeoutError(), google_exceptions.PermissionDenied("no access")],
+                     backup=["ok"])
+    call_policy = policy(max_retries=1)
+    result = asyncio.run(call_policy.call_async(attempt.run_async, ("primary", None), fallbacks("backup")))
+    assert result == "ok"
+    assert [name for name, _ in attempt.calls] == ["primary", "primary", "backup"]
+    assert call_policy.stats()["timeouts"] == 1
+
+
+def test_hedge_wins_when_the_first_attempt_is_slow():
+    calls = []
+
+    def attempt(model_name, model, timeout):
+        calls.append(model_name)
+        time.sleep(0.5 if len(calls) == 1 else 0.01)
+        return len(calls)
+
+    call_policy = policy(hedge_enabled=True, hedge_min_samples=1)
+    call_policy.latencies.record("primary", 0.02)
+    assert call_policy.call(attempt, ("primary", None), fallbacks()) == 2
+    assert call_policy.stats()["hedge_wins"] == 1
+
+
+def test_cancelling_a_hedged_call_cancels_its_attempts():
+    started, cancelled = [], []
+
+    async def attempt(model_name, model, timeout):
+        started.append(model_name)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(model_name)
+            raise
+
+    async def main():
+        call_policy = policy(hedge_enabled=True, hedge_min_samples=1)
+        call_policy.latencies.record("primary", 5.0)
+        call = asyncio.ensure_future(call_policy.call_async(attempt, ("primary", None), fallbacks()))
+        # Cancel before the hedge delay passes, while only the first attempt is running
+        await asyncio.sleep(0.05)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+        await asyncio.sleep(0)
+        # Checked before asyncio.run tears down whatever is left on the loop
+        assert started == cancelled == ["primary"]
+
+    asyncio.run(main())
+
+
+def test_async_attempts_are_cancelled_at_their_timeout():
+    async def stuck(model_name, model, timeout):
+        await asyncio.sleep(10)
+
+    call_policy = policy(timeout_seconds=0.1, deadline_seconds=0.25, max_retries=10)
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(call_policy.call_async(stuck, ("primary", None), fallbacks()))
+    assert time.monotonic() - start < 0.5
+    assert call_policy.stats()["deadline_exceeded"] == 1
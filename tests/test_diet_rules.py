@@ -0,0 +1,98 @@
+import pytest
+from src.diet_rules import DietRulesEngine
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return DietRulesEngine.from_yaml()
+
+
+@pytest.mark.parametrize("ingredient, diet, expected", [
+    # Plain foods are decided locally
+    ("2 large eggs", "vegan", False),
+    ("chicken breast", "vegetarian", False),
+    ("fresh baby spinach leaves", "vegan", True),
+    ("whole milk", "dairy-free", False),
+    ("almond milk", "dairy-free", True),
+    ("vegan cheese", "vegan", True),
+    ("honey", "vegan", False),
+    ("garlic butter", "vegan", False),
+    # Milk chocolate carries dairy; chocolate in general is left to the model
+    ("milk chocolate", "vegan", False),
+    ("milk chocolate", "dairy-free", False),
+    ("dark chocolate", "dairy-free", None),
+    # Prepared foods: what they always contain is certain, the rest is unknown
+    ("cake", "gluten-free", False),
+    ("cake", "vegan", None),
+    ("cookies", "egg-free", None),
+    ("pastry", "dairy-free", None),
+    ("doughnut", "vegan", None),
+    ("muffin", "egg-free", None),
+    ("pancakes", "vegan", None),
+    ("waffle", "dairy-free", None),
+    ("croissant", "vegan", None),
+    ("naan", "vegan", None),
+    ("cheesecake", "gluten-free", False),
+    ("cheesecake", "vegan", None),
+    ("rice cakes", "gluten-free", True),
+    # Dishes named after their base are not the base itself
+    ("lasagna", "gluten-free", False),
+    ("lasagna", "vegan", None),
+    ("lasagna", "dairy-free", None),
+    ("fried rice", "vegan", None),
+    ("fried rice", "egg-free", None),
+    ("chili", "vegan", None),
+    ("chili", "vegetarian", None),
+    ("chili peppers", "vegan", True),
+    ("rice", "egg-free", True),
+    # Cooking words that make a dish keep only the certain verdicts
+    ("fried chicken", "vegan", False),
+    ("fried chicken", "gluten-free", None),
+    ("mashed potatoes", "dairy-free", None),
+    ("fried egg", "vegan", False),
+    # Names inside other names are not the food itself
+    ("honeydew", "vegan", True),
+    ("butternut", "dairy-free", True),
+    ("cocoa butter", "dairy-free", True),
+    ("beef tomatoes", "vegan", True),
+    ("buckwheat flour", "gluten-free", True),
+    # Only the head noun is certain; other names may just describe it
+    ("butter lettuce", "vegan", None),
+    ("butter beans", "dairy-free", None),
+    # Unknown head nouns are left to the model
+    ("cheese pizza", "gluten-free", None),
+    ("dragon fruit", "vegan", None),
+    # Real words are not spelling mistakes for a known name ("custard" is not "mustard")
+    ("custard", "vegan", None),
+    ("custard", "egg-free", None),
+])
+def test_check(rules, ingredient, diet, expected):
+    assert rules.check(ingredient, [diet]) is expected
+
+
+def test_compound_words_split_into_known_names_only():
+    rules = DietRulesEngine(
+        diets={"vegan": {"forbids": ["dairy", "honey"]}},
+        modifiers={},
+        ingredients=[
+            {"names": ["honey"], "attributes": ["honey"]},
+            {"names": ["butter"], "attributes": ["dairy"]},
+            {"names": ["cheese"], "attributes": ["dairy"]},
+            {"names": ["cake"], "attributes": [], "composite": True},
+        ],
+    )
+    assert rules.check("honeydew", ["vegan"]) is None
+    assert rules.check("butternut", ["vegan"]) is None
+    assert rules.check("cheesecake", ["vegan"]) is None
+    assert rules.classify("cheesecake").possible == {"dairy"}
+
+
+def test_dish_words_are_part_of_the_key(rules):
+    assert rules.ingredient_key("fried rice") != rules.ingredient_key("rice")
+    assert rules.ingredient_key("fresh spinach") == rules.ingredient_key("spinach")
+
+
+def test_resolve_diets(rules):
+    assert rules.resolve_diets("Gluten free, vegan") == ["gluten-free", "vegan"]
+    assert rules.resolve_diets("") == []
+    assert rules.resolve_diets("low fodmap") is None
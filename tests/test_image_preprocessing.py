@@ -0,0 +1,58 @@
+from io import BytesIO
+import pytest
+from PIL import Image
+from src.image_handle import ImageHandle, _read_capped
+from src.image_preprocessing import ImagePreprocessor, get_image_preprocessor
+
+
+def encode(img, format, **kwargs):
+    buffer = BytesIO()
+    img.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def test_source_is_kept_when_re_encoding_is_larger():
+    # A small flat PNG compresses far better than any JPEG of it
+    original = encode(Image.new("RGB", (64, 64), (200, 40, 40)), "PNG")
+    prepared = ImagePreprocessor().preprocess(Image.open(BytesIO(original)), original=original)
+    assert (prepared.data, prepared.mime_type) == (original, "image/png")
+    assert prepared.bytes_saved == 0
+
+
+def test_resized_images_are_always_re_encoded():
+    original = encode(Image.new("RGB", (64, 64), (200, 40, 40)), "PNG")
+    prepared = ImagePreprocessor(max_side=32).preprocess(Image.open(BytesIO(original)), original=original)
+    assert prepared.mime_type == "image/jpeg"
+    assert prepared.size == (32, 32)
+
+
+def test_sources_with_exif_are_re_encoded():
+    exif = Image.Exif()
+    exif[0x010F] = "Camera maker"
+    original = encode(Image.new("RGB", (64, 64), (200, 40, 40)), "PNG", exif=exif)
+    prepared = ImagePreprocessor().preprocess(Image.open(BytesIO(original)), original=original)
+    assert prepared.mime_type == "image/jpeg"
+
+
+@pytest.fixture
+def one_mb_limit(monkeypatch):
+    monkeypatch.setenv("MAX_IMAGE_SIZE_MB", "1")
+    get_image_preprocessor.reset()
+    yield
+    get_image_preprocessor.reset()
+
+
+def test_oversized_files_are_rejected(tmp_path, one_mb_limit):
+    path = tmp_path / "large.png"
+    path.write_bytes(b"\0" * (2 * 1024 * 1024))
+    with pytest.raises(ValueError, match="larger than the 1 MB limit"):
+        ImageHandle(path=str(path)).raw_bytes
+
+
+def test_downloads_stop_at_the_limit(one_mb_limit):
+    def endless():
+        while True:
+            yield b"\0" * 64 * 1024
+
+    with pytest.raises(ValueError, match="at least 1.1 MB"):
+        _read_capped(endless())
@@ -0,0 +1,87 @@
+import pytest
+from src.ingredient_index import IngredientIndex, edit_distance
+
+ENTRIES = [
+    ("chicken_breast", ["chicken breast"]),
+    ("onion", ["onion", "red onion"]),
+    ("broccoli", ["broccoli"]),
+    ("spinach", ["spinach", "baby spinach"]),
+    ("milk", ["milk", "whole milk"]),
+    ("tomato", ["tomato"]),
+    ("berry", ["berry"]),
+]
+
+
+@pytest.fixture(scope="module")
+def index():
+    return IngredientIndex(ENTRIES)
+
+
+@pytest.mark.parametrize("ingredient, canonical_id, method", [
+    ("Chicken Breast", "chicken_breast", "exact"),
+    ("2 grilled chicken breasts", "chicken_breast", "phrase"),
+    ("breast of chicken", "chicken_breast", "tokens"),
+    ("red onions", "onion", "exact"),
+    ("tomatoes", "tomato", "exact"),
+    ("berries", "berry", "exact"),
+    ("brocoli", "broccoli", "fuzzy"),
+])
+def test_resolve(index, ingredient, canonical_id, method):
+    match = index.resolve(ingredient)
+    assert (match.canonical_id, match.method) == (canonical_id, method)
+
+
+def test_exact_names_are_certain_and_corrections_are_not(index):
+    assert index.resolve("whole milk").confidence == 1.0
+    assert 0.85 <= index.resolve("brocoli").confidence < 1.0
+
+
+def test_partial_names_score_low(index):
+    # "milk" covers only part of "soy milk", which is a different food
+    match = index.resolve("soy milk")
+    assert match.canonical_id == "milk"
+    assert match.confidence < 0.6
+
+
+def test_unknown_ingredients_do_not_resolve(index):
+    assert index.resolve("quinoa") is None
+
+
+def test_real_food_words_are_not_corrected():
+    index = IngredientIndex([("mustard", ["mustard"]), ("batter", ["batter"])])
+    assert index.resolve("custard") is None
+    assert index.resolve("custards") is None
+    assert index.resolve("mustrad").canonical_id == "mustard"
+    # Without the general vocabulary the one-letter difference is taken as a typo
+    assert IngredientIndex([("mustard", ["mustard"])], known_words=()).resolve("custard").canonical_id == "mustard"
+
+
+@pytest.mark.parametrize("token, candidate, edits", [
+    ("brocoli", "broccoli", 1),
+    ("tomatoe", "tomato", 1),
+    ("chedadr", "cheddar", 1),
+    ("mozarela", "mozzarella", 2),
+    ("salad", "salsa", 2),
+    ("pears", "peas", 1),
+])
+def test_edit_distance(token, candidate, edits):
+    assert edit_distance(token, candidate, limit=2) == edits
+
+
+def test_allowed_edits_grow_with_length():
+    index = IngredientIndex([("pear", ["pear"]), ("mustard", ["mustard"]), ("broccoli", ["broccoli"]),
+                             ("mozzarella", ["mozzarella"])], known_words=())
+    # Short words are not corrected at all; seven letters allow one edit, eight or more two
+    assert index.resolve("peach") is None
+    assert index.resolve("mustrad").canonical_id == "mustard"
+    assert index.resolve("mstrad") is None
+    assert index.resolve("brocoli").canonical_id == "broccoli"
+    assert index.resolve("brocolli").canonical_id == "broccoli"
+    assert index.resolve("mozarela").canonical_id == "mozzarella"
+    assert index.resolve("brcolly") is None
+
+
+def test_keys_ignore_descriptors_and_spelling(index):
+    assert index.key("Fresh Baby Spinach Leaves") == index.key("baby spinach")
+    assert index.key("brocoli") == index.key("broccoli")
+    assert index.key("quinoa") == "quinoa"
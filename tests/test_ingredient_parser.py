@@ -0,0 +1,65 @@
+import pytest
+from src.ingredient_parser import IngredientStreamParser, parse_ingredients, split_quantity
+
+MODEL_OUTPUT = """Ingredients:
+- **2 large eggs**
+- 1 cup cherry tomatoes, halved
+- salt and pepper, to taste
+* Vegetables: carrots, peas
+1. mac and cheese
+2. 200g chicken breast
+- Eggs
+"""
+
+
+def names(records):
+    return [record.name for record in records]
+
+
+def test_parse_list():
+    assert names(parse_ingredients(MODEL_OUTPUT)) == [
+        "large eggs", "cherry tomatoes", "salt", "pepper", "carrots", "peas", "mac and cheese",
+        "chicken breast", "eggs",
+    ]
+
+
+def test_descriptors_stay_with_their_ingredient():
+    [record] = parse_ingredients("- 1 cup cherry tomatoes, halved")
+    assert record.text == "1 cup cherry tomatoes, halved"
+    assert (record.quantity, record.unit) == (1.0, "cup")
+
+
+def test_compounds_are_kept_whole():
+    assert names(parse_ingredients("bread and butter", compounds={"bread and butter"})) == ["bread and butter"]
+    assert names(parse_ingredients("bread and butter", compounds=())) == ["bread", "butter"]
+
+
+def test_streamed_chunks_parse_like_the_whole_text():
+    parser = IngredientStreamParser()
+    records = []
+    for i in range(0, len(MODEL_OUTPUT), 7):
+        records.extend(parser.feed(MODEL_OUTPUT[i:i + 7]))
+    records.extend(parser.close())
+    assert records == parse_ingredients(MODEL_OUTPUT)
+
+
+def test_lines_are_emitted_when_their_newline_arrives():
+    parser = IngredientStreamParser()
+    assert names(parser.feed("- eggs\n- to")) == ["eggs"]
+    assert names(parser.feed("matoes\n")) == ["tomatoes"]
+    assert parser.close() == []
+
+
+@pytest.mark.parametrize("item, expected", [
+    ("200g chicken breast", ("chicken breast", 200.0, "g")),
+    ("2 cups of rice", ("rice", 2.0, "cups")),
+    ("1 1/2 tbsp olive oil", ("olive oil", 1.5, "tbsp")),
+    ("½ cup milk", ("milk", 0.5, "cup")),
+    ("3 eggs", ("eggs", 3.0, None)),
+    ("chicken breast (about 150 g)", ("chicken breast (about 150 g)", 150.0, "g")),
+    # Names starting with a digit are not quantities
+    ("7up", ("7up", None, None)),
+    ("2% milk", ("2% milk", None, None)),
+])
+def test_split_quantity(item, expected):
+    assert split_quantity(item) == expected
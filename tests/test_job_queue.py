@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import pytest
+from src.job_queue import JobQueue, QueueFullError
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def job(name, log, delay=0.01):
+    async def run():
+        log.append(name)
+        await asyncio.sleep(delay)
+        yield f"{name} in {request_id.get()}"
+    return run
+
+
+async def follow(queue, submitted):
+    updates = []
+    async for update in queue.stream(submitted):
+        updates.append(update.output if update.output is not None else update.position)
+    return updates
+
+
+def test_jobs_run_in_their_submitters_context():
+    async def submit_as(queue, name, log):
+        # Each submitter is its own task with its own context, like two Gradio events
+        request_id.set(name)
+        return await follow(queue, queue.submit(name, job(name, log)))
+
+    async def main():
+        queue = JobQueue(workers=1)
+        log = []
+        return await asyncio.gather(*(submit_as(queue, f"req-{i}", log) for i in range(1, 4)))
+
+    results = asyncio.run(main())
+    assert [updates[-1] for updates in results] == ["req-1 in req-1", "req-2 in req-2", "req-3 in req-3"]
+
+
+def test_users_are_served_round_robin():
+    async def main():
+        queue = JobQueue(workers=1)
+        log = []
+        jobs = [queue.submit("a", job(f"a{i}", log)) for i in range(3)]
+        jobs += [queue.submit("b", job("b0", log)), queue.submit("c", job("c0", log))]
+        await asyncio.gather(*(follow(queue, submitted) for submitted in jobs))
+        return log
+
+    assert asyncio.run(main()) == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_waiting_jobs_see_their_position():
+    async def main():
+        queue = JobQueue(workers=1)
+        log = []
+        first = queue.submit("a", job("a0", log))
+        second = queue.submit("b", job("b0", log))
+        return await asyncio.gather(follow(queue, first), follow(queue, second))
+
+    first, second = asyncio.run(main())
+    assert first == [1, "a0 in None"]
+    assert second == [2, 1, "b0 in None"]
+
+
+def test_admission_control():
+    async def main():
+        queue = JobQueue(workers=1, max_depth=3, max_per_user=2)
+        log = []
+        queue.submit("a", job("a0", log))
+        queue.submit("a", job("a1", log))
+        with pytest.raises(QueueFullError):
+            queue.submit("a", job("a2", log))
+        queue.submit("b", job("b0", log))
+        with pytest.raises(QueueFullError):
+            queue.submit("c", job("c0", log))
+
+    asyncio.run(main())
+
+
+def test_closing_the_stream_cancels_the_job():
+    async def main():
+        queue = JobQueue(workers=1)
+        log = []
+        running = queue.submit("a", job("long", log, delay=10))
+        queued = queue.submit("b", job("never", log))
+        consumers = [asyncio.create_task(follow(queue, submitted)) for submitted in (running, queued)]
+        await asyncio.sleep(0.05)
+        for consumer in consumers:
+            consumer.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        return log, running, queue.stats()
+
+    log, running, stats = asyncio.run(main())
+    assert log == ["long"]
+    assert running.task.cancelled()
+    assert stats == {"queued": 0, "running": 0, "users": 0}
@@ -0,0 +1,54 @@
+import pytest
+from src.models import PortionEstimate
+from src.nutrient_db import NutrientTable
+
+
+@pytest.fixture(scope="module")
+def table():
+    return NutrientTable.from_csv()
+
+
+@pytest.mark.parametrize("food, expected", [
+    ("eggs", "egg"),
+    ("2 grilled chicken breasts", "chicken breast"),
+    ("breast of chicken", "chicken breast"),
+    ("brocoli florets", "broccoli"),
+    ("red onions", "onion"),
+    ("2 ripe hass avocados", "avocado"),
+    ("black beans, rinsed", "black beans"),
+    ("almond milk", "almond milk"),
+])
+def test_match(table, food, expected):
+    assert table.match(food) == expected
+
+
+@pytest.mark.parametrize("food", [
+    # The name covers only part of the food, which is something else
+    "soy milk", "chocolate milk", "veggie burger", "jelly beans", "rice noodles",
+    "chicken soup", "apple pie", "milk chocolate",
+])
+def test_partial_names_are_not_in_the_table(table, food):
+    assert table.match(food) is None
+
+
+def test_real_words_are_not_corrected_onto_other_foods(table):
+    assert table.match("custard") is None
+    assert table.match("mustard") == "yellow mustard"
+
+
+def test_totals_leave_out_unmatched_foods(table):
+    totals = table.totals([PortionEstimate(name="whole milk", grams=200),
+                           PortionEstimate(name="soy milk", grams=200)])
+    assert totals.unmatched == ["soy milk"]
+    assert totals["kcal"] == pytest.approx(2 * table.column("kcal")[table.lookup("whole milk")])
+
+
+def test_tool_reports_table_totals_as_markdown_unless_json_is_asked_for(table, monkeypatch):
+    from src.tools import _nutrient_report
+    analysis = table.analyze([PortionEstimate(name="chicken breast", grams=150)], dish="Grilled chicken")
+    report = _nutrient_report(analysis)
+    assert report.startswith("1. **Identification**: Grilled chicken")
+    assert f"Total Calories: {analysis.estimated_calories}" in report
+    assert "**Disclaimer**" in report
+    monkeypatch.setenv("NUTRIENT_ANALYSIS_JSON", "true")
+    assert type(analysis).model_validate_json(_nutrient_report(analysis)) == analysis
@@ -0,0 +1,113 @@
+import asyncio
+import time
+import pytest
+from google.api_core import exceptions as google_exceptions
+from src.rate_limiter import (
+    BATCH_PRIORITY, INTERACTIVE_PRIORITY, QuotaScheduler, RateLimiter, TokenBucket, _parse_overrides,
+    estimate_tokens, is_rate_limit_error, retry_after,
+)
+
+
+class HTTPError(Exception):
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+@pytest.mark.parametrize("error, expected", [
+    (google_exceptions.ResourceExhausted("Resource has been exhausted"), True),
+    (google_exceptions.TooManyRequests("slow down"), True),
+    (google_exceptions.from_http_status(429, "slow down"), True),
+    (HTTPError("slow down", 429), True),
+    # Judged by type and status, not by words in the message
+    (ValueError("daily quota report failed with code 429"), False),
+    (google_exceptions.NotFound("quota project not found"), False),
+    (HTTPError("Too Many Requests", 500), False),
+])
+def test_is_rate_limit_error(error, expected):
+    assert is_rate_limit_error(error) is expected
+
+
+def test_retry_after_reads_the_servers_hint():
+    assert retry_after(google_exceptions.ResourceExhausted("Please retry in 12.5s")) == 12.5
+    assert retry_after(google_exceptions.ResourceExhausted("Quota exceeded")) is None
+
+
+def test_backoff_uses_the_hint_or_grows_exponentially():
+    scheduler = QuotaScheduler(default_backoff_seconds=2.0)
+    assert scheduler.backoff_for(google_exceptions.ResourceExhausted("retry in 3s"), attempt=2) == 3.0
+    assert scheduler.backoff_for(google_exceptions.ResourceExhausted("no hint"), attempt=2) == 8.0
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("x" * 40, {"max_output_tokens": 100}) == 111
+    assert estimate_tokens(["x" * 40, {"mime_type": "image/jpeg", "data": b""}]) == 11 + 258 + 512
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(per_minute=60)
+    now = bucket.updated
+    bucket.consume(60)
+    assert bucket.time_until(1, now) == pytest.approx(1.0)
+    assert bucket.time_until(1, now + 1.0) == pytest.approx(0.0)
+    # Requests larger than the bucket wait for a full bucket, not forever
+    assert bucket.time_until(120, now + 1.0) == pytest.approx(59.0)
+
+
+def test_usage_corrects_the_token_estimate():
+    limiter = RateLimiter("model", tokens_per_minute=1000)
+    limiter.acquire(300)
+    usage = type("Response", (), {"usage_metadata": type("Usage", (), {"total_token_count": 100})})
+    limiter.record_usage(300, usage)
+    assert limiter.tokens.tokens == pytest.approx(900, abs=1)
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def main():
+        # 600 RPM with an empty bucket: one grant every 0.1 s
+        limiter = RateLimiter("model", requests_per_minute=600)
+        limiter.requests.tokens = 0
+        granted = []
+
+        async def request(name, priority):
+            await limiter.acquire_async(priority=priority)
+            granted.append(name)
+
+        tasks = []
+        for name, priority in [("batch-1", BATCH_PRIORITY), ("batch-2", BATCH_PRIORITY),
+                               ("interactive", INTERACTIVE_PRIORITY)]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return granted
+
+    assert asyncio.run(main()) == ["interactive", "batch-1", "batch-2"]
+
+
+def test_back_off_pauses_every_grant():
+    limiter = RateLimiter("model")
+    limiter.back_off(0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+    assert limiter.stats()["rate_limited"] == 1
+
+
+def test_scheduler_applies_per_model_overrides():
+    scheduler = QuotaScheduler(requests_per_minute=10,
+                               overrides=_parse_overrides("gemini-pro=2:32000, broken"))
+    assert scheduler.limiter("gemini-pro").requests.capacity == 2
+    assert scheduler.limiter("gemini-pro").tokens.capacity == 32000
+    assert scheduler.limiter("gemini-flash").requests.capacity == 10
+    assert scheduler.limiter("gemini-flash").tokens is None
+    assert scheduler.limiter("gemini-pro") is scheduler.limiter("gemini-pro")
+
+
+def test_acquire_gives_up_its_place_after_the_timeout():
+    limiter = RateLimiter("model", requests_per_minute=60)
+    limiter.requests.tokens = 0
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        limiter.acquire(timeout=0.1)
+    assert time.monotonic() - start < 0.5
+    assert not limiter._waiters
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+import pytest
+
+pytest.importorskip("crewai")
+from src.task_graph import TaskGraph  # noqa: E402
+
+
+def task(name, *context):
+    return SimpleNamespace(name=name, context=list(context))
+
+
+def names(tasks):
+    return [t.name for t in tasks]
+
+
+def test_dependencies_come_before_their_dependents():
+    extract = task("extract")
+    dietary = task("dietary", extract)
+    nutrition = task("nutrition")
+    recipe = task("recipe", dietary, nutrition)
+    graph = TaskGraph.from_tasks([recipe, nutrition, dietary, extract])
+    order = names(graph.order)
+    assert order.index("extract") < order.index("dietary") < order.index("recipe")
+    assert order.index("nutrition") < order.index("recipe")
+    assert graph.depends_on(recipe) == [dietary, nutrition]
+
+
+def test_context_tasks_missing_from_the_list_are_added():
+    extract = task("extract")
+    graph = TaskGraph.from_tasks([task("dietary", extract)])
+    assert names(graph.order) == ["extract", "dietary"]
+
+
+def test_a_task_in_its_own_context_is_ignored():
+    extract = task("extract")
+    extract.context.append(extract)
+    assert names(TaskGraph.from_tasks([extract]).order) == ["extract"]
+
+
+def test_cycles_are_rejected():
+    first, second = task("first"), task("second")
+    first.context.append(second)
+    second.context.append(first)
+    with pytest.raises(ValueError, match="cycle"):
+        TaskGraph.from_tasks([first, second])
+
+
+def test_critical_path_is_the_longest_dependent_chain():
+    extract = task("extract")
+    dietary = task("dietary", extract)
+    nutrition = task("nutrition")
+    recipe = task("recipe", dietary, nutrition)
+    graph = TaskGraph.from_tasks([extract, dietary, nutrition, recipe])
+    durations = {id(extract): 1.0, id(dietary): 2.0, id(nutrition): 2.5, id(recipe): 0.5}
+    assert graph.critical_path(durations) == pytest.approx(3.5)